@@ -0,0 +1,68 @@
+"""
+日志调用开销微基准\n
+对比旧实现 (每次调用 inspect.stack() 取调用位置) 和当前实现 (logging stacklevel + 后台线程写文件)
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from inspect import getframeinfo, stack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+
+def legacy_info(msg, *args):
+    """ 旧版 Logger.info 的实现, 调用处用 f-string 格式化 """
+    caller = getframeinfo(stack()[1][0])
+    if '/' in caller.filename:
+        filename = caller.filename.split('/')[-1]
+    else:
+        filename = caller.filename.split('\\')[-1]
+    line_num = caller.lineno
+    log_prefix = f"-[{filename}:{line_num}] > "
+
+    logger.logger.info(log_prefix + str(msg % args))
+
+
+def measure(name, func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func("processing note: %s", i)
+    cost = (time.perf_counter() - start) / count * 1e6
+    print(f"{name:<24}{cost:>10.2f} us/call")
+    return cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description="logger per-call cost")
+    parser.add_argument('-n', '--count', type=int, default=20000)
+    args = parser.parse_args()
+
+    # 只测文件写入, 不输出到控制台
+    for handler in list(logger.logger.handlers):
+        if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+            logger.logger.removeHandler(handler)
+
+    logger.set_handler("file", background=False)
+    legacy = measure("legacy (stack)", legacy_info, args.count)
+    sync = measure("stacklevel", logger.info, args.count)
+    for handler in list(logger.logger.handlers):
+        logger.logger.removeHandler(handler)
+        handler.close()
+
+    logger.set_handler("file")
+    background = measure("stacklevel + queue", logger.info, args.count)
+    logger.stop()
+
+    logger.set_level(logging.INFO)
+    disabled = measure("disabled debug", logger.debug, args.count)
+    print(f"speedup: {legacy / sync:.1f}x sync, {legacy / background:.1f}x background")
+    return disabled
+
+
+if __name__ == "__main__":
+    main()
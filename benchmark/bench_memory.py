@@ -0,0 +1,99 @@
+"""
+发布流程内存基准测试\n
+按不同的笔记数生成合成仓库, 分别以常驻 (watch 模式) 和流式 (单次运行) 两种方式在冷缓存和热缓存下运行发布流程,
+每次运行在新的进程中执行, 输出 tracemalloc 统计的 python 峰值内存和进程峰值 rss\n
+常驻方式的峰值随仓库大小线性增长; 流式方式只保留链接图和元数据, 增长应该明显更慢
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tracemalloc
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import obsidian2hexo
+from util.profiler import get_peak_rss
+from bench_publish import get_settings
+from gen_vault import gen_vault, add_arguments
+
+VARIANTS = ('resident', 'streaming')
+
+
+def measure(settings, work_dir, jobs, streaming, queue):
+    """ 在子进程中运行一次发布 (不部署), 结果放入 queue """
+    # 缓存和报告都放在 get_full_relative_path 指向的目录下
+    sys.argv[0] = os.path.join(work_dir, 'obsidian2hexo.py')
+    tracemalloc.start()
+    publisher = obsidian2hexo.Publisher(settings, jobs, streaming=streaming)
+    try:
+        publisher.build()
+    finally:
+        publisher.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    queue.put({
+        'tracemalloc_peak': peak,
+        'peak_rss': get_peak_rss()[0],
+        'notes': obsidian2hexo.profiler.counters.get('notes', 0),
+        'shared_notes': obsidian2hexo.profiler.counters.get('shared_notes', 0),
+    })
+
+
+def run(settings, work_dir, jobs, streaming):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(settings, work_dir, jobs, streaming, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare peak memory of resident and streaming publish runs")
+    add_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--renderer', default='hexo', choices=['hexo', 'native'])
+    parser.add_argument('--scales', default='1,2,4', help="comma separated multiples of --notes")
+    parser.add_argument('--output', help="write all results to this json file")
+    args = parser.parse_args()
+    # 和 bench_publish 共用配置, 内存测试不优化图片
+    args.resource_link = 'auto'
+    args.image_optimize = False
+    args.targets = 1
+
+    base_vault = args.vault
+    base_notes = args.notes
+    results = []
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        args.notes = base_notes * scale
+        args.vault = f"{base_vault}_{args.notes}"
+        note_paths = gen_vault(args)
+        print(f"vault: {len(note_paths)} notes in {args.vault}")
+        for variant in VARIANTS:
+            work_dir = os.path.join(BENCH_DIR, 'work', f"{args.notes}_{variant}")
+            if os.path.exists(work_dir):
+                shutil.rmtree(work_dir)
+            os.makedirs(work_dir)
+            settings = get_settings(args, work_dir)
+            for cache in ('cold', 'warm'):
+                result = run(settings, work_dir, args.jobs, variant == 'streaming')
+                result.update({'variant': variant, 'cache': cache, 'vault_notes': args.notes})
+                results.append(result)
+
+    print(f"{'notes':>8}{'variant':>12}{'cache':>8}{'py peak MB':>14}{'peak rss MB':>14}")
+    for result in results:
+        print(f"{result['vault_notes']:>8}{result['variant']:>12}{result['cache']:>8}"
+              f"{result['tracemalloc_peak'] / 1024 / 1024:>14.1f}{(result['peak_rss'] or 0) / 1024 / 1024:>14.1f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,161 @@
+"""
+发布流程基准测试\n
+生成合成仓库后分别在冷缓存, 热缓存和少量修改三种情况下运行完整发布流程, 输出各阶段耗时和吞吐量\n
+部署的 hexo/git 命令被替换为空操作, 全程不需要网络
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import obsidian2hexo
+from util import deployer
+from util.exclude import ExcludeMatcher
+from gen_vault import gen_vault, add_arguments
+
+# 阶段 -> 统计吞吐量时使用的字节数
+THROUGHPUT = {
+    'parse': 'bytes_parsed',
+    'write': 'bytes_written',
+    'asset_sync': 'asset_bytes',
+}
+
+
+def stub_deploy():
+    """ 部署命令只记录不执行 """
+    orders = []
+
+    def run_command(order, cwd):
+        orders.append(order)
+        return []
+
+    deployer.run_command = run_command
+    return orders
+
+
+def get_settings(args, work_dir):
+    resource = os.path.join(args.vault, 'res')
+    settings = {
+        'path_from': args.vault,
+        'path_to': os.path.join(work_dir, 'hexo'),
+        'resource': resource,
+        'exclude': [resource],
+        'share_tag': args.share_tag,
+        'resource_link': args.resource_link,
+        'deploy_interval': 300,
+        'watch_debounce': 2,
+        'renderer': args.renderer,
+        'site_dir': os.path.join(work_dir, 'hexo', 'public'),
+        'template_dir': os.path.join(os.path.dirname(BENCH_DIR), 'template'),
+        'site_title': 'bench',
+        'site_url': 'http://localhost',
+        'image_optimize': args.image_optimize,
+        'image_widths': [640, 1280],
+        'image_formats': ['webp'],
+        'image_quality': 80,
+        'search': True,
+        'date_sources': ['front_matter', 'cache', 'git', 'filesystem'],
+    }
+    # 多个发布目标共用一次扫描和解析, 每个目标输出到单独的 hexo 目录
+    if args.targets > 1:
+        settings['targets'] = [obsidian2hexo.get_target(settings, f"target{i}", {'path_to': os.path.join(work_dir, f"hexo{i}")})
+                               for i in range(args.targets)]
+    return settings
+
+
+def run(name, settings, jobs):
+    profiler = obsidian2hexo.profiler
+    profiler.reset()
+    # 和命令行的单次运行一样流式生成
+    publisher = obsidian2hexo.Publisher(settings, jobs, streaming=True)
+    try:
+        publisher.prefetch()
+        publisher.build()
+        publisher.deploy()
+    finally:
+        publisher.close()
+    report = profiler.get_report(variant=name, jobs=jobs)
+    seconds = report['seconds']
+    counters = report['counters']
+    report['notes_per_sec'] = counters.get('notes', 0) / seconds if seconds else 0
+    throughput = {}
+    for stage, counter in THROUGHPUT.items():
+        cost = report['stages'].get(stage, {}).get('seconds')
+        if cost:
+            throughput[stage] = counters.get(counter, 0) / cost / 1024 / 1024
+    report['mb_per_sec'] = throughput
+    return report
+
+
+def print_reports(reports):
+    stages = []
+    for report in reports:
+        for stage in report['stages']:
+            if stage not in stages:
+                stages.append(stage)
+    print(f"{'stage':<28}" + ''.join(f"{report['variant']:>12}" for report in reports))
+    for stage in stages:
+        print(f"{stage:<28}" + ''.join(f"{report['stages'].get(stage, {}).get('seconds', 0):>12.3f}" for report in reports))
+    print(f"{'total':<28}" + ''.join(f"{report['seconds']:>12.3f}" for report in reports))
+    print(f"{'notes/sec':<28}" + ''.join(f"{report['notes_per_sec']:>12.0f}" for report in reports))
+    for stage in THROUGHPUT:
+        print(f"{stage + ' MB/sec':<28}" + ''.join(f"{report['mb_per_sec'].get(stage, 0):>12.1f}" for report in reports))
+    print(f"{'parsed notes':<28}" + ''.join(f"{report['counters'].get('notes_parsed', 0):>12}" for report in reports))
+    print(f"{'written posts':<28}" + ''.join(f"{report['counters'].get('posts_written', 0):>12}" for report in reports))
+    print(f"{'peak rss MB':<28}" + ''.join(f"{(report['peak_rss'] or 0) / 1024 / 1024:>12.1f}" for report in reports))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the publish pipeline on a synthetic vault")
+    add_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--resource-link', default='auto')
+    parser.add_argument('--renderer', default='hexo', choices=['hexo', 'native'])
+    parser.add_argument('--image-optimize', action='store_true', help="resize and recompress images, needs Pillow")
+    parser.add_argument('--targets', type=int, default=1, help="publish the vault to this many hexo targets in one run")
+    parser.add_argument('--modify', type=float, default=0.01, help="ratio of notes modified before the last run")
+    parser.add_argument('--reuse', action='store_true', help="reuse an existing generated vault")
+    parser.add_argument('--output', help="write all reports to this json file")
+    args = parser.parse_args()
+
+    work_dir = os.path.join(BENCH_DIR, 'work')
+    # 缓存和报告都放在 get_full_relative_path 指向的目录下
+    sys.argv[0] = os.path.join(work_dir, 'obsidian2hexo.py')
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    start = time.perf_counter()
+    if args.reuse and os.path.exists(args.vault):
+        excluder = ExcludeMatcher.from_settings(args.vault, [os.path.join(args.vault, 'res')])
+        note_paths = list(obsidian2hexo.walk_notes(args.vault, excluder))
+    else:
+        note_paths = gen_vault(args)
+    print(f"vault: {len(note_paths)} notes in {args.vault} ({time.perf_counter() - start:.1f}s)")
+
+    orders = stub_deploy()
+    settings = get_settings(args, work_dir)
+    reports = [run('cold', settings, args.jobs), run('warm', settings, args.jobs)]
+
+    count = max(1, int(len(note_paths) * args.modify))
+    for note_path in note_paths[:count]:
+        with open(note_path, 'a', encoding='utf-8') as f:
+            f.write("\nmodified by benchmark\n")
+    reports.append(run('modify', settings, args.jobs))
+
+    print_reports(reports)
+    print(f"stubbed deploy commands: {len(orders)}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,116 @@
+"""
+生成用于基准测试的 obsidian 仓库\n
+笔记数, 双链密度, 嵌入资源数, 发布比例, 目录深度, 附件大小和 git 提交数都可以配置, 同样的参数和种子生成同样的仓库
+"""
+import os
+import random
+import shutil
+import argparse
+import subprocess
+
+WORDS = ['笔记', '发布', '索引', '缓存', '链接', 'python', 'hexo', 'obsidian', 'markdown', 'git',
+         '性能', '测试', 'note', 'render', 'parse', '目录', '资源', '图片', 'tag', 'graph']
+
+
+def git(vault, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='bench', GIT_AUTHOR_EMAIL='bench@localhost',
+               GIT_COMMITTER_NAME='bench', GIT_COMMITTER_EMAIL='bench@localhost')
+    subprocess.run(['git', *args], cwd=vault, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def gen_paragraph(rnd, words=60):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words))
+
+
+def gen_note(rnd, index, names, images, files, args):
+    """ 返回笔记内容, 第一行是标签 """
+    tags = [f"#tag{rnd.randrange(20)}", f"#topic/sub{rnd.randrange(5)}"]
+    if rnd.random() < args.share_ratio:
+        tags.insert(0, f"#{args.share_tag}")
+    lines = [' '.join(tags), f"## 标题 {index}"]
+    for paragraph in range(args.paragraphs):
+        line = gen_paragraph(rnd)
+        for _ in range(rnd.randint(0, args.links * 2)):
+            target_index = rnd.randrange(len(names))
+            target = names[target_index]
+            if rnd.random() < 0.2:
+                target = f"{target}#标题 {target_index}"
+            line += f" [[{target}]]"
+        lines.append(line)
+        if paragraph == 0:
+            for _ in range(args.embeds):
+                lines.append(f"![[{rnd.choice(images)}]]")
+            if files and rnd.random() < 0.3:
+                lines.append(f"[{rnd.choice(files)}]({rnd.choice(files)})")
+        if rnd.random() < 0.2:
+            lines.extend(["```python", "print('[[not a link]]')", "```"])
+        lines.append(f"### 小节 {paragraph}")
+    return '\n'.join(lines) + '\n'
+
+
+def gen_dir(rnd, depth):
+    parts = [f"dir{rnd.randrange(4)}" for _ in range(rnd.randint(0, depth))]
+    return os.path.join(*parts) if parts else ''
+
+
+def gen_vault(args):
+    """ 生成仓库, 返回笔记路径列表 """
+    rnd = random.Random(args.seed)
+    if os.path.exists(args.vault):
+        shutil.rmtree(args.vault)
+    res_dir = os.path.join(args.vault, 'res')
+    os.makedirs(res_dir)
+
+    images = [f"image{i}.png" for i in range(args.images)]
+    files = [f"file{i}.pdf" for i in range(args.files)]
+    for name in images + files:
+        res_path = os.path.join(res_dir, gen_dir(rnd, 1), name)
+        os.makedirs(os.path.dirname(res_path), exist_ok=True)
+        with open(res_path, 'wb') as f:
+            f.write(rnd.randbytes(args.attachment_kb * 1024))
+
+    names = [f"note{i}" for i in range(args.notes)]
+    note_paths = []
+    for index, name in enumerate(names):
+        note_path = os.path.join(args.vault, gen_dir(rnd, args.depth), f"{name}.md")
+        os.makedirs(os.path.dirname(note_path), exist_ok=True)
+        with open(note_path, 'w', encoding='utf-8') as f:
+            f.write(gen_note(rnd, index, names, images, files, args))
+        note_paths.append(note_path)
+
+    if args.commits > 0:
+        git(args.vault, 'init', '-q')
+        git(args.vault, 'add', '.')
+        git(args.vault, 'commit', '-q', '-m', 'init')
+        for commit in range(1, args.commits):
+            for note_path in rnd.sample(note_paths, min(len(note_paths), args.edits)):
+                with open(note_path, 'a', encoding='utf-8') as f:
+                    f.write(f"\n{gen_paragraph(rnd, 10)} {commit}\n")
+            git(args.vault, 'commit', '-q', '-a', '-m', f"edit {commit}")
+    return note_paths
+
+
+def add_arguments(parser):
+    parser.add_argument('--vault', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vault'))
+    parser.add_argument('--notes', type=int, default=2000, help="note count")
+    parser.add_argument('--links', type=int, default=3, help="average links per paragraph")
+    parser.add_argument('--embeds', type=int, default=1, help="image embeds per note")
+    parser.add_argument('--paragraphs', type=int, default=5)
+    parser.add_argument('--share-ratio', type=float, default=0.5)
+    parser.add_argument('--share-tag', default='share')
+    parser.add_argument('--depth', type=int, default=3, help="max directory depth")
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--attachment-kb', type=int, default=64)
+    parser.add_argument('--commits', type=int, default=20, help="git commits, 0 for no git repo")
+    parser.add_argument('--edits', type=int, default=50, help="notes edited per commit")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate a synthetic obsidian vault")
+    add_arguments(parser)
+    args = parser.parse_args()
+    note_paths = gen_vault(args)
+    print(f"generated {len(note_paths)} notes in {args.vault}")
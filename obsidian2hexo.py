@@ -1,146 +1,286 @@
+import io
 import os
 import re
 import sys
 import time
 import hashlib
 import traceback
-import subprocess
+import json
 import yaml
-import shutil
-from datetime import datetime
+import argparse
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from util.logger import Logger
+from util.git import GitHistory, get_diff_paths, get_dirty_paths
+from util.git_snapshot import GitSnapshot, SnapshotResourceIndex
+from util.dates import DateResolver, DATE_SOURCES, normalize_date
+from util.build_cache import BuildCache, get_text_hash
+from util.link_resolver import LinkResolver
+from util.link_graph import LinkGraph
+from util.exclude import ExcludeMatcher
+from util.markdown import MarkdownTokenizer
+from util.transclusion import Transcluder
+from util.resource_sync import ResourceSync
+from util.resource_index import ResourceIndex
+from util.watcher import Watcher
+from util.profiler import Profiler
+from util.staged_writer import StagedWriter
+from util.site_renderer import SiteRenderer
+from util.exporter import Exporter, FLAVOURS
+from util.deployer import HexoDeployer
+from util.image_optimizer import ImageOptimizer, rewrite_images
+from util.search_index import SearchIndex, get_terms, KEY_LENGTH
 
 logger = Logger(__file__)
-logger.set_handler("file")
+profiler = Profiler()
+# front-matter 之后的标签行, 标签紧跟 # 不是标题
+PATTERN_TAG_LINE = re.compile(r'\s*#[^\s#]')
+# 流式生成时每批生成和写入的文章数
+STREAM_BATCH = 128
 
 
 class Note():
-    def __init__(self, root_dir, file_path, share_tag, resource, note_index):
+    """
+    笔记分两层解析\n
+    构造时只读取第一行和 front-matter 得到名字, 路径, 标签和别名; 正文, 资源, 链接和日期在 load 中按需解析\n
+    流式生成时 release 释放正文只保留元数据, 之后用到时从构建缓存重新读取\n
+    share_tags 为全部发布目标的发布标签, 带任意一个时需要解析, shares 记录带了哪些
+    """
+
+    __slots__ = ('root_dir', 'file_path', 'share_tags', 'res_index', 'note_index', 'date_resolver', 'record', 'data',
+                 'snapshot', 'build_cache', 'file_name', 'tags', 'tag_names', 'shares', 'is_share', 'is_top', 'aliases',
+                 'front_dates',
+                 'real_path', 'depth', 'create_hash', 'is_parsed', 'is_loaded', 'backlink', 'md_links', 'embed_paths',
+                 'embed_assets', 'image_html', 'body', 'content', 'images', 'files', 'links', 'link_spans', 'embeds',
+                 'embed_spans', 'missing', 'terms', 'create_date', 'last_date')
+
+    def __init__(self, root_dir, file_path, share_tags, res_index, note_index, date_resolver, record=None, data=None):
         self.root_dir = root_dir
         self.file_path = file_path
-        self.share_tag = share_tag
-        self.resource = resource
+        self.share_tags = share_tags
+        self.res_index = res_index
         self.note_index = note_index
+        self.date_resolver = date_resolver
+        self.record = record
+        self.data = data
+        self.snapshot = None
+        self.build_cache = None
         self.file_name = self.get_file_name()
-        self.content = self.get_content()
-        self.tags = self.get_tags()
-        self.is_share = self.check_share()
-        self.is_top = self.check_top()
-        self.images = self.get_images()
-        self.files = self.get_files()
-        self.links = self.get_links()
+        if record is None:
+            first_line, front_matter = self.read_header()
+            self.tags = self.get_tags(first_line)
+            self.is_share = self.check_share()
+            self.is_top = self.check_top()
+            meta = self.get_front_matter(front_matter)
+            self.aliases = self.get_aliases(meta)
+            self.front_dates = self.get_front_dates(meta)
+        else:
+            self.tags = set(record['tags'])
+            self.tag_names = record['tag_names']
+            self.shares = record['shares']
+            self.is_share = record['is_share']
+            self.is_top = record['is_top']
+            self.aliases = record['aliases']
+            self.front_dates = record['front_dates']
         self.real_path = self.get_real_path()
         self.depth = self.get_depth()
-        self.commits = self.get_git_commits()
-        self.create_date = self.get_create_date()
-        self.last_date = self.get_last_date()
         self.create_hash = self.get_create_hash()
-        self.backlink = set()
-        self.md_links = set()
+        self.is_parsed = False
+        self.is_loaded = False
+        self.backlink = frozenset()
+        self.md_links = frozenset()
+        self.embed_paths = frozenset()
+        self.embed_assets = frozenset()
+        self.image_html = {}
+        self.body = None
+        self.content = None
+
+    def __getstate__(self):
+        """ 传给子进程时不带日期解析和缓存记录 """
+        state = {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+        state['date_resolver'] = None
+        state['record'] = None
+        state['res_index'] = None
+        state['snapshot'] = None
+        state['build_cache'] = None
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def parse(self):
+        """ 解析正文, 资源和链接, 不依赖提交历史, 可以在子进程中执行 """
+        record = self.record
+        # 流式加载时缓存记录不带正文, 正文在用到时由 restore 读取
+        if record is not None and 'links' in record:
+            self.content = record.get('content')
+            self.images = record['images']
+            self.files = record['files']
+            self.links = record['links']
+            self.link_spans = record.get('link_spans')
+            self.embeds = record['embeds']
+            self.embed_spans = record.get('embed_spans')
+            self.missing = record['missing']
+            self.terms = record.get('terms')
+        else:
+            first_line, content = self.get_content()
+            tokenizer = MarkdownTokenizer(self.is_res_available)
+            self.content, self.images, self.files, self.links, self.link_spans = \
+                tokenizer.transform(content)
+            self.embeds = tokenizer.embeds
+            self.embed_spans = tokenizer.embed_spans
+            self.missing = tokenizer.missing
+            self.terms = get_terms(self.file_name, self.tags, self.content)
+        self.is_parsed = True
+        return self
+
+    def load(self):
+        """ 完整加载笔记, 只对需要发布的笔记调用 """
+        if self.is_loaded:
+            return self
+        if not self.is_parsed:
+            self.parse()
+        self.update_dates()
+        self.is_loaded = True
+        return self
+
+    def release(self):
+        """ 释放正文, 词表, 反向链接和缓存记录, 保留链接和资源 """
+        self.record = None
+        self.content = None
+        self.body = None
+        self.link_spans = None
+        self.embed_spans = None
+        self.terms = None
+        self.backlink = frozenset()
+        self.md_links = frozenset()
+
+    def restore(self):
+        """ 重新读取释放过的正文, 优先使用构建缓存 """
+        self.record = None if self.build_cache is None else self.build_cache.get_record(self.file_path)
+        self.parse()
+
+    def update_dates(self):
+        self.create_date, self.last_date = self.date_resolver.resolve(self.file_path, self.front_dates)
+
+    def to_record(self):
+        """ 生成构建缓存记录, 只有解析过的笔记才保存正文 """
+        record = {
+            'tags': sorted(self.tags),
+            'tag_names': self.tag_names,
+            'shares': self.shares,
+            'is_share': self.is_share,
+            'is_top': self.is_top,
+            'aliases': self.aliases,
+            'front_dates': self.front_dates,
+        }
+        if self.is_parsed:
+            record['content'] = self.content
+            record['images'] = self.images
+            record['files'] = self.files
+            record['links'] = self.links
+            record['link_spans'] = self.link_spans
+            record['embeds'] = self.embeds
+            record['embed_spans'] = self.embed_spans
+            record['missing'] = self.missing
+            record['terms'] = self.terms
+        return record
+
+    def open_file(self):
+        """ 快照模式下读取 git 中的内容, 否则读取工作区的文件 """
+        data = self.data
+        if data is None and self.snapshot is not None:
+            data = self.snapshot.read_file(self.file_path)
+        if data is not None:
+            return io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+        return open(self.file_path, "r", encoding='utf-8')
 
     def get_content(self):
-        with open(self.file_path, "r", encoding='utf-8') as f:
-            first_line = f.readline()
-            content = f.read()
-            content.replace(first_line, '')
-            return content
-
-    def get_tags(self):
-        first_line = ""
-        with open(self.file_path, "r", encoding='utf-8') as f:
-            first_line = f.readline()
-
+        """ 返回 (标签行, 其余正文), 有 front-matter 时跳过 front-matter """
+        with self.open_file() as f:
+            first_line, _, rest = self.read_front_matter(f)
+            return first_line, rest + f.read()
+
+    def read_header(self):
+        """ 只读取标签行, 以 --- 开头时再读取 front-matter """
+        with self.open_file() as f:
+            first_line, front_matter, _ = self.read_front_matter(f)
+        return first_line, front_matter
+
+    @staticmethod
+    def read_front_matter(f):
+        """
+        返回 (标签行, front-matter, 已读取的正文)
+
+        没有 front-matter 时第一行是标签行; 有 front-matter 时紧跟在后面的以标签开头的行是标签行, 否则没有标签行
+        """
+        first_line = f.readline()
+        if first_line.strip() != '---':
+            return first_line, '', ''
+        front_matter = []
+        for line in iter(f.readline, ''):
+            if line.strip() == '---':
+                break
+            front_matter.append(line)
+        line = f.readline()
+        if PATTERN_TAG_LINE.match(line):
+            return line, ''.join(front_matter), ''
+        return '', ''.join(front_matter), line
+
+    def get_tags(self, first_line):
         pattern_tag = '#\S*'
         tags = []
         all_tag = re.compile(pattern_tag).findall(first_line)
-        self.is_share = False
+        self.tag_names = []
+        shares = set()
         self.is_top = False
         for tag in all_tag:
             if f"#top" == tag:
                 self.is_top = True
-            if f"#{share_tag}" == tag:
-                self.is_share = True
-                continue
             tag = tag.replace('#', '')
+            self.tag_names.append(tag)
+            if tag in self.share_tags:
+                shares.add(tag)
+                continue
             if '/' in tag:
                 tags.extend(tag.split('/'))
                 continue
             tags.append(tag)
+        self.shares = sorted(shares)
+        self.is_share = len(shares) > 0
         return set(tags)
 
+    def get_front_matter(self, front_matter):
+        if not front_matter:
+            return {}
+        try:
+            meta = yaml.safe_load(front_matter)
+        except yaml.YAMLError:
+            return {}
+        if not isinstance(meta, dict):
+            return {}
+        return meta
+
+    def get_aliases(self, meta):
+        aliases = meta.get('aliases') or meta.get('alias') or []
+        if isinstance(aliases, str):
+            aliases = [aliases]
+        return [str(alias) for alias in aliases]
+
+    def get_front_dates(self, meta):
+        """ front-matter 中的 (created, updated), 没有或者无法识别时为 None """
+        return [normalize_date(meta.get('created')), normalize_date(meta.get('updated'))]
+
     def check_share(self):
         return self.is_share
 
     def check_top(self):
         return self.is_top
 
-    def get_links(self):
-        pattern_link = '(?<!!)\[\[.*\]\]'
-        links = re.compile(pattern_link).findall(self.content)
-        link_files = []
-        for link in links:
-            link_file = link.replace("[[", "")
-            link_file = link_file.replace("]]", "")
-            link_file = link_file.replace("/", os.sep)
-            md_link = f"[[{link_file}]]"
-            self.content = self.content.replace(link, md_link)
-            link_files.append(link_file)
-        return link_files
-
     def is_res_available(self, img):
-        from_path = f"{self.resource}/{img}"
-        if os.path.exists(from_path):
-            return True
-        return False
-
-    def get_images(self):
-        images = []
-
-        pattern_image1 = '!\[\[.*\]\]'
-        res1 = re.compile(pattern_image1).findall(self.content)
-        for link in res1:
-            image = link.replace("![[", "")
-            image = image.replace("]]", "")
-            if '|' in image:
-                image = image.split('|')[0].strip()
-            if self.is_res_available(image):
-                images.append(image)
-                image_link = f"![](/images/{image})"
-                self.content = self.content.replace(link, image_link)
-
-        pattern_image2 = '!\[.*\]\(.*\)'
-        res2 = re.compile(pattern_image2).findall(self.content)
-        for link in res2:
-            if 'http' in link:
-                continue
-            front = re.search("!\[.*\]\(", link).group()
-            image = link.replace(front, "")
-            image = image.replace(")", "")
-            if '/' in image:
-                image = image.split('/')[-1].strip()
-            if self.is_res_available(image):
-                images.append(image)
-                image_link = f"![](/images/{image})"
-                self.content = self.content.replace(link, image_link)
-
-        return images
-
-    def get_files(self):
-        files = []
-        pattern_file = '(?<!\S)\[.*\]\(.*\)'
-        res = re.compile(pattern_file).findall(self.content)
-        for link in res:
-            if 'http' in link:
-                continue
-            front = re.search("(?<!\S)\[.*\]\(", link).group()
-            file = link.replace(front, "")
-            file = file.replace(")", "")
-            if self.is_res_available(file):
-                files.append(file)
-                image_link = f"[{file}](/download/{file})"
-                self.content = self.content.replace(link, image_link)
-
-        return files
+        return self.res_index.exists(img)
 
     def get_real_path(self):
         real_path = self.file_path.replace(self.root_dir, '')
@@ -158,41 +298,27 @@ class Note():
         name, extension = os.path.splitext(filename)
         return name
 
-    def get_git_commits(self):
-        return get_commits(self.root_dir, self.file_path)
-
-    def get_create_date(self):
-        if len(self.commits) > 0:
-            oldest_commit = self.commits[-1]
-            return convert_git_date(oldest_commit)
-        return get_cur_timestr()
-
     def get_create_hash(self):
         return get_sha1(self.file_path)
 
-    def get_last_date(self):
-        if len(self.commits) > 0:
-            last_commit = self.commits[0]
-            return convert_git_date(last_commit)
-        return get_cur_timestr()
-
-    def reset_link(self, link, link_url):
-        self.content = self.content.replace(link, link_url)
-
-    def gen_metadata(self):
-        title = self.file_name
-        date = self.create_date
-        top = 999 if self.is_top else 0
-
+    def get_categories(self):
+        """ 笔记所在的目录作为分类 """
         categories = []
         paths = self.real_path.split(os.sep)
         for path in paths:
             if path == '' or path.endswith('.md'):
                 continue
             categories.append(path)
+        return categories
+
+    def gen_metadata(self):
+        title = self.file_name
+        date = self.create_date
+        top = 999 if self.is_top else 0
+        categories = self.get_categories()
 
         tags = []
-        for tag in self.tags:
+        for tag in sorted(self.tags):
             tags.append(tag)
 
         metadata = "---\n"
@@ -204,21 +330,29 @@ class Note():
             metadata += f"top: {top}\n"
         metadata += "---\n"
 
-        self.content = metadata + self.content
+        return metadata
 
     def gen_backlinks(self):
+        backlinks = ""
         if len(self.backlink) > 0:
-            self.content += "\n\n**Backlinks:**\n"
-            for backlink in self.backlink:
-                self.content += f"\n- {backlink}"
+            backlinks += "\n\n**Backlinks:**\n"
+            for backlink in sorted(self.backlink):
+                backlinks += f"\n- {backlink}"
+        return backlinks
 
     def gen_mindmap(self):
+        mindmap = ""
         if len(self.backlink) + len(self.md_links) > 0:
-            self.content += "\n\n{% pullquote mindmap mindmap-md %}"
-            self.content += f"\n- {self.file_name}"
-            for mdlink in self.md_links:
-                self.content += f"\n  - {mdlink}"
-            self.content += "\n{% endpullquote %}"
+            mindmap += "\n\n{% pullquote mindmap mindmap-md %}"
+            mindmap += f"\n- {self.file_name}"
+            for mdlink in sorted(self.md_links):
+                mindmap += f"\n  - {mdlink}"
+            mindmap += "\n{% endpullquote %}"
+        return mindmap
+
+    def reset_links(self):
+        self.backlink = set()
+        self.md_links = set()
 
     def append_mdlink(self, link):
         self.md_links.add(link)
@@ -227,18 +361,16 @@ class Note():
         self.backlink.add(link)
 
     def get_full_content(self):
-        self.content = re.sub(r"((```\w*|\?\?)(?=\s))(.*)", r'\1', self.content)
-        self.content = re.sub(r"```run-", "```", self.content)
-        self.content = re.sub(r"\?\?.*", "  ", self.content)
-        self.content = re.sub(r"(\n)(#{2,})", r'  \1\2', self.content)
-        self.content = re.sub(r"(?<!\n)(\n#{2,})", r'\n  \1', self.content)
-        self.content = re.sub(r"(#{2,}.*\n)(?!\n)", r'\1\n', self.content)
+        """ 生成文章, 不修改解析结果, 可以重复调用 """
+        return self.gen_metadata() + self.get_body() + self.gen_backlinks() + self.gen_mindmap()
 
-        self.gen_metadata()
-        self.gen_backlinks()
-        self.gen_mindmap()
+    def get_body(self):
+        """ 正文, 优化过的图片替换为 picture 标签 """
+        return rewrite_images(self.body, self.image_html)
 
-        return self.content
+    def get_all_images(self):
+        """ 正文和嵌入的笔记中引用的图片 """
+        return self.images + [name for folder, name in sorted(self.embed_assets) if folder == 'images']
 
 
 def get_cur_file_name():
@@ -265,194 +397,393 @@ def load_config():
         return yaml.safe_load(config)
 
 
-def is_exclude(exludes, path):
-    if not path.endswith('.md'):
-        return True
+def walk_notes(root_dir, excluder):
+    """ 遍历笔记目录, 跳过排除的目录, 返回按路径排序的 {文件路径: stat} """
+    files = excluder.walk(('.md',))
+    return {file_path: files[file_path] for file_path in sorted(files)}
 
-    for exclude in exludes:
-        if exclude in path:
-            return True
-    return False
 
+def init_worker(log_queue):
+    """ 解析和渲染的子进程不写日志文件, 交给主进程写入 """
+    logger.forward(log_queue)
 
-def get_all_notes(root_dir, excludes, share_tag, resource):
-    try:
-        notes = []
-        share_notes = []
-        note_index = 0
-        for root, dirs, files in os.walk(root_dir):
-            # 输出所有的文件夹路径
-            for file in files:
-                file_path = os.path.join(root, file)
-                if is_exclude(excludes, file_path):
-                    continue
-                logger.info(f"processing note: {note_index} {file_path}")
-                note_index += 1
-                note = Note(root_dir, file_path, share_tag, resource, note_index)
-                notes.append(note)
-                if note.check_share():
-                    share_notes.append(note)
-                    logger.info(f">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> shared note: {file_path}")
-    except Exception as e:
-        logger.error(f'get_all_notes Exception:{e} trackback:{traceback.format_exc()}')
 
-    return notes, share_notes
+def map_jobs(executor, func, items, *args):
+    """ 有进程池时并行执行, 结果顺序与 items 一致; args 为和 items 一一对应的其他参数 """
+    if executor is None:
+        return map(func, items, *args)
+    return executor.map(func, items, *args, chunksize=max(1, len(items) // 64))
 
 
-def get_link_url(notes, link):
-    for note in notes:
-        note_link = f"[[{note.file_name}]]"
-        if note_link == link:
-            '../'
+def is_record_fresh(record, res_index, share_tags):
+    """ 引用的资源被删除或者缺失的资源被补上, 或者发布目标的标签变化使笔记带的发布标签变化时, 缓存的解析结果失效 """
+    if sorted(set(record['tag_names']) & set(share_tags)) != record['shares']:
+        return False
+    if 'links' not in record:
+        return True
+    for name in record['missing']:
+        if res_index.exists(name):
+            return False
+    for name in record['images'] + record['files']:
+        if not res_index.exists(name):
+            return False
+    return True
 
 
-def process_links(notes, share_notes):
-    for note in share_notes:
-        for link in note.links:
-            link_url = get_link_url(notes, link)
-            note.reset_link(link, link_url)
-
-
-def get_commits(repo_path, file_full_path):
-    os.chdir(repo_path)
-
-    order = ['git', 'log']
-    if file_full_path is not None:
-        order = f'git log -- "{file_full_path}"'
-
-    output = subprocess.check_output(order, stderr=subprocess.STDOUT, creationflags=0x08000000)
-    lines = output.splitlines()
-    commits = []
-    current_commit = {}
-
-    def save_current_commit():
-        title = current_commit['message'][0]
-        message = current_commit['message'][1:]
-        if message and message[0] == '':
-            del message[0]
-        current_commit['title'] = title
-        current_commit['message'] = '\n'.join(message)
-        commits.append(current_commit)
-
-    for l in lines:
-        line = l.decode('utf-8')
-        if not line.startswith(' '):
-            if line.startswith('commit '):
-                if current_commit:
-                    save_current_commit()
-                    current_commit = {}
-                current_commit['hash'] = line.split('commit ')[1]
-            else:
-                try:
-                    key, value = line.split(':', 1)
-                    current_commit[key.lower()] = value.strip()
-                except ValueError:
-                    pass
-        else:
-            leading_4_spaces = re.compile('^    ')
-            current_commit.setdefault('message', []).append(leading_4_spaces.sub('', line))
-    if current_commit:
-        save_current_commit()
-    return commits
+def compact_record(record):
+    """ 流式加载时只保留链接图和资源需要的字段, 正文, 位置和词表用到时再从构建缓存读取 """
+    for key in ('content', 'link_spans', 'embed_spans', 'terms'):
+        record.pop(key, None)
 
 
-def convert_git_date(commit):
-    date = commit['date']
-    datetime_object = datetime.strptime(' '.join(date.split(' ')[:-1]), '%a %b %d %H:%M:%S %Y')
-    return datetime_object
+def parse_note(root_dir, file_path, data=None, share_tags=('share',), res_index=None):
+    """ 解析单篇笔记, 返回 (缓存记录, 异常信息); data 为快照中的内容, None 时读取文件 """
+    try:
+        note = Note(root_dir, file_path, share_tags, res_index, 0, None, data=data)
+        if note.check_share():
+            note.parse()
+        return note.to_record(), None
+    except Exception as e:
+        return None, f"{e} trackback:{traceback.format_exc()}"
 
 
-def get_link_note(notes, link):
-    for note in notes:
-        if '#' in link:
-            link = link.split('#')[0]
+def render_note(note):
+    """ 生成文章内容, 返回 (文章内容, 异常信息) """
+    try:
+        return note.get_full_content(), None
+    except Exception as e:
+        return None, f"{e} trackback:{traceback.format_exc()}"
 
-        if os.sep in link:
-            if note.real_path == f"{os.sep}{link}.md":
-                return note
-        else:
-            if note.file_name == link:
-                return note
 
+def load_notes(root_dir, file_paths, share_tags, res_index, date_resolver, cache, executor=None, stats=None, trusted=(),
+               snapshot=None, release=False):
+    """
+    加载指定的笔记, 优先使用构建缓存, 只解析变化的笔记; stats 为遍历目录时得到的 stat\n
+    trusted 中的笔记 git 确认没有修改, 不检查 stat 直接使用缓存\n
+    snapshot 不为 None 时从 git 快照读取, 按 blob id 判断缓存是否有效\n
+    release 为 True 时不在内存中保留正文, 只保留链接等元数据, 正文用到时再从构建缓存读取
+    """
+    notes = []
+    stats = dict(stats or {})
+    records = {}
+    misses = []
+    with profiler.stage('cache_lookup'):
+        for file_path in file_paths:
+            if snapshot is not None:
+                record = cache.get_blob(file_path, snapshot.get_entry(file_path)[0])
+            elif file_path in trusted:
+                record = cache.get_unchecked(file_path)
+            else:
+                stat = stats.get(file_path)
+                if stat is None:
+                    stat = os.stat(file_path)
+                    stats[file_path] = stat
+                record = cache.get(file_path, stat)
+            if record is None or not is_record_fresh(record, res_index, share_tags):
+                if snapshot is None and file_path not in stats:
+                    stats[file_path] = os.stat(file_path)
+                misses.append(file_path)
+            else:
+                if release:
+                    compact_record(record)
+                records[file_path] = record
+
+    logger.info(f"parse notes: {len(misses)}/{len(file_paths)}")
+    profiler.count('notes', len(file_paths))
+    profiler.count('notes_parsed', len(misses))
+    if snapshot is None:
+        profiler.count('bytes_parsed', sum(stats[file_path].st_size for file_path in misses))
+        datas = [None] * len(misses)
+    else:
+        profiler.count('bytes_parsed', sum(snapshot.get_entry(file_path)[1] for file_path in misses))
+        with profiler.stage('cat_file'):
+            datas = [snapshot.read_file(file_path) for file_path in misses]
+    with profiler.stage('parse'):
+        parser = partial(parse_note, root_dir, share_tags=share_tags, res_index=res_index)
+        for file_path, (record, error) in zip(misses, map_jobs(executor, parser, misses, datas)):
+            if error is not None:
+                logger.error(f'parse note failed: {file_path} Exception:{error}')
+                profiler.count('errors')
+                continue
+            logger.info("processing note: %s", file_path)
+            if snapshot is None:
+                cache.put(file_path, stats[file_path], record)
+            else:
+                blob_id, size = snapshot.get_entry(file_path)
+                cache.put_blob(file_path, size, blob_id, record)
+            if release:
+                compact_record(record)
+            records[file_path] = record
+
+    with profiler.stage('load'):
+        for note_index, file_path in enumerate(file_paths):
+            record = records.pop(file_path, None)
+            if record is None:
+                continue
+            note = Note(root_dir, file_path, share_tags, res_index, note_index, date_resolver, record)
+            note.snapshot = snapshot
+            if release:
+                note.build_cache = cache
+            notes.append(note)
+            if note.check_share():
+                note.load()
+                logger.info(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> shared note: %s", file_path)
+            if release:
+                note.record = None
+
+    return notes
+
+
+def get_all_notes(root_dir, excluder, share_tags, res_index, date_resolver, cache, executor=None, release=False):
+    with profiler.stage('walk'):
+        stats = walk_notes(root_dir, excluder)
+    notes = load_notes(root_dir, list(stats), share_tags, res_index, date_resolver, cache, executor, stats,
+                       release=release)
+    share_notes = [note for note in notes if note.check_share()]
+    return notes, share_notes
 
-def gen_hexo_notes(notes, share_notes, path_to, resource):
+
+def gen_hexo_notes(share_notes, path_to, cache, executor=None, dry_run=False, render_paths=None, loader=None,
+                   releaser=None, output_prefix=''):
+    """
+    生成文章, 只写入内容变化的文件, 返回 {'added', 'updated', 'removed'}\n
+    render_paths 不为 None 时只重新生成其中的笔记, 其余文章保持不变\n
+    loader 在生成前展开正文和生成反向链接; 有 releaser 时每 STREAM_BATCH 篇一批生成和写入, 写入后用 releaser 释放正文\n
+    output_prefix: 输出 hash 在构建缓存中的前缀, 区分多个发布目标
+    """
     logger.info("********************************* gen_hexo_notes *********************************")
     posts_foler = f"{path_to}/source/_posts/"
-    shutil.rmtree(posts_foler, ignore_errors=True)
-    os.mkdir(posts_foler)
-
-    notes_to_gen = []
+    writer = StagedWriter(posts_foler, f"{path_to}/.posts_staging", dry_run)
+
+    post_names = set(f"{note.create_hash}.md" for note in share_notes)
+    notes_to_gen = share_notes
+    if render_paths is not None:
+        notes_to_gen = [note for note in share_notes if note.file_path in render_paths]
+        for _ in range(len(share_notes) - len(notes_to_gen)):
+            writer.keep()
+    profiler.count('shared_notes', len(share_notes))
+    profiler.count('rendered_notes', len(notes_to_gen))
+
+    batch_size = STREAM_BATCH if releaser is not None else max(1, len(notes_to_gen))
+    for start in range(0, len(notes_to_gen), batch_size):
+        batch = notes_to_gen[start:start + batch_size]
+        if loader is not None:
+            for note in batch:
+                loader(note)
+        with profiler.stage('render'):
+            results = list(map_jobs(executor, render_note, batch))
+        with profiler.stage('write'):
+            for note, (full_content, error) in zip(batch, results):
+                post_name = f"{note.create_hash}.md"
+                if error is not None:
+                    logger.error(f'render note failed: {note.file_path} Exception:{error}')
+                    profiler.count('errors')
+                    continue
+                output_hash = get_text_hash(full_content)
+                if cache.is_output_fresh(output_prefix + post_name, output_hash) \
+                        and os.path.exists(f"{posts_foler}{post_name}"):
+                    writer.keep()
+                    continue
+                if writer.put(post_name, full_content, output_hash) is not None:
+                    logger.info("generate hexo note: %s %s", note.create_hash, note.file_name)
+                    profiler.count('posts_written')
+                    profiler.count('bytes_written', len(full_content.encode('utf-8')))
+        if releaser is not None:
+            for note in batch:
+                releaser(note)
+
+    with profiler.stage('write'):
+        if os.path.exists(posts_foler):
+            for post_name in os.listdir(posts_foler):
+                if post_name.endswith('.md') and post_name not in post_names:
+                    writer.remove(post_name)
+                    profiler.count('posts_removed')
+        changes = writer.commit()
+
+    if not dry_run:
+        for post_name, output_hash in writer.hashes.items():
+            cache.put_output(output_prefix + post_name, output_hash)
+        for post_name in changes['removed']:
+            cache.remove_output(output_prefix + post_name)
+    return changes
+
+
+def get_link_path(note, heading=None):
+    if heading:
+        return f"[{note.file_name}#{heading}](../{note.create_hash}/#{heading})"
+    return f"[{note.file_name}](../{note.create_hash})"
+
+
+def resolve_links(transcluder, sources, graph, full=True, release=False):
+    """
+    解析 sources 中笔记的双链和嵌入的笔记并更新链接图, full 为 True 时清理不再有出链的笔记\n
+    release 为 True 时不保留正文, 只展开有嵌入的笔记得到依赖和资源, 正文在生成时再展开\n
+    返回反向链接或脑图变化的笔记路径
+    """
+    changed = set()
+    for note in sources:
+        if not release:
+            note.body, note.embed_paths, note.embed_assets = transcluder.render(note)
+        elif note.embeds:
+            load_body(transcluder, note)
+            note.release()
+        changed |= graph.set_links(note.file_path, transcluder.get_links(note)[1])
+        if release:
+            transcluder.forget(note.file_path)
+    if full:
+        source_paths = set(note.file_path for note in sources)
+        for path in graph.get_sources():
+            if path not in source_paths:
+                changed |= graph.remove(path)
+    return changed
+
+
+def load_body(transcluder, note):
+    """ 展开正文, 释放过的正文重新读取 """
+    if note.content is None:
+        note.restore()
+    note.body, note.embed_paths, note.embed_assets = transcluder.render(note)
+
+
+def apply_links(note, notes_by_path, graph, members=None):
+    """ 根据链接图生成一篇笔记的反向链接和脑图, members 不为 None 时反向链接只来自其中的笔记 (同一个发布目标) """
+    note.reset_links()
+    for path, heading in graph.get_links(note.file_path):
+        link_note = notes_by_path.get(path)
+        if link_note is not None:
+            note.append_mdlink(get_link_path(link_note, heading))
+    for path in graph.get_backlinks(note.file_path):
+        link_note = notes_by_path.get(path)
+        if link_note is not None and (members is None or path in members):
+            back_link = get_link_path(link_note)
+            note.append_mdlink(back_link)
+            note.append_backlink_note(back_link)
+
+
+def gen_graph(share_notes, graph, folders, dry_run=False):
+    """ 导出发布笔记的关系图 graph.json, 返回是否有变化 """
+    content = json.dumps(graph.export(share_notes), ensure_ascii=False)
+    changed = False
+    for folder in folders:
+        writer = StagedWriter(folder, dry_run=dry_run)
+        if writer.put('graph.json', content) is not None:
+            changed = True
+        writer.commit()
+    return changed
+
+
+def iter_docs(share_notes, cache):
+    """ 搜索索引的文章, 流式加载时词表不在内存中, 从构建缓存读取 """
     for note in share_notes:
-        for img in note.images:
-            from_path = f"{resource}/{img}"
-            to_path = f"{path_to}/source/images/{img}"
-            shutil.copyfile(from_path, to_path)
-        for file in note.files:
-            from_path = f"{resource}/{file}"
-            to_path = f"{path_to}/source/download/{file}"
-            shutil.copyfile(from_path, to_path)
-        for link in note.links:
-            link_note = get_link_note(notes, link)
-            if link_note is not None:
-                link_path = f"[{link_note.file_name}](../{link_note.create_hash})"
-                if '#' in link:
-                    link_title = link.split('#')[-1]
-                    link_path = f"[{link_note.file_name}#{link_title}](../{link_note.create_hash}/#{link_title})"
-                note.content = note.content.replace(f"[[{link}]]", link_path)
-                note.append_mdlink(link_path)
-
-                back_link = f"[{note.file_name}](../{note.create_hash})"
-                link_note.append_mdlink(back_link)
-                link_note.append_backlink_note(back_link)
-        notes_to_gen.append(note)
-    for note in notes_to_gen:
-        logger.info(f"generate hexo note: {note.create_hash} {note.file_name}")
-        note_path = f"{path_to}/source/_posts/{note.create_hash}.md"
-        with open(note_path, "w", encoding="utf-8") as wordFile:
-            wordFile.write(note.get_full_content())
+        terms = note.terms
+        if terms is None:
+            terms = cache.get_record(note.file_path)['terms']
+        yield note.create_hash[:KEY_LENGTH], note.file_name, f"/{note.create_hash}/", note.create_date[:10], terms
 
 
-def replace_by_sep(source_path):
-    source_path = source_path.replace("/", os.sep)
-    return source_path
-
+def gen_search(share_notes, index, folders, cache, dry_run=False):
+    """ 生成前端搜索用的分片索引, 词表来自解析结果 (构建缓存), 返回是否有变化 """
+    names = index.update(iter_docs(share_notes, cache))
+    profiler.count('search_terms', len(index.postings))
+    profiler.count('search_shards_written', len(names))
+    return index.write(names, folders, dry_run)
 
-def deploy_hexo(hexo_path):
-    """ 运行命令行 """
-    logger.info("********************************* deploy_hexo *********************************")
 
+def get_assets(share_notes, res_index, optimized=None):
+    """
+    返回 ({输出路径: 资源路径}, {输出路径: 文件大小}), 同一个文件只出现一次\n
+    optimized: 优化过的图片, 输出优化后的文件代替原图
+    """
+    assets = {}
+    sizes = {}
+    for note in share_notes:
+        items = [('images', img) for img in note.images] + [('download', file) for file in note.files]
+        # 嵌入的笔记中引用的资源
+        items.extend(sorted(note.embed_assets))
+        for folder, name in items:
+            if folder == 'images' and optimized and name in optimized:
+                for output_name, path in optimized[name][0].items():
+                    assets[output_name] = path
+                    sizes[output_name] = os.path.getsize(path)
+                continue
+            path = res_index.get_full_path(name)
+            if path is None:
+                # 资源已经删除, 引用它的笔记还没有重新解析
+                logger.warning(f"resource not found, skip: {name} in {note.file_path}")
+                continue
+            assets[f"{folder}/{name}"] = path
+            sizes[f"{folder}/{name}"] = res_index.get_size(name)
+    return assets, sizes
+
+
+def gen_resources(share_notes, folder, manifest_path, res_index, link_mode='auto', dry_run=False, optimized=None):
+    """ 同步发布笔记引用的图片和附件到 folder (hexo 的 source 目录或导出目录), manifest_path 记录上次同步的结果 """
+    logger.info("********************************* gen_resources *********************************")
+    assets, sizes = get_assets(share_notes, res_index, optimized)
+    sync = ResourceSync(folder, manifest_path, link_mode, dry_run=dry_run)
+    with profiler.stage('asset_sync'):
+        counts = sync.sync(assets)
+    profiler.count('assets', len(assets))
+    profiler.count('asset_bytes', sum(sizes.values()))
+    for method, count in counts.items():
+        profiler.count(f'assets_{method}', count)
+    return counts
+
+
+def iter_pages(share_notes, loader=None, releaser=None, mindmap=True):
+    """ 内置渲染和导出的文章页面, 按需展开正文, 有 releaser 时生成页面后释放正文; 导出时不带 hexo 的脑图标签 """
+    for note in share_notes:
+        if loader is not None:
+            loader(note)
+        page = {
+            'name': f"{note.create_hash}/index.html",
+            'url': f"/{note.create_hash}/",
+            'title': note.file_name,
+            'date': note.create_date,
+            'categories': note.get_categories(),
+            'tags': sorted(note.tags),
+            'top': note.is_top,
+            'markdown': note.get_body() + note.gen_backlinks() + (note.gen_mindmap() if mindmap else ''),
+        }
+        if releaser is not None:
+            releaser(note)
+        yield page
+
+
+def gen_site(share_notes, settings, cache, res_index, executor=None, dry_run=False, optimized=None, loader=None,
+             releaser=None):
+    """ 不经过 hexo 直接生成静态网站, 需要安装 markdown; settings 为发布目标的配置 """
+    logger.info("********************************* gen_site *********************************")
     try:
-        os.chdir(hexo_path)
-        time_str = get_cur_timestr()
-        order_arr = ["hexo clean", "hexo g", "hexo d", "git status", "git add .", "git commit -m " + '"' + 'note:update ' + time_str + '"', "git pull", "git push"]  # 创建指令集合
-        for order in order_arr:
-            output = subprocess.check_output(order, stderr=subprocess.STDOUT, shell=True, creationflags=0x08000000)
-            lines = output.splitlines()
-            for line in lines:
-                logger.info(line.decode('utf-8'))
-        logger.info("********************************* hexo deploy success! *********************************")
-    except Exception as e:
-        print(f"deploy_hexo Exception:{e} trackback:{traceback.format_exc()}")
+        import markdown
+    except ImportError:
+        logger.error("native renderer needs python-markdown: pip install markdown")
+        return None
 
+    renderer = SiteRenderer(settings['site_dir'], settings['template_dir'], settings['site_title'],
+                            settings['site_url'], cache, executor, dry_run, settings['output_prefix'])
+    with profiler.stage('site_render'):
+        changes = renderer.render(iter_pages(share_notes, loader, releaser))
 
-def get_cur_timestr(time_foramt='%Y-%m-%d %H:%M:%S'):
-    """ 获取当前时间字符串 """
-    return timestamp2timestr(get_cur_timestamp(), time_foramt)
+    assets = get_assets(share_notes, res_index, optimized)[0]
+    sync = ResourceSync(settings['site_dir'], get_full_relative_path(f"{settings['cache_dir']}/site_resources.json"),
+                        settings['resource_link'], dry_run=dry_run)
+    with profiler.stage('site_asset_sync'):
+        sync.sync(assets)
+    return changes
 
 
-def timestamp2timestr(timestamp, time_format='%Y-%m-%d %H:%M:%S', offset_z=0):
-    """
-    :param timestamp: 时间戳
-    :param time_format:
-    :param offset_z: 时区差, 东加西减
-    :return: 时间字符串
-    """
-    return time.strftime(time_format, time.localtime(timestamp + offset_z * 3600))
+def gen_export(share_notes, settings, cache, dry_run=False, loader=None, releaser=None):
+    """ 导出为普通 markdown 或 json (settings['renderer']), settings 为发布目标的配置 """
+    logger.info("********************************* gen_export *********************************")
+    exporter = Exporter(settings['path_to'], settings['renderer'], cache, settings['output_prefix'], dry_run)
+    with profiler.stage('export'):
+        return exporter.export(iter_pages(share_notes, loader, releaser, False))
 
 
-def get_cur_timestamp():
-    """ 获取当前时间戳 """
-    return int(time.time())
+def replace_by_sep(source_path):
+    source_path = source_path.replace("/", os.sep)
+    return source_path
 
 
 def get_sha1(content):
@@ -460,11 +791,11 @@ def get_sha1(content):
     return hash_sha1
 
 
-if __name__ == "__main__":
-    config = load_config()
-
+def get_settings(config):
+    """ 整理配置文件中的路径和选项 """
     path_from = replace_by_sep(config['path_from'])
-    path_to = replace_by_sep(config['path_to'])
+    # 配置了 targets 时顶层的 path_to 可以省略
+    path_to = replace_by_sep(config.get('path_to') or '')
 
     resource = replace_by_sep(config['resource'])
     excludes = config['exclude']
@@ -477,12 +808,582 @@ if __name__ == "__main__":
     if share_tag is None:
         share_tag = 'share'
 
-    logger.info(f"\npath_from:\t{path_from}\n"
-                f"path_to:\t{path_to}\n"
-                f"resource:\t{resource}\n"
-                f"exclude:\t{exclude}\n"
-                f"share_tag:\t{share_tag}\n")
+    settings = {
+        'path_from': path_from,
+        'path_to': path_to,
+        'resource': resource,
+        'exclude': exclude,
+        'share_tag': share_tag,
+        'resource_link': config.get('resource_link') or 'auto',
+        'deploy_interval': config.get('deploy_interval') or 300,
+        'watch_debounce': config.get('watch_debounce') or 2,
+        'renderer': config.get('renderer') or 'hexo',
+        'site_dir': replace_by_sep(config.get('site_dir') or f"{path_to}/public"),
+        'template_dir': replace_by_sep(config.get('template_dir') or get_full_relative_path("template")),
+        'site_title': config.get('site_title') or 'Notes',
+        'site_url': config.get('site_url') or '',
+        'image_optimize': bool(config.get('image_optimize')),
+        'image_widths': config.get('image_widths') or [640, 1280],
+        'image_formats': config.get('image_formats') or ['webp'],
+        'image_quality': config.get('image_quality') or 80,
+        'search': bool(config.get('search', True)),
+        'date_sources': config.get('date_sources') or DATE_SOURCES,
+    }
+    targets = config.get('targets') or {}
+    settings['targets'] = [get_target(settings, name, targets[name] or {}) for name in targets]
+    return settings
+
+
+def get_target(settings, name=None, config=None):
+    """
+    发布目标的配置, config 中没有的选项使用顶层的配置\n
+    name 为 None 时是没有配置 targets 时由顶层配置组成的默认目标, 缓存文件和部署状态的位置和单目标时一致
+    """
+    config = config or {}
+    if name is None:
+        path_to = settings['path_to']
+        site_dir = settings['site_dir']
+    else:
+        path_to = replace_by_sep(config['path_to'])
+        site_dir = replace_by_sep(config.get('site_dir') or f"{path_to}/public")
+    return {
+        'name': name or 'default',
+        'share_tag': config.get('share_tag') or settings['share_tag'],
+        'path_to': path_to,
+        'renderer': config.get('renderer') or settings['renderer'],
+        'exclude': [replace_by_sep(e) for e in config.get('exclude') or []],
+        'site_dir': site_dir,
+        'template_dir': settings['template_dir'],
+        'site_title': config.get('site_title') or settings['site_title'],
+        'site_url': config.get('site_url') or settings['site_url'],
+        'resource_link': settings['resource_link'],
+        'search': bool(config.get('search', settings['search'])),
+        'cache_dir': 'cache' if name is None else f"cache/targets/{name}",
+        'output_prefix': '' if name is None else f"{name}:",
+        'deploy_key': 'deploy_pending' if name is None else f"deploy_pending:{name}",
+    }
+
+
+def is_changed(changes):
+    """ 本次生成是否修改了输出 """
+    for key in ('posts', 'site', 'export'):
+        if changes.get(key) and any(changes[key].values()):
+            return True
+    if changes.get('graph') or changes.get('search'):
+        return True
+    return any(method != 'skip' for method in changes.get('assets') or {})
+
+
+class Target():
+    """
+    发布目标: 发布标签, 额外的排除规则, 输出目录和输出格式 (hexo, native, markdown, json)\n
+    多个目标共用一次扫描, 解析, 嵌入展开和链接图, 每个目标只生成带自己发布标签的笔记; 反向链接只来自同一个目标中的笔记,
+    不会把其他目标的笔记标题带到这个目标
+    """
 
-    notes, share_notes = get_all_notes(path_from, exclude, share_tag, resource)
-    gen_hexo_notes(notes, share_notes, path_to, resource)
-    deploy_hexo(path_to)
+    def __init__(self, settings, path_from, streaming=False):
+        self.settings = settings
+        self.name = settings['name']
+        self.excluder = None
+        if settings['exclude']:
+            # 和顶层的排除规则一样处理绝对路径, .obsidianignore 已经在扫描时排除
+            self.excluder = ExcludeMatcher.from_settings(path_from, settings['exclude'], False)
+        self.deployer = None
+        if settings['renderer'] not in FLAVOURS:
+            self.deployer = HexoDeployer(settings['path_to'], settings['renderer'])
+        self.search = SearchIndex(keep_terms=not streaming)
+        self.members = set()
+
+    def get_notes(self, share_notes):
+        """ 属于这个目标的发布笔记 """
+        notes = []
+        for note in share_notes:
+            if self.settings['share_tag'] not in note.shares:
+                continue
+            if self.excluder is not None and self.excluder.is_excluded(note.file_path):
+                continue
+            notes.append(note)
+        self.members = set(note.file_path for note in notes)
+        return notes
+
+    def get_cache_path(self, name):
+        return get_full_relative_path(f"{self.settings['cache_dir']}/{name}")
+
+    def get_folders(self):
+        """ 关系图和搜索索引的输出目录 """
+        settings = self.settings
+        if settings['renderer'] in FLAVOURS:
+            return [settings['path_to']]
+        folders = [f"{settings['path_to']}/source"]
+        if settings['renderer'] == 'native':
+            folders.append(settings['site_dir'])
+        return folders
+
+
+class Publisher():
+    """
+    发布流程\n
+    watch 模式下常驻内存, 保留笔记, 资源索引和提交历史, 只重新解析变化的笔记\n
+    streaming 模式下笔记只保留链接图需要的元数据, 正文在生成时分批从构建缓存读取, 写入后释放, 内存占用和仓库大小基本无关\n
+    配置了多个发布目标时只扫描, 解析和链接一次, 各目标依次生成 (共用进程池), 部署同时进行
+    """
+
+    def __init__(self, settings, jobs=1, dry_run=False, full_scan=False, snapshot=None, streaming=False):
+        """ snapshot: 发布指定 commit (如 HEAD) 中的内容, None 表示发布工作区; streaming: 单次运行时使用, watch 模式不能使用 """
+        self.settings = settings
+        self.dry_run = dry_run
+        self.full_scan = full_scan
+        self.streaming = streaming
+        self.snapshot = None if snapshot is None else GitSnapshot(settings['path_from'], snapshot)
+        self.history = GitHistory(settings['path_from'], get_full_relative_path("cache/git_history.json"))
+        self.targets = [Target(target, settings['path_from'], streaming)
+                        for target in settings.get('targets') or [get_target(settings)]]
+        self.share_tags = sorted(set(target.settings['share_tag'] for target in self.targets))
+        # 发布标签不影响缓存, 标签变化时只重新解析带了增减的标签的笔记
+        self.cache = BuildCache(get_full_relative_path("cache/build.db"), {
+            'path_from': settings['path_from'],
+            'resource': settings['resource'],
+        })
+        if self.snapshot is not None and settings['resource'].startswith(settings['path_from'] + os.sep):
+            self.res_index = SnapshotResourceIndex(settings['resource'], self.snapshot, get_full_relative_path("cache/blobs"))
+        else:
+            if self.snapshot is not None:
+                logger.warning(f"resource folder is not in the vault repository, use working tree: {settings['resource']}")
+            self.res_index = ResourceIndex(settings['resource'], get_full_relative_path("cache/resource_index.json"))
+        self.executor = None
+        if jobs > 1:
+            self.executor = ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(logger.get_process_queue(),))
+        # 快照模式下工作区的文件时间和内容无关, 不使用
+        self.date_resolver = DateResolver(settings['date_sources'], self.history, self.cache,
+                                          get_full_relative_path("cache/dates.json"), self.snapshot is None)
+        self.graph = LinkGraph(get_full_relative_path("cache/link_graph.json")).load()
+        self.excluder = ExcludeMatcher.from_settings(settings['path_from'], settings['exclude'])
+        self.optimizer = None
+        if settings['image_optimize']:
+            self.optimizer = ImageOptimizer(get_full_relative_path("cache/images"), settings['image_widths'],
+                                            settings['image_formats'], settings['image_quality'], self.executor, dry_run)
+        self.optimized = {}
+        self.transcluder = None
+        self.notes = {}
+
+    def get_notes(self):
+        notes = [self.notes[file_path] for file_path in sorted(self.notes)]
+        share_notes = [note for note in notes if note.check_share()]
+        return notes, share_notes
+
+    def build(self):
+        """ 生成全部笔记, 返回输出的变化; 记录了上次发布的 commit 时只处理 git 中变化的文件, 否则全量扫描 """
+        if self.snapshot is not None:
+            return self.build_snapshot()
+        settings = self.settings
+        with profiler.stage('git_history'):
+            self.history.update()
+        with profiler.stage('resource_index'):
+            self.res_index.update()
+        head = self.history.head
+        with profiler.stage('git_diff'):
+            dirty = get_dirty_paths(settings['path_from']) if head is not None else None
+            paths = self.get_git_changes(head, dirty)
+        if paths is None:
+            notes, share_notes = get_all_notes(settings['path_from'], self.excluder, self.share_tags,
+                                               self.res_index, self.date_resolver, self.cache, self.executor,
+                                               self.streaming)
+            self.notes = {note.file_path: note for note in notes}
+            changes = self.generate()
+        else:
+            changes = self.build_changed(paths)
+        if not self.dry_run:
+            self.save_published(head, dirty)
+        return changes
+
+    def build_snapshot(self):
+        """ 只发布快照中的笔记和资源, 不读取工作区, 笔记内容和提交时间一致 """
+        settings = self.settings
+        with profiler.stage('git_snapshot'):
+            self.snapshot.open()
+        with profiler.stage('git_history'):
+            self.history.update(self.snapshot.commit)
+        with profiler.stage('resource_index'):
+            self.res_index.update()
+        file_paths = self.snapshot.get_paths(self.excluder, '.md')
+        notes = load_notes(settings['path_from'], file_paths, self.share_tags, self.res_index, self.date_resolver,
+                           self.cache, self.executor, snapshot=self.snapshot, release=self.streaming)
+        self.notes = {note.file_path: note for note in notes}
+        changes = self.generate()
+        if not self.dry_run:
+            if isinstance(self.res_index, SnapshotResourceIndex):
+                self.res_index.prune()
+            # 输出和这个 commit 的内容一致, 下次发布工作区时从这里开始比较
+            self.save_published(self.snapshot.commit, set())
+        return changes
+
+    def get_exclude_signature(self):
+        return get_text_hash(json.dumps(self.excluder.sources, ensure_ascii=False))
+
+    def get_git_changes(self, head, dirty):
+        """
+        返回上次发布之后 git 中新增, 修改, 删除和重命名的文件 (包括未提交的修改) 的绝对路径\n
+        没有发布记录, 历史被改写, 排除规则变化或者缓存不完整时返回 None, 需要全量扫描
+        """
+        published = self.cache.get_meta('published_commit')
+        if self.full_scan or head is None or dirty is None or published is None:
+            return None
+        if self.cache.get_meta('published_excludes') != self.get_exclude_signature():
+            logger.info("exclude rules changed, full scan")
+            return None
+        if not self.cache.get_paths() or not os.path.exists(self.graph.cache_path):
+            return None
+        path_from = self.settings['path_from']
+        paths = get_diff_paths(path_from, published, head)
+        if paths is None:
+            return None
+        # 上次发布时未提交的修改之后可能被撤销, git 中看不到, 也要重新处理
+        paths |= dirty | set(json.loads(self.cache.get_meta('published_dirty') or '[]'))
+        logger.info(f"git changes since {published}: {len(paths)} files")
+        profiler.count('git_changes', len(paths))
+        return set(os.path.join(path_from, replace_by_sep(path)) for path in paths)
+
+    def build_changed(self, paths):
+        """ 没有变化的笔记直接使用缓存记录, 不遍历目录, 只处理变化的文件和受影响的笔记 """
+        settings = self.settings
+        path_from = settings['path_from']
+        file_paths = sorted(path for path in self.cache.get_paths() if path not in paths)
+        for note in load_notes(path_from, file_paths, self.share_tags, self.res_index, self.date_resolver,
+                               self.cache, self.executor, trusted=set(file_paths), release=self.streaming):
+            self.notes[note.file_path] = note
+        # 资源目录不在笔记仓库中时 git 看不到资源的变化, 检查全部缓存记录
+        res_changed = not settings['resource'].startswith(path_from + os.sep)
+        changes = self.update(paths, res_changed)
+        if changes is None:
+            changes = self.generate(False, set(), set())
+        return changes
+
+    def save_published(self, head, dirty):
+        """ 记录本次发布的 commit 和未提交的修改, 下次运行从这里开始比较 """
+        if head is None or dirty is None:
+            self.cache.set_meta('published_commit', None)
+            return
+        self.cache.set_meta('published_commit', head)
+        self.cache.set_meta('published_dirty', json.dumps(sorted(dirty), ensure_ascii=False))
+        self.cache.set_meta('published_excludes', self.get_exclude_signature())
+
+    def add_published_dirty(self, paths):
+        """
+        watch 模式不会记录发布的 commit, 处理过的文件加入 published_dirty,
+        之后在 git 中撤销这些修改时, 下次运行仍然重新检查它们而不是直接使用缓存
+        """
+        published_dirty = self.cache.get_meta('published_dirty')
+        if self.dry_run or self.cache.get_meta('published_commit') is None or published_dirty is None:
+            return
+        path_from = self.settings['path_from']
+        dirty = set(json.loads(published_dirty))
+        dirty.update(os.path.relpath(path, path_from).replace(os.sep, '/') for path in paths
+                     if path.startswith(path_from + os.sep))
+        self.cache.set_meta('published_dirty', json.dumps(sorted(dirty), ensure_ascii=False))
+
+    def update(self, paths, res_changed=False):
+        """ 根据修改的文件增量生成, 返回输出的变化, 笔记和资源都没有变化时返回 None """
+        settings = self.settings
+        path_from = settings['path_from']
+        resource = settings['resource']
+        note_paths = set()
+        for path in paths:
+            if path.startswith(resource + os.sep):
+                res_changed = True
+            elif path.startswith(path_from + os.sep) and path.endswith('.md') and not self.excluder.is_excluded(path):
+                note_paths.add(path)
+        if not note_paths and not res_changed:
+            return None
+        self.add_published_dirty(paths)
+
+        head = self.history.head
+        with profiler.stage('git_history'):
+            self.history.update()
+        # 有新的提交时重新解析日期, 日期变化的文章在 generate 中重新生成
+        if self.history.head != head:
+            for note in self.notes.values():
+                if note.is_loaded:
+                    note.update_dates()
+        if res_changed:
+            with profiler.stage('resource_index'):
+                self.res_index.update()
+            # 只被嵌入的笔记没有 load 但解析过, 引用的资源同样可能失效, 重新加载后展开时再解析
+            for note in self.notes.values():
+                if note.is_parsed and not is_record_fresh(note.to_record(), self.res_index, self.share_tags):
+                    if not note.is_loaded:
+                        note.is_parsed = False
+                    note_paths.add(note.file_path)
+        # 嵌入了修改过的笔记的文章需要重新展开
+        embed_paths = set(note.file_path for note in self.notes.values() if note.embed_paths & note_paths)
+
+        old_notes = {}
+        for file_path in note_paths:
+            old_notes[file_path] = self.notes.pop(file_path, None)
+            if not os.path.exists(file_path):
+                logger.info("note removed: %s", file_path)
+                self.cache.remove(file_path)
+                self.date_resolver.remove(file_path)
+        file_paths = sorted(file_path for file_path in note_paths if os.path.exists(file_path))
+        for note in load_notes(path_from, file_paths, self.share_tags, self.res_index, self.date_resolver,
+                               self.cache, self.executor, release=self.streaming):
+            self.notes[note.file_path] = note
+
+        # 笔记新增, 删除或者别名变化时其他笔记的双链可能指向别的笔记, 需要重新解析全部双链
+        relink_paths = note_paths | embed_paths
+        for file_path, old_note in old_notes.items():
+            note = self.notes.get(file_path)
+            if old_note is None or note is None or old_note.aliases != note.aliases:
+                relink_paths = None
+                break
+        return self.generate(False, relink_paths, note_paths | embed_paths)
+
+    def link(self, notes, share_notes, relink_paths=None):
+        """ 更新链接图, relink_paths 为 None 时解析全部发布笔记, 返回反向链接或脑图变化的笔记 """
+        self.transcluder = Transcluder(LinkResolver(notes), get_link_path)
+        if relink_paths is None:
+            changed = resolve_links(self.transcluder, share_notes, self.graph, release=self.streaming)
+        else:
+            # 根据 git 变化生成时没有展开过的文章不知道嵌入了哪些笔记, 有嵌入的重新展开; 内置渲染和导出需要全部文章的正文
+            native = any(target.settings['renderer'] != 'hexo' for target in self.targets)
+            sources = [note for note in share_notes if note.file_path in relink_paths
+                       or (note.body is None and (note.embeds or native))]
+            changed = resolve_links(self.transcluder, sources, self.graph, False, self.streaming)
+            share_paths = set(note.file_path for note in share_notes)
+            for file_path in relink_paths:
+                if file_path not in share_paths:
+                    changed |= self.graph.remove(file_path)
+        logger.info(f"link graph: {len(self.graph.get_sources())} notes with links, {self.graph.count_edges()} links, "
+                    f"backlinks/mindmap changed: {len(changed)}")
+        for file_path in sorted(changed):
+            logger.debug("links changed: %s", file_path)
+        profiler.count('links_changed', len(changed))
+        return changed
+
+    def load_body(self, target, note):
+        """ 生成前展开还没有正文的笔记, 并按发布目标生成这篇笔记的反向链接和脑图 """
+        if note.body is None:
+            load_body(self.transcluder, note)
+        apply_links(note, self.notes, self.graph, target.members)
+
+    def release_body(self, note):
+        note.release()
+        self.transcluder.forget(note.file_path)
+
+    def optimize_images(self, share_notes):
+        """ 生成优化后的图片, 返回图片标签变化需要重新生成的笔记 """
+        if self.optimizer is not None:
+            images = {}
+            for note in share_notes:
+                for img in note.get_all_images():
+                    path = self.res_index.get_full_path(img)
+                    if path is None:
+                        logger.warning(f"image not found, skip: {img} in {note.file_path}")
+                        continue
+                    images[img] = path
+            self.optimized = self.optimizer.optimize(images)
+            profiler.count('images_optimized', len(self.optimized))
+        changed = set()
+        for note in share_notes:
+            image_html = {img: self.optimized[img][1] for img in note.get_all_images() if img in self.optimized}
+            if image_html != note.image_html:
+                note.image_html = image_html
+                changed.add(note.file_path)
+        return changed
+
+    def generate(self, prune=True, relink_paths=None, render_paths=None):
+        """
+        relink_paths: 需要重新解析双链的笔记, None 表示全部\n
+        render_paths: 需要重新生成的笔记, 反向链接或脑图变化的笔记也会重新生成, None 表示全部\n
+        返回 {'links': 链接变化的笔记, 'targets': {目标名: 输出的变化}}, 输出的变化见 generate_target
+        """
+        notes, share_notes = self.get_notes()
+        unlinked = set(note.file_path for note in share_notes if note.body is None and note.embeds)
+        with profiler.stage('link_resolve'):
+            changed = self.link(notes, share_notes, relink_paths)
+        with profiler.stage('image_optimize'):
+            images_changed = self.optimize_images(share_notes)
+        dated = self.date_resolver.pop_changed()
+        if render_paths is not None:
+            render_paths = set(render_paths) | changed | images_changed | unlinked | dated
+        changes = {'links': sorted(changed), 'targets': {}}
+        for target in self.targets:
+            start = time.perf_counter()
+            changes['targets'][target.name] = self.generate_target(target, share_notes, render_paths)
+            profiler.record(f"targets/{target.name}", time.perf_counter() - start)
+        if not self.dry_run:
+            self.cache.save(prune)
+            self.date_resolver.save(prune)
+            self.graph.save()
+        return changes
+
+    def generate_target(self, target, share_notes, render_paths=None):
+        """
+        生成一个发布目标, 解析和链接的结果所有目标共用\n
+        返回 {'posts': 文章变化, 'assets': 资源同步统计, 'site': 内置渲染的页面变化, 'export': 导出的变化, 'graph': 关系图是否变化,
+        'search': 搜索索引是否变化}
+        """
+        settings = target.settings
+        share_notes = target.get_notes(share_notes)
+        logger.info(f"publish target {target.name}: {len(share_notes)} notes, {settings['renderer']} -> {settings['path_to']}")
+        loader = partial(self.load_body, target)
+        releaser = self.release_body if self.streaming else None
+        changes = {'posts': None, 'site': None, 'export': None}
+        if settings['renderer'] in FLAVOURS:
+            changes['export'] = gen_export(share_notes, settings, self.cache, self.dry_run, loader, releaser)
+            resource_folder = settings['path_to']
+        else:
+            changes['posts'] = gen_hexo_notes(share_notes, settings['path_to'], self.cache, self.executor, self.dry_run,
+                                              render_paths, loader, releaser, settings['output_prefix'])
+            resource_folder = f"{settings['path_to']}/source"
+        changes['assets'] = gen_resources(share_notes, resource_folder, target.get_cache_path("resources.json"),
+                                          self.res_index, settings['resource_link'], self.dry_run, self.optimized)
+        if settings['renderer'] == 'native':
+            changes['site'] = gen_site(share_notes, settings, self.cache, self.res_index, self.executor, self.dry_run,
+                                       self.optimized, loader, releaser)
+        folders = target.get_folders()
+        changes['graph'] = gen_graph(share_notes, self.graph, folders, self.dry_run)
+        if settings['search']:
+            with profiler.stage('search_index'):
+                changes['search'] = gen_search(share_notes, target.search, folders, self.cache, self.dry_run)
+        if not self.dry_run and target.deployer is not None and is_changed(changes):
+            # 部署成功前一直保留, 上次部署失败时下次运行会重新部署
+            self.cache.set_meta(settings['deploy_key'], '1')
+        return changes
+
+    def get_pending_targets(self):
+        """ 有未部署的变化的目标, 导出的目标不需要部署 """
+        return [target for target in self.targets
+                if target.deployer is not None and self.cache.get_meta(target.settings['deploy_key']) is not None]
+
+    def is_deploy_pending(self):
+        return len(self.get_pending_targets()) > 0
+
+    def prefetch(self):
+        for target in self.targets:
+            if target.deployer is not None:
+                target.deployer.prefetch()
+
+    def deploy(self):
+        """ 部署有未部署的变化的目标, 多个目标同时部署, 任一目标失败返回 False """
+        targets = self.get_pending_targets()
+        if not targets:
+            logger.info("nothing changed, skip deploy")
+            return True
+        if len(targets) == 1:
+            results = [targets[0].deployer.deploy()]
+        else:
+            with ThreadPoolExecutor(len(targets)) as executor:
+                results = list(executor.map(lambda target: target.deployer.deploy(), targets))
+        for target, result in zip(targets, results):
+            if result:
+                self.cache.set_meta(target.settings['deploy_key'], None)
+            else:
+                logger.error(f"deploy target failed: {target.name}")
+        return all(results)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.cache.close()
+
+
+def save_report(jobs, watch_mode=False):
+    """ 写入本次运行的报告, watch 模式下每轮生成写一份 """
+    report_path = profiler.save(get_full_relative_path("report"), keep_profile=watch_mode, jobs=jobs, watch=watch_mode)
+    profiler.reset()
+    return report_path
+
+
+def watch(publisher, jobs=1):
+    """ 监听笔记和资源目录, 修改后增量生成, 按 deploy_interval 间隔部署 """
+    settings = publisher.settings
+    paths = [settings['path_from']]
+    if not settings['resource'].startswith(settings['path_from'] + os.sep):
+        paths.append(settings['resource'])
+    publisher.prefetch()
+    publisher.build()
+    save_report(jobs, True)
+    watcher = Watcher(paths, settings['watch_debounce']).start()
+
+    pending_deploy = publisher.is_deploy_pending()
+    last_deploy = 0
+    try:
+        while True:
+            timeout = None
+            if pending_deploy:
+                timeout = max(0, last_deploy + settings['deploy_interval'] - time.time())
+            changes = watcher.wait(timeout)
+            profiler.reset()
+            updated = False
+            if changes:
+                logger.info(f"watch changes: {len(changes)}")
+                try:
+                    updated = publisher.update(changes) is not None
+                    if updated and publisher.is_deploy_pending():
+                        pending_deploy = True
+                        publisher.prefetch()
+                except Exception as e:
+                    logger.error(f'watch update Exception:{e} trackback:{traceback.format_exc()}')
+            if pending_deploy and time.time() - last_deploy >= settings['deploy_interval']:
+                # 部署失败时保留 pending, 间隔 deploy_interval 后重试
+                pending_deploy = not publisher.deploy()
+                last_deploy = time.time()
+                updated = True
+            if updated:
+                save_report(jobs, True)
+    except KeyboardInterrupt:
+        logger.info("watch stopped")
+    finally:
+        watcher.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="publish obsidian notes to hexo")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="parallel parse/render processes, 1 to disable")
+    parser.add_argument('-w', '--watch', action='store_true', help="keep running and republish on changes")
+    parser.add_argument('-n', '--dry-run', action='store_true', help="only report which posts and resources would change")
+    parser.add_argument('-f', '--full-scan', action='store_true', help="scan the whole vault instead of git changes since the last publish")
+    parser.add_argument('-s', '--snapshot', nargs='?', const='HEAD', metavar='COMMIT',
+                        help="publish the notes and resources of a commit (default HEAD) instead of the working tree")
+    parser.add_argument('-p', '--profile', choices=['cprofile', 'tracemalloc'], help="profile the run, results go to the run report")
+    args = parser.parse_args()
+    if args.watch and args.snapshot is not None:
+        parser.error("--snapshot can not be used with --watch")
+    if args.watch and args.dry_run:
+        parser.error("--dry-run can not be used with --watch")
+    return args
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    # 只在主进程写日志文件, spawn 启动的子进程重新导入本模块时不会再打开文件
+    logger.set_handler("file")
+    args = parse_args()
+    settings = get_settings(load_config())
+
+    logger.info(f"\npath_from:\t{settings['path_from']}\n"
+                f"path_to:\t{settings['path_to']}\n"
+                f"resource:\t{settings['resource']}\n"
+                f"exclude:\t{settings['exclude']}\n"
+                f"share_tag:\t{settings['share_tag']}\n"
+                f"targets:\t{[target['name'] for target in settings['targets']]}\n")
+
+    exit_code = 0
+    profiler.start(args.profile)
+    # 单次运行时流式生成, watch 模式需要常驻全部笔记
+    publisher = Publisher(settings, args.jobs, args.dry_run, args.full_scan, args.snapshot, not args.watch)
+    if args.watch:
+        watch(publisher, args.jobs)
+        # 最后一份报告带上整个 watch 期间的 profile 结果
+        profiler.save(get_full_relative_path("report"), jobs=args.jobs, watch=True)
+    else:
+        if not args.dry_run:
+            publisher.prefetch()
+        publisher.build()
+        if not args.dry_run and not publisher.deploy():
+            exit_code = 1
+        save_report(args.jobs)
+    publisher.close()
+    sys.exit(exit_code)
@@ -0,0 +1,85 @@
+// 前端搜索: 按查询词的首字下载 search/ 下对应的分片, 分词和分片规则与 util/search_index.py 一致
+(function () {
+  var script = document.currentScript;
+  var root = (script && script.getAttribute('data-root')) || '';
+  var base = root + '/search/';
+  var wordPattern = /[0-9a-z]+|[぀-ヿ㐀-鿿豈-﫿가-힯]+/g;
+  var cache = {};
+  var meta = null;
+
+  function load(name) {
+    if (!cache[name]) {
+      cache[name] = fetch(base + name).then(function (response) {
+        return response.ok ? response.json() : {};
+      });
+    }
+    return cache[name];
+  }
+
+  function tokenize(text) {
+    var terms = [];
+    (text.toLowerCase().match(wordPattern) || []).forEach(function (word) {
+      if (word.charCodeAt(0) < 0x80) {
+        if (word.length > 1 && word.length <= 32) terms.push(word);
+      } else if (word.length === 1) {
+        terms.push(word);
+      } else {
+        for (var i = 0; i < word.length - 1; i++) terms.push(word.substr(i, 2));
+      }
+    });
+    return terms;
+  }
+
+  function getShard(term, shards) {
+    var code = term.charCodeAt(0);
+    if (code < 0x80) return term[0];
+    var index = (code % shards).toString(16);
+    return 'u' + (index.length < 2 ? '0' + index : index);
+  }
+
+  // 返回包含全部查询词的文章 [{title, url, date, score}], 按权重排序
+  function search(query) {
+    var terms = tokenize(query).filter(function (term, i, all) { return all.indexOf(term) === i; });
+    if (!terms.length) return Promise.resolve([]);
+    return load('docs.json').then(function (docs) {
+      meta = docs;
+      return Promise.all(terms.map(function (term) {
+        return load(getShard(term, meta.shards) + '.json').then(function (shard) { return shard[term] || []; });
+      }));
+    }).then(function (postings) {
+      var scores = null;
+      postings.forEach(function (list) {
+        var next = {};
+        list.forEach(function (posting) {
+          if (scores === null || posting[0] in scores) next[posting[0]] = (scores ? scores[posting[0]] : 0) + posting[1];
+        });
+        scores = next;
+      });
+      return Object.keys(scores).map(function (key) {
+        var doc = meta.docs[key];
+        return {title: doc[0], url: root + doc[1], date: doc[2], score: scores[key]};
+      }).sort(function (a, b) { return b.score - a.score; });
+    });
+  }
+
+  window.noteSearch = search;
+
+  var input = document.getElementById('search');
+  var results = document.getElementById('search-results');
+  if (!input || !results) return;
+  input.addEventListener('input', function () {
+    var query = input.value;
+    search(query).then(function (items) {
+      if (input.value !== query) return;
+      results.innerHTML = '';
+      items.slice(0, 50).forEach(function (item) {
+        var li = document.createElement('li');
+        var a = document.createElement('a');
+        a.href = item.url;
+        a.textContent = item.title;
+        li.appendChild(a);
+        results.appendChild(li);
+      });
+    });
+  });
+})();
@@ -0,0 +1,64 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from util.dates import DATE_SOURCES  # noqa: E402
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding='utf-8', newline='') as f:
+        f.write(content)
+
+
+def read_file(path):
+    with open(path, "r", encoding='utf-8') as f:
+        return f.read()
+
+
+def git(repo, *args):
+    return subprocess.check_output(['git', '-C', repo, '-c', 'user.name=test', '-c', 'user.email=test@test',
+                                    '-c', 'commit.gpgsign=false'] + list(args)).decode()
+
+
+def get_settings(vault, path_to, **options):
+    """ 测试用的配置, 和 get_settings 的结果一致 """
+    resource = os.path.join(vault, 'res')
+    settings = {
+        'path_from': vault,
+        'path_to': path_to,
+        'resource': resource,
+        'exclude': [resource, '.git'],
+        'share_tag': 'share',
+        'resource_link': 'copy',
+        'deploy_interval': 300,
+        'watch_debounce': 2,
+        'renderer': 'hexo',
+        'site_dir': os.path.join(path_to, 'public'),
+        'template_dir': os.path.join(ROOT_DIR, 'template'),
+        'site_title': 'test',
+        'site_url': '',
+        'image_optimize': False,
+        'image_widths': [640],
+        'image_formats': ['webp'],
+        'image_quality': 80,
+        'search': False,
+        'date_sources': DATE_SOURCES,
+    }
+    settings.update(options)
+    return settings
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """ 缓存和报告写到临时目录 (get_full_relative_path 基于 sys.argv[0]) """
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    monkeypatch.setattr(sys, 'argv', [str(work_dir / 'obsidian2hexo.py')])
+    (tmp_path / 'vault' / 'res').mkdir(parents=True)
+    return tmp_path
@@ -0,0 +1,20 @@
+import sys
+
+import pytest
+
+import obsidian2hexo
+
+
+@pytest.mark.parametrize('argv', [['-w', '-n'], ['--watch', '--dry-run'], ['-w', '-s']])
+def test_parse_args_rejects_watch_combinations(argv, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['obsidian2hexo.py'] + argv)
+    with pytest.raises(SystemExit) as e:
+        obsidian2hexo.parse_args()
+    assert e.value.code == 2
+    assert "can not be used with --watch" in capsys.readouterr().err
+
+
+def test_parse_args_accepts_dry_run(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['obsidian2hexo.py', '-n'])
+    args = obsidian2hexo.parse_args()
+    assert args.dry_run and not args.watch
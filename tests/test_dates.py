@@ -0,0 +1,36 @@
+import os
+
+import obsidian2hexo
+from conftest import write_file, read_file, git, get_settings
+
+COMMIT_DATE = '2020-01-02 03:04:05'
+
+
+def publish(settings):
+    publisher = obsidian2hexo.Publisher(settings)
+    try:
+        publisher.build()
+    finally:
+        publisher.close()
+
+
+def test_default_date_sources_prefer_git_over_file_time(workspace, monkeypatch):
+    """ 默认配置下已经提交的笔记使用提交时间, 而不是 clone 或同步后的文件时间 """
+    vault = str(workspace / 'vault')
+    path_to = str(workspace / 'hexo')
+    write_file(os.path.join(vault, 'a.md'), "#share\n正文\n")
+    write_file(os.path.join(vault, 'b.md'), "#share\n没有提交\n")
+    git(vault, 'init', '-q')
+    monkeypatch.setenv('GIT_AUTHOR_DATE', f"{COMMIT_DATE} +0000")
+    monkeypatch.setenv('GIT_COMMITTER_DATE', f"{COMMIT_DATE} +0000")
+    monkeypatch.setenv('TZ', 'UTC')
+    git(vault, 'add', 'a.md')
+    git(vault, 'commit', '-qm', 'init')
+
+    publish(get_settings(vault, path_to))
+
+    posts_folder = os.path.join(path_to, 'source', '_posts')
+    a_post = read_file(os.path.join(posts_folder, f"{obsidian2hexo.get_sha1(os.path.join(vault, 'a.md'))}.md"))
+    b_post = read_file(os.path.join(posts_folder, f"{obsidian2hexo.get_sha1(os.path.join(vault, 'b.md'))}.md"))
+    assert f"date: {COMMIT_DATE}\n" in a_post
+    assert f"date: {COMMIT_DATE}\n" not in b_post
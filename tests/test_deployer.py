@@ -0,0 +1,54 @@
+import threading
+
+import util.deployer
+from util.deployer import HexoDeployer
+from conftest import write_file, git
+
+
+def record_commands(monkeypatch):
+    """ 记录执行的命令和同时运行的最大数量, 不真正执行 """
+    calls = []
+    running = {'now': 0, 'max': 0}
+    lock = threading.Lock()
+    both_started = threading.Barrier(2)
+
+    def run_command(order, cwd):
+        with lock:
+            calls.append(order)
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        # hexo d 和源码仓库的第一条命令互相等待, 串行时超时后继续
+        if order in ("hexo d", "git status --porcelain"):
+            try:
+                both_started.wait(0.5)
+            except threading.BrokenBarrierError:
+                pass
+        with lock:
+            running['now'] -= 1
+        return ['M a.md'] if order == "git status --porcelain" else []
+    monkeypatch.setattr(util.deployer, 'run_command', run_command)
+    return calls, running
+
+
+def test_deploy_runs_sequentially_when_outputs_are_not_ignored(tmp_path, monkeypatch):
+    hexo_path = str(tmp_path)
+    git(hexo_path, 'init', '-q')
+    write_file(str(tmp_path / '.gitignore'), "db.json\n")
+    calls, running = record_commands(monkeypatch)
+
+    assert HexoDeployer(hexo_path).deploy()
+    assert running['max'] == 1
+    assert calls[:3] == ["hexo g", "hexo d", "git status --porcelain"]
+    assert calls[-1] == "git push"
+
+
+def test_deploy_runs_concurrently_when_outputs_are_ignored(tmp_path, monkeypatch):
+    hexo_path = str(tmp_path)
+    git(hexo_path, 'init', '-q')
+    write_file(str(tmp_path / '.gitignore'), "public/\n.deploy_git/\ndb.json\nnode_modules/\n")
+    calls, running = record_commands(monkeypatch)
+
+    assert HexoDeployer(hexo_path).deploy()
+    assert running['max'] == 2
+    assert calls[0] == "hexo g"
+    assert "hexo d" in calls and "git push" in calls
@@ -0,0 +1,33 @@
+import os
+
+import obsidian2hexo
+from util.exclude import ExcludeMatcher
+
+
+def test_exclude_skips_path_on_another_drive(tmp_path, monkeypatch):
+    """ windows 上不同盘符的路径 relpath 抛出 ValueError, 跳过这条规则而不是中断 """
+    root_dir = str(tmp_path / 'vault')
+    other_drive = str(tmp_path / 'other')
+    relpath = os.path.relpath
+
+    def fake_relpath(path, start=os.curdir):
+        if path.startswith(other_drive):
+            raise ValueError("path is on mount 'D:', start on mount 'C:'")
+        return relpath(path, start)
+    monkeypatch.setattr(os.path, 'relpath', fake_relpath)
+
+    excluder = ExcludeMatcher.from_settings(root_dir, [other_drive, os.path.join(root_dir, 'res'), 'stash'])
+    assert excluder.sources == ['.git/', '/res', 'stash']
+    assert excluder.is_excluded(os.path.join(root_dir, 'res', 'a.png'))
+    assert excluder.is_excluded(os.path.join(other_drive, 'a.md'))
+    assert not excluder.is_excluded(os.path.join(root_dir, 'a.md'))
+
+
+def test_target_exclude_accepts_absolute_paths(tmp_path):
+    path_from = str(tmp_path / 'vault')
+    settings = {'name': 'wiki', 'exclude': [os.path.join(path_from, 'private'), 'draft.md'], 'renderer': 'markdown'}
+    target = obsidian2hexo.Target(settings, path_from)
+
+    assert target.excluder.is_excluded(os.path.join(path_from, 'private', 'a.md'))
+    assert target.excluder.is_excluded(os.path.join(path_from, 'sub', 'draft.md'))
+    assert not target.excluder.is_excluded(os.path.join(path_from, 'public', 'a.md'))
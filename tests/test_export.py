@@ -0,0 +1,34 @@
+import os
+
+import obsidian2hexo
+from util.staged_writer import StagedWriter
+from conftest import write_file, get_settings
+
+
+def test_export_stages_inside_the_export_folder(workspace, monkeypatch):
+    """ 导出目标是用户的目录, 暂存文件不能写到它的上级目录 """
+    vault = str(workspace / 'vault')
+    path_to = str(workspace / 'out' / 'export')
+    write_file(os.path.join(vault, 'a.md'), "#share\n正文 [[b]]\n")
+    write_file(os.path.join(vault, 'b.md'), "#share\n另一篇\n")
+    stagings = []
+    init = StagedWriter.__init__
+
+    def record_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        stagings.append(self.staging)
+    monkeypatch.setattr(StagedWriter, '__init__', record_init)
+
+    publisher = obsidian2hexo.Publisher(get_settings(vault, path_to, renderer='markdown', search=True))
+    try:
+        publisher.build()
+    finally:
+        publisher.close()
+
+    assert stagings
+    for staging in stagings:
+        assert staging.startswith(path_to + os.sep), staging
+    assert os.listdir(workspace / 'out') == ['export']
+    names = sorted(os.listdir(path_to))
+    assert 'graph.json' in names and 'index.json' in names and 'search' in names
+    assert not [name for name in names if name.startswith('.')]
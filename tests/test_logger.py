@@ -0,0 +1,28 @@
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler
+from concurrent.futures import ProcessPoolExecutor
+
+import obsidian2hexo
+
+
+def log_in_worker():
+    """ 子进程中记录一条日志, 返回子进程 logger 上写文件的 handler """
+    obsidian2hexo.logger.warning("from worker %s", 1)
+    return [type(handler).__name__ for handler in obsidian2hexo.logger.logger.handlers
+            if isinstance(handler, logging.FileHandler)]
+
+
+def test_import_does_not_open_log_file():
+    assert not [handler for handler in obsidian2hexo.logger.logger.handlers
+                if isinstance(handler, (logging.FileHandler, QueueHandler))]
+
+
+def test_spawned_worker_forwards_records_to_parent_queue():
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    with ProcessPoolExecutor(1, mp_context=context, initializer=obsidian2hexo.init_worker, initargs=(queue,)) as executor:
+        file_handlers = executor.submit(log_in_worker).result()
+    assert file_handlers == []
+    record = queue.get(timeout=10)
+    assert record.getMessage() == "from worker 1"
@@ -0,0 +1,32 @@
+import os
+
+from util.resource_index import ResourceIndex
+from conftest import write_file
+
+
+def test_resource_index_sees_files_edited_in_place(tmp_path):
+    resource = str(tmp_path / 'res')
+    image_path = os.path.join(resource, 'sub', 'x.png')
+    write_file(image_path, "old")
+    cache_path = str(tmp_path / 'cache' / 'resource_index.json')
+    assert ResourceIndex(resource, cache_path).update().get_size('x.png') == 3
+
+    dir_stat = os.stat(os.path.dirname(image_path))
+    write_file(image_path, "edited")
+    # 原地修改文件不改变目录的修改时间
+    os.utime(os.path.dirname(image_path), ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+    index = ResourceIndex(resource, cache_path).update()
+    assert index.get_size('x.png') == 6
+    assert index.paths['sub/x.png'][1] == os.stat(image_path).st_mtime_ns
+
+
+def test_resource_index_matches_basename_only_for_bare_names(tmp_path):
+    resource = str(tmp_path / 'res')
+    write_file(os.path.join(resource, 'sub', 'x.png'), "x")
+    write_file(os.path.join(resource, 'sub', 'deep', 'x.png'), "x")
+    index = ResourceIndex(resource).update()
+
+    assert index.get_path('x.png') == 'sub/x.png'
+    assert index.get_path('sub/deep/x.png') == 'sub/deep/x.png'
+    assert index.get_path('other/x.png') is None
+    assert not index.exists('deep/x.png')
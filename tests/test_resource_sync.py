@@ -0,0 +1,20 @@
+import os
+
+from util.resource_sync import ResourceSync, is_same_file
+from conftest import write_file, read_file
+
+
+def test_sync_skips_missing_source(tmp_path):
+    path_to = str(tmp_path / 'source')
+    from_path = str(tmp_path / 'res' / 'a.png')
+    write_file(from_path, "a")
+    write_file(os.path.join(path_to, 'images', 'b.png'), "b")
+    sync = ResourceSync(path_to, str(tmp_path / 'cache' / 'resources.json'), 'copy')
+
+    counts = sync.sync({'images/a.png': from_path, 'images/b.png': None,
+                        'images/c.png': str(tmp_path / 'res' / 'c.png')})
+
+    assert counts == {'copy': 1, 'missing': 2}
+    assert read_file(os.path.join(path_to, 'images', 'a.png')) == "a"
+    assert not is_same_file(None, os.path.join(path_to, 'images', 'b.png'))
+    assert not is_same_file(str(tmp_path / 'res' / 'c.png'), os.path.join(path_to, 'images', 'a.png'))
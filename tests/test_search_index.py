@@ -0,0 +1,32 @@
+import os
+import json
+
+from util.build_cache import get_text_hash
+from util.search_index import SearchIndex
+from conftest import write_file, read_file
+
+
+def test_search_index_keeps_only_hashes_of_written_shards(tmp_path):
+    folder = str(tmp_path)
+    search_folder = os.path.join(folder, 'search')
+    # 上次运行留下的分片, 第一次写入时删除
+    write_file(os.path.join(search_folder, 'z.json'), '{}')
+    index = SearchIndex()
+    docs = [('a', 'A', '/a/', '2020-01-01', {'apple': 3, '笔记': 1}),
+            ('b', 'B', '/b/', '2020-01-02', {'banana': 2})]
+
+    assert index.write(index.update(docs), [folder])
+    names = sorted(name for name in os.listdir(search_folder) if not name.startswith('.'))
+    assert names == sorted(index.files)
+    assert 'z.json' not in names
+    for name, content_hash in index.files.items():
+        assert content_hash == get_text_hash(read_file(os.path.join(search_folder, name)))
+    assert json.loads(read_file(os.path.join(search_folder, 'a.json'))) == {'apple': [['a', 3]]}
+
+    # 删除 b 后只重写 docs.json, b.json 没有词了被删除
+    names = index.update(docs[:1])
+    assert sorted(names) == ['b.json', 'docs.json']
+    assert index.write(names, [folder])
+    assert not os.path.exists(os.path.join(search_folder, 'b.json'))
+    assert 'b.json' not in index.files
+    assert not index.write(index.update(docs[:1]), [folder])
@@ -0,0 +1,56 @@
+import os
+
+import obsidian2hexo
+from util.git_snapshot import GitSnapshot
+from util.link_resolver import LinkResolver
+from conftest import write_file, read_file, git, get_settings
+
+# 没有解析过正文的笔记的缓存记录
+NOTE_RECORD = {'tags': [], 'tag_names': [], 'shares': [], 'is_share': False, 'is_top': False, 'aliases': [],
+               'front_dates': [None, None]}
+
+
+def publish(settings, **options):
+    publisher = obsidian2hexo.Publisher(settings, **options)
+    try:
+        publisher.build()
+    finally:
+        publisher.close()
+
+
+def test_snapshot_heading_link_to_note_deleted_in_working_tree(workspace):
+    vault = str(workspace / 'vault')
+    path_to = str(workspace / 'hexo')
+    write_file(os.path.join(vault, 'a.md'), "#share\n正文 [[b#小节]]\n")
+    write_file(os.path.join(vault, 'b.md'), "---\naliases: [bb]\n---\n# 小节\n内容\n")
+    git(vault, 'init', '-q')
+    git(vault, 'add', '-A')
+    git(vault, 'commit', '-qm', 'init')
+    # 工作区中删除被链接的笔记, 快照中仍然存在
+    os.remove(os.path.join(vault, 'b.md'))
+
+    publish(get_settings(vault, path_to), snapshot='HEAD')
+
+    a_hash = obsidian2hexo.get_sha1(os.path.join(vault, 'a.md'))
+    b_hash = obsidian2hexo.get_sha1(os.path.join(vault, 'b.md'))
+    post = read_file(os.path.join(path_to, 'source', '_posts', f"{a_hash}.md"))
+    assert f"[b#小节](../{b_hash}/#小节)" in post
+
+
+def test_snapshot_headings_ignore_uncommitted_edits(workspace):
+    vault = str(workspace / 'vault')
+    path = os.path.join(vault, 'b.md')
+    write_file(path, "---\n# 注释不是标题\naliases: [bb]\n---\n# 小节\n内容\n")
+    git(vault, 'init', '-q')
+    git(vault, 'add', '-A')
+    git(vault, 'commit', '-qm', 'init')
+    # 未提交的修改删掉了标题, 快照中的标题仍然有效
+    write_file(path, "# 别的标题\n")
+
+    snapshot = GitSnapshot(vault).open()
+    try:
+        note = obsidian2hexo.Note(vault, path, ('share',), None, 0, None, NOTE_RECORD)
+        note.snapshot = snapshot
+        assert LinkResolver([note]).get_headings(note) == {'小节'}
+    finally:
+        snapshot.close()
@@ -0,0 +1,82 @@
+"""
+MarkdownTokenizer 的 golden-file 测试\n
+fixtures/tokenizer/vault 是样例笔记, expected 是当前生成的文章, legacy 是改为单遍扫描之前的正则转换生成的文章
+(只保存和当前不同的笔记), 每一处不同的原因记录在 differences.yml 中; 以前不会发布的笔记只有说明没有 legacy 文件,
+其余没有 legacy 文件的笔记和以前的输出完全一致
+"""
+import os
+import re
+import shutil
+
+import yaml
+
+import obsidian2hexo
+from conftest import read_file, get_settings
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'tokenizer')
+PATTERN_DATE = re.compile(r'^date: .*\n', re.M)
+
+
+def get_note_names(vault):
+    """ {文章 id: 相对路径 (不带后缀)} """
+    names = {}
+    for root, dirs, files in os.walk(vault):
+        for name in files:
+            if name.endswith('.md'):
+                path = os.path.join(root, name)
+                names[obsidian2hexo.get_sha1(path)] = os.path.relpath(path, vault)[:-3].replace(os.sep, '/')
+    return names
+
+
+def normalize(content, names):
+    """ 去掉和运行时间有关的日期, 文章 id 换成笔记名 """
+    content = PATTERN_DATE.sub('', content, count=1)
+    for create_hash, name in names.items():
+        content = content.replace(create_hash, f"<{name}>")
+    return content
+
+
+def read_outputs(folder):
+    outputs = {}
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            outputs[os.path.relpath(path, folder)[:-3].replace(os.sep, '/')] = read_file(path)
+    return outputs
+
+
+def test_tokenizer_golden_files(workspace):
+    vault = str(workspace / 'vault')
+    path_to = str(workspace / 'hexo')
+    shutil.rmtree(vault)
+    shutil.copytree(os.path.join(FIXTURE_DIR, 'vault'), vault)
+    publisher = obsidian2hexo.Publisher(get_settings(vault, path_to))
+    try:
+        publisher.build()
+    finally:
+        publisher.close()
+
+    names = get_note_names(vault)
+    posts_folder = os.path.join(path_to, 'source', '_posts')
+    posts = {names[name[:-3]]: normalize(read_file(os.path.join(posts_folder, name)), names)
+             for name in os.listdir(posts_folder)}
+    expected = read_outputs(os.path.join(FIXTURE_DIR, 'expected'))
+    assert sorted(posts) == sorted(expected)
+    for name, content in posts.items():
+        assert content == expected[name], name
+    assert sorted(os.listdir(os.path.join(path_to, 'source', 'images'))) == ['image.png']
+    assert sorted(os.listdir(os.path.join(path_to, 'source', 'download'))) == ['doc.pdf']
+
+
+def test_tokenizer_differences_are_documented():
+    """ 和以前的输出不同的笔记都有 legacy 文件和说明, 新发布的笔记只有说明 """
+    with open(os.path.join(FIXTURE_DIR, 'differences.yml'), "r", encoding='utf-8') as f:
+        differences = yaml.safe_load(f)
+    expected = read_outputs(os.path.join(FIXTURE_DIR, 'expected'))
+    legacy = read_outputs(os.path.join(FIXTURE_DIR, 'legacy'))
+    assert set(legacy) <= set(differences)
+    for name, description in differences.items():
+        assert description, name
+        assert name in legacy or name in expected, name
+    for name, content in legacy.items():
+        assert name not in expected or content != expected[name], name
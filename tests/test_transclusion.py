@@ -0,0 +1,27 @@
+import os
+import logging
+
+import obsidian2hexo
+from conftest import write_file, read_file, get_settings
+
+
+def test_aliased_heading_link_and_embed(workspace, caplog):
+    """ [[note#标题|别名]] 的锚点只有标题, 不带别名 """
+    vault = str(workspace / 'vault')
+    path_to = str(workspace / 'hexo')
+    write_file(os.path.join(vault, 'a.md'), "#share\n链接 [[b#小节|别名]]\n\n![[b#小节|别名]]\n")
+    write_file(os.path.join(vault, 'b.md'), "#share\n## 小节\n小节的内容\n## 另一节\n")
+
+    publisher = obsidian2hexo.Publisher(get_settings(vault, path_to))
+    try:
+        with caplog.at_level(logging.WARNING):
+            publisher.build()
+    finally:
+        publisher.close()
+
+    b_hash = obsidian2hexo.get_sha1(os.path.join(vault, 'b.md'))
+    post = read_file(os.path.join(path_to, 'source', '_posts', f"{obsidian2hexo.get_sha1(os.path.join(vault, 'a.md'))}.md"))
+    assert f"](../{b_hash}/#小节)" in post
+    assert "别名)" not in post
+    assert "小节的内容" in post
+    assert "heading not found" not in caplog.text
@@ -0,0 +1,56 @@
+import os
+
+import obsidian2hexo
+from conftest import write_file, read_file, git, get_settings
+
+
+def test_reverted_watch_edit_is_rechecked_on_next_run(workspace):
+    """ watch 模式发布了未提交的修改, 退出后在 git 中撤销, 下次运行不能继续使用修改后的缓存 """
+    vault = str(workspace / 'vault')
+    path_to = str(workspace / 'hexo')
+    a_path = os.path.join(vault, 'a.md')
+    write_file(a_path, "#share\n原来的内容\n")
+    git(vault, 'init', '-q')
+    git(vault, 'add', '-A')
+    git(vault, 'commit', '-qm', 'init')
+    settings = get_settings(vault, path_to)
+
+    publisher = obsidian2hexo.Publisher(settings)
+    try:
+        publisher.build()
+        write_file(a_path, "#share\n没有提交的修改\n")
+        assert publisher.update({a_path}) is not None
+    finally:
+        publisher.close()
+    post_path = os.path.join(path_to, 'source', '_posts', f"{obsidian2hexo.get_sha1(a_path)}.md")
+    assert "没有提交的修改" in read_file(post_path)
+
+    git(vault, 'checkout', '--', 'a.md')
+    publisher = obsidian2hexo.Publisher(settings)
+    try:
+        publisher.build()
+    finally:
+        publisher.close()
+    assert "原来的内容" in read_file(post_path)
+
+
+def test_watch_removes_image_referenced_only_by_embedded_note(workspace):
+    """ 只有被嵌入的非发布笔记引用的图片被删除后, 嵌入它的文章重新展开, 不再同步这张图片 """
+    vault = str(workspace / 'vault')
+    path_to = str(workspace / 'hexo')
+    image_path = os.path.join(vault, 'res', 'x.png')
+    write_file(os.path.join(vault, 'a.md'), "#share\n![[e]]\n")
+    write_file(os.path.join(vault, 'e.md'), "#x\n![[x.png]]\n")
+    write_file(image_path, "png")
+
+    publisher = obsidian2hexo.Publisher(get_settings(vault, path_to))
+    try:
+        publisher.build()
+        assert os.path.exists(os.path.join(path_to, 'source', 'images', 'x.png'))
+        os.remove(image_path)
+        assert publisher.update({image_path}, res_changed=True) is not None
+    finally:
+        publisher.close()
+    assert not os.path.exists(os.path.join(path_to, 'source', 'images', 'x.png'))
+    post_path = os.path.join(path_to, 'source', '_posts', f"{obsidian2hexo.get_sha1(os.path.join(vault, 'a.md'))}.md")
+    assert "/images/x.png" not in read_file(post_path)
@@ -0,0 +1,222 @@
+import os
+import json
+import sqlite3
+import hashlib
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+SCHEMA_VERSION = 11
+# 新的解析结果攒够这么多条后先写入数据库, 冷缓存时不用在内存中保存全部结果
+FLUSH_SIZE = 256
+
+
+def get_file_hash(file_path):
+    """ 文件内容 sha1 """
+    hash_sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hash_sha1.update(chunk)
+    return hash_sha1.hexdigest()
+
+
+def get_blob_hash(file_path):
+    """ 和 git 相同的 blob id, 快照模式下可以直接和 git ls-tree 的结果比较 """
+    hash_sha1 = hashlib.sha1(f"blob {os.path.getsize(file_path)}\0".encode())
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hash_sha1.update(chunk)
+    return hash_sha1.hexdigest()
+
+
+def get_text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class BuildCache():
+    """
+    增量构建清单, 保存在 sqlite 中\n
+    记录每篇笔记的 stat 签名, 内容 hash (git blob id), 解析结果以及生成文章的 hash\n
+    内存中只保留签名, 解析结果在用到时按路径从数据库读取, 占用的内存和仓库大小无关
+    """
+
+    def __init__(self, db_path, settings):
+        self.db_path = db_path
+        self.settings = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+        self.records = {}
+        self.outputs = {}
+        self.dirty = {}
+        self.dirty_outputs = {}
+        self.seen = set()
+        self.removed = set()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS notes ("
+                          "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash TEXT, data TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS outputs (name TEXT PRIMARY KEY, hash TEXT)")
+        self.load()
+
+    def load(self):
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        if meta.get('version') != str(SCHEMA_VERSION) or meta.get('settings') != self.settings:
+            # 配置或者格式变化后缓存全部失效
+            logger.info("build cache invalidated")
+            self.clear()
+            return
+        for path, mtime_ns, size, file_hash in self.conn.execute("SELECT path, mtime_ns, size, hash FROM notes"):
+            self.records[path] = (mtime_ns, size, file_hash)
+        self.outputs = dict(self.conn.execute("SELECT name, hash FROM outputs"))
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM notes")
+            self.conn.execute("DELETE FROM outputs")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                                  [('version', str(SCHEMA_VERSION)), ('settings', self.settings)])
+        self.records = {}
+        self.outputs = {}
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key, value):
+        """ value 为 None 时删除 """
+        with self.conn:
+            if value is None:
+                self.conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+            else:
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def get_data(self, path):
+        """ 还没有写回的记录在 dirty 中, 其余从数据库读取 """
+        record = self.dirty.get(path)
+        if record is not None:
+            return record[3]
+        row = self.conn.execute("SELECT data FROM notes WHERE path = ?", (path,)).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, path, stat):
+        """
+        返回缓存的解析结果, 失效时返回 None\n
+        stat 签名一致直接命中, 否则比较内容 hash
+        """
+        self.seen.add(path)
+        record = self.records.get(path)
+        if record is None:
+            self.misses += 1
+            return None
+        mtime_ns, size, file_hash = record
+        if mtime_ns == stat.st_mtime_ns and size == stat.st_size:
+            self.hits += 1
+            return json.loads(self.get_data(path))
+        if size == stat.st_size and file_hash == get_blob_hash(path):
+            data = self.get_data(path)
+            self.records[path] = (stat.st_mtime_ns, stat.st_size, file_hash)
+            self.dirty[path] = (stat.st_mtime_ns, stat.st_size, file_hash, data)
+            self.hits += 1
+            return json.loads(data)
+        self.misses += 1
+        return None
+
+    def get_unchecked(self, path):
+        """ 不检查 stat 直接返回缓存的解析结果, 用于 git 确认没有修改的笔记 """
+        self.seen.add(path)
+        record = self.records.get(path)
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(self.get_data(path))
+
+    def get_record(self, path):
+        """ 重新读取本次运行已经加载过的解析结果, 不计入命中统计 """
+        data = self.get_data(path)
+        return None if data is None else json.loads(data)
+
+    def get_hash(self, path):
+        """ 缓存记录中的内容 hash, 没有记录时返回 None """
+        record = self.records.get(path)
+        return None if record is None else record[2]
+
+    def get_paths(self):
+        """ 缓存中的全部笔记路径 """
+        return list(self.records)
+
+    def get_blob(self, path, blob_id):
+        """ 快照模式下按 blob id 查找, 不需要读取文件 """
+        self.seen.add(path)
+        record = self.records.get(path)
+        if record is None or record[2] != blob_id:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(self.get_data(path))
+
+    def put(self, path, stat, data):
+        self.put_record(path, stat.st_mtime_ns, stat.st_size, get_blob_hash(path), data)
+
+    def put_blob(self, path, size, blob_id, data):
+        """ 快照中的笔记没有修改时间, 之后从工作区读取时按 blob id 比较一次 """
+        self.put_record(path, 0, size, blob_id, data)
+
+    def put_record(self, path, mtime_ns, size, file_hash, data):
+        self.records[path] = (mtime_ns, size, file_hash)
+        self.dirty[path] = (mtime_ns, size, file_hash, json.dumps(data, ensure_ascii=False))
+        if len(self.dirty) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """ 写入新的解析结果, 删除和输出记录仍然在 save 时写入 """
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?)",
+                                  [(path,) + record for path, record in self.dirty.items()])
+        self.dirty = {}
+
+    def remove(self, path):
+        """ 删除已经不存在的笔记 """
+        self.seen.discard(path)
+        if path in self.records:
+            del self.records[path]
+            self.dirty.pop(path, None)
+            self.removed.add(path)
+
+    def is_output_fresh(self, name, output_hash):
+        return self.outputs.get(name) == output_hash
+
+    def get_outputs(self, prefix=''):
+        return [name for name in self.outputs if name.startswith(prefix)]
+
+    def put_output(self, name, output_hash):
+        self.outputs[name] = output_hash
+        self.dirty_outputs[name] = output_hash
+
+    def remove_output(self, name):
+        self.outputs.pop(name, None)
+        self.dirty_outputs[name] = None
+
+    def save(self, prune=True):
+        """ 写回变化的记录, prune 时删除本次没有遍历到的笔记 """
+        removed = self.removed
+        if prune:
+            removed |= set(path for path in self.records if path not in self.seen)
+        self.flush()
+        with self.conn:
+            self.conn.executemany("DELETE FROM notes WHERE path = ?", [(path,) for path in removed])
+            self.conn.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?)",
+                                  [(name, h) for name, h in self.dirty_outputs.items() if h is not None])
+            self.conn.executemany("DELETE FROM outputs WHERE name = ?",
+                                  [(name,) for name, h in self.dirty_outputs.items() if h is None])
+        for path in removed:
+            self.records.pop(path, None)
+        logger.info(f"build cache saved: hits {self.hits} misses {self.misses} removed {len(removed)}")
+        self.dirty_outputs = {}
+        self.removed = set()
+
+    def close(self):
+        self.conn.close()
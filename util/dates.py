@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import time
+import datetime
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# git 在 filesystem 前面: 文件时间总能得到, 放在前面时 git 永远不会被查询, clone 或同步后的文章日期都变成文件时间
+DATE_SOURCES = ['front_matter', 'cache', 'git', 'filesystem']
+# front-matter 中的字符串日期, 时区和毫秒忽略
+PATTERN_DATE = re.compile(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})(?:[T ](\d{1,2}):(\d{2})(?::(\d{2}))?)?')
+
+
+def normalize_date(value):
+    """ 把 front-matter 中的日期转为 %Y-%m-%d %H:%M:%S, 无法识别时返回 None """
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d 00:00:00')
+    if not isinstance(value, str):
+        return None
+    m = PATTERN_DATE.match(value.strip())
+    if m is None:
+        return None
+    try:
+        return datetime.datetime(*(int(group or 0) for group in m.groups())).strftime(DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+def timestamp_to_date(timestamp):
+    return time.strftime(DATE_FORMAT, time.localtime(timestamp))
+
+
+def get_file_dates(path):
+    """ 文件的 (创建时间, 修改时间), 不支持创建时间的系统用修改时间代替 """
+    stat = os.stat(path)
+    birth = getattr(stat, 'st_birthtime', None)
+    if birth is None and os.name == 'nt':
+        birth = stat.st_ctime
+    if birth is None:
+        birth = stat.st_mtime
+    return timestamp_to_date(birth), timestamp_to_date(stat.st_mtime)
+
+
+class DateResolver():
+    """
+    按配置的顺序解析笔记的 (创建时间, 修改时间), 前面的来源得到的日期优先, 全部得到后不再查询后面的来源\n
+    front_matter: front-matter 中的 created/updated; cache: 上次运行的结果, 内容变化后修改时间重新解析;
+    filesystem: 文件的创建和修改时间; git: 提交历史, 只有前面的来源没有得到日期时才执行 git log\n
+    结果按内容 hash 保存在 cache_path, 内容不变的笔记每次运行得到相同的日期; 来源的配置变化后缓存失效
+    """
+
+    def __init__(self, sources, history, build_cache, cache_path=None, use_filesystem=True):
+        self.sources = []
+        for source in sources:
+            if source not in DATE_SOURCES:
+                logger.warning(f"unknown date source, skip: {source}")
+            elif source != 'filesystem' or use_filesystem:
+                self.sources.append(source)
+        self.history = history
+        self.build_cache = build_cache
+        self.cache_path = cache_path
+        self.dates = {}
+        self.seen = set()
+        self.changed = set()
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"load date cache failed: {e}")
+            return
+        if cache.get('sources') == self.sources:
+            self.dates = cache.get('dates', {})
+        else:
+            self.dirty = True
+
+    def save(self, prune=True):
+        """ prune 时删除本次没有解析的笔记 """
+        if prune:
+            for path in set(self.dates) - self.seen:
+                del self.dates[path]
+                self.dirty = True
+        if self.cache_path is None or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump({'sources': self.sources, 'dates': self.dates}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+        self.dirty = False
+
+    def pop_changed(self):
+        """ 返回上次调用之后日期和缓存中不一致的笔记 """
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def remove(self, path):
+        self.seen.discard(path)
+        if self.dates.pop(path, None) is not None:
+            self.dirty = True
+
+    def get_source_dates(self, source, path, front_dates, content_hash):
+        if source == 'front_matter':
+            return front_dates
+        if source == 'cache':
+            entry = self.dates.get(path)
+            if entry is None:
+                return None, None
+            return entry[0], entry[1] if entry[2] == content_hash else None
+        if source == 'filesystem':
+            try:
+                return get_file_dates(path)
+            except OSError:
+                return None, None
+        if self.history is None:
+            return None, None
+        return self.history.get_dates(os.path.relpath(path, self.history.repo_path)) or (None, None)
+
+    def resolve(self, path, front_dates=(None, None)):
+        """ 返回 (创建时间, 修改时间), 所有来源都没有日期时使用当前时间, 之后由缓存固定 """
+        content_hash = self.build_cache.get_hash(path)
+        created, updated = None, None
+        for source in self.sources:
+            if created is not None and updated is not None:
+                break
+            source_created, source_updated = self.get_source_dates(source, path, front_dates, content_hash)
+            created = created or source_created
+            updated = updated or source_updated
+        created = created or updated or time.strftime(DATE_FORMAT)
+        updated = updated or created
+        entry = [created, updated, content_hash]
+        old_entry = self.dates.get(path)
+        if old_entry != entry:
+            if old_entry is None or old_entry[:2] != entry[:2]:
+                self.changed.add(path)
+            self.dates[path] = entry
+            self.dirty = True
+        self.seen.add(path)
+        return created, updated
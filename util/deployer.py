@@ -0,0 +1,123 @@
+import time
+import threading
+import subprocess
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from util.logger import Logger
+from util.profiler import Profiler
+from util.git import CREATE_NO_WINDOW, is_ignored
+
+logger = Logger(__file__)
+profiler = Profiler()
+
+# hexo d 修改的文件, 被 hexo 源码仓库忽略时 hexo d 才能和源码仓库的提交同时进行
+DEPLOY_OUTPUTS = ['public/', '.deploy_git/', 'db.json']
+
+
+class CommandError(Exception):
+    def __init__(self, order, code, lines):
+        super().__init__(f"`{order}` exit code {code}")
+        self.order = order
+        self.code = code
+        self.lines = lines
+
+
+def run_command(order, cwd):
+    """ 运行命令并实时输出日志, 返回输出的行, 退出码不为 0 时抛出 CommandError """
+    start = time.perf_counter()
+    logger.info(f"$ {order}")
+    process = subprocess.Popen(order, cwd=cwd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               creationflags=CREATE_NO_WINDOW)
+    lines = []
+    try:
+        for line in process.stdout:
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            lines.append(line)
+            logger.info(line)
+    finally:
+        process.stdout.close()
+        code = process.wait()
+        profiler.record(f"deploy/{' '.join(order.split(' ')[:2])}", time.perf_counter() - start)
+    if code != 0:
+        raise CommandError(order, code, lines)
+    return lines
+
+
+class HexoDeployer():
+    """
+    部署 hexo\n
+    不再运行 hexo clean, 保留 hexo 的 db.json 增量缓存\n
+    git fetch 和生成同时进行; hexo g 之后, hexo d 和源码仓库的 git 提交同时进行 (两者分别操作 .deploy_git 和 hexo 源码仓库),
+    hexo d 的输出没有被源码仓库的 .gitignore 忽略时, git add 可能提交写到一半的文件, 改为先 hexo d 再提交
+    """
+
+    def __init__(self, hexo_path, renderer='hexo'):
+        self.hexo_path = hexo_path
+        self.renderer = renderer
+        self.fetch_thread = None
+
+    def prefetch(self):
+        """ 后台执行 git fetch, 只更新 .git 不修改工作区, 可以和生成同时进行 """
+        if self.fetch_thread is not None and self.fetch_thread.is_alive():
+            return
+        self.fetch_thread = threading.Thread(target=self.fetch, daemon=True)
+        self.fetch_thread.start()
+
+    def fetch(self):
+        try:
+            run_command("git fetch", self.hexo_path)
+        except (CommandError, OSError) as e:
+            # 失败时 git pull 会再次拉取
+            logger.warning(f"git fetch failed: {e}")
+
+    def commit_source(self):
+        """ 提交并推送 hexo 源码仓库 """
+        if not run_command("git status --porcelain", self.hexo_path):
+            logger.info("hexo source not changed, skip commit")
+        else:
+            run_command("git add .", self.hexo_path)
+            run_command(f'git commit -m "note:update {time.strftime("%Y-%m-%d %H:%M:%S")}"', self.hexo_path)
+        run_command("git pull", self.hexo_path)
+        run_command("git push", self.hexo_path)
+
+    def log_error(self, e):
+        if isinstance(e, CommandError):
+            logger.error(f"deploy failed: {e}\n" + '\n'.join(e.lines[-20:]))
+        else:
+            logger.error(f"deploy failed: {e}")
+
+    def deploy(self):
+        """ 部署成功返回 True """
+        logger.info("********************************* deploy_hexo *********************************")
+        if self.fetch_thread is not None:
+            self.fetch_thread.join()
+
+        success = True
+        try:
+            if self.renderer == 'hexo':
+                run_command("hexo g", self.hexo_path)
+        except (CommandError, OSError) as e:
+            self.log_error(e)
+            return False
+        if is_ignored(self.hexo_path, DEPLOY_OUTPUTS):
+            with ThreadPoolExecutor(2) as executor:
+                futures = [executor.submit(run_command, "hexo d", self.hexo_path), executor.submit(self.commit_source)]
+            for future in futures:
+                try:
+                    future.result()
+                except (CommandError, OSError) as e:
+                    self.log_error(e)
+                    success = False
+        else:
+            logger.warning(f"{', '.join(DEPLOY_OUTPUTS)} not all ignored by {self.hexo_path}/.gitignore, "
+                           f"run hexo d and git commit one after another")
+            for step in (partial(run_command, "hexo d", self.hexo_path), self.commit_source):
+                try:
+                    step()
+                except (CommandError, OSError) as e:
+                    self.log_error(e)
+                    success = False
+        if success:
+            logger.info("********************************* hexo deploy success! *********************************")
+        return success
@@ -0,0 +1,179 @@
+import os
+import re
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+IGNORE_FILE = '.obsidianignore'
+# git 仓库目录总是排除
+DEFAULT_RULES = ['.git/']
+
+
+def translate(pattern):
+    """ gitignore 风格的通配符转为正则, ** 匹配任意层目录, * 和 ? 不匹配 / """
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end < 0:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append(f"[{body}]")
+                i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return ''.join(parts)
+
+
+def is_outside(rel_path):
+    return rel_path == '..' or rel_path.startswith('../')
+
+
+def normalize_rules(root_dir, excludes):
+    """
+    配置中的绝对路径 (比如资源文件夹) 转为相对笔记根目录的规则, 不在笔记根目录下的路径跳过\n
+    windows 上和笔记根目录不在同一个盘符时 relpath 抛出 ValueError, 同样跳过
+    """
+    rules = []
+    for exclude in excludes:
+        if os.path.isabs(exclude):
+            try:
+                rel_path = os.path.relpath(exclude, root_dir).replace(os.sep, '/')
+            except ValueError as e:
+                logger.warning(f"exclude path is not on the vault drive, skip: {exclude} {e}")
+                continue
+            if is_outside(rel_path):
+                continue
+            exclude = '/' + rel_path
+        rules.append(exclude)
+    return rules
+
+
+class ExcludeMatcher():
+    """
+    排除规则\n
+    配置中的 exclude 和笔记根目录下的 .obsidianignore 按 gitignore 语义编译一次:
+    含 / 的规则相对笔记根目录, 否则匹配任意一层; 以 / 结尾只匹配目录; 以 ! 开头重新包含; 后面的规则优先
+    """
+
+    def __init__(self, root_dir, rules=()):
+        self.root_dir = root_dir
+        self.rules = []
+        self.sources = []
+        for rule in DEFAULT_RULES + list(rules):
+            self.add(rule)
+
+    @classmethod
+    def from_settings(cls, root_dir, excludes, ignore_file=True):
+        """ 配置中的规则经过 normalize_rules, ignore_file 为 True 时加上笔记根目录下的 .obsidianignore """
+        rules = normalize_rules(root_dir, excludes)
+        if not ignore_file:
+            return cls(root_dir, rules)
+        ignore_path = os.path.join(root_dir, IGNORE_FILE)
+        if os.path.exists(ignore_path):
+            with open(ignore_path, "r", encoding='utf-8') as f:
+                rules.extend(f.read().splitlines())
+        return cls(root_dir, rules)
+
+    def add(self, rule):
+        rule = rule.strip().replace('\\', '/')
+        if not rule or rule.startswith('#'):
+            return
+        self.sources.append(rule)
+        negate = rule.startswith('!')
+        if negate:
+            rule = rule[1:]
+        dir_only = rule.endswith('/')
+        rule = rule.rstrip('/')
+        if not rule:
+            return
+        anchored = '/' in rule
+        rule = rule.lstrip('/')
+        prefix = '' if anchored else '(?:.*/)?'
+        self.rules.append((re.compile(f"^{prefix}{translate(rule)}$"), dir_only, negate))
+
+    def match(self, rel_path, is_dir=False):
+        """ rel_path: 相对笔记根目录, 用 / 分隔 """
+        excluded = False
+        for pattern, dir_only, negate in self.rules:
+            if excluded == (not negate):
+                continue
+            if dir_only and not is_dir:
+                continue
+            if pattern.match(rel_path):
+                excluded = not negate
+        return excluded
+
+    def is_excluded(self, path):
+        """ 检查绝对路径, 任意一层上级目录被排除时也算排除 """
+        try:
+            rel_path = os.path.relpath(path, self.root_dir).replace(os.sep, '/')
+        except ValueError:
+            # 不在同一个盘符
+            return True
+        if is_outside(rel_path):
+            return True
+        return self.match_path(rel_path, os.path.isdir(path))
+
+    def match_path(self, rel_path, is_dir=False):
+        """ 和 match 相同, 但是任意一层上级目录被排除时也算排除, 不访问文件系统 """
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)):
+            if self.match('/'.join(parts[:i]), True):
+                return True
+        return self.match(rel_path, is_dir)
+
+    def walk(self, extensions=None):
+        """
+        遍历笔记目录, 被排除的目录不会进入\n
+        返回 {文件路径: stat}, stat 来自 DirEntry 的缓存 (windows 下不需要额外的系统调用)
+        """
+        files = {}
+        stack = [(self.root_dir, '')]
+        while stack:
+            path, rel_dir = stack.pop()
+            try:
+                it = os.scandir(path)
+            except OSError as e:
+                logger.warning(f"scan dir failed: {path} {e}")
+                continue
+            with it:
+                for entry in it:
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        # 和 os.walk 一样不进入指向目录的符号链接
+                        if not entry.is_symlink() and not self.match(rel_path, True):
+                            stack.append((entry.path, rel_path))
+                        continue
+                    if extensions is not None and not entry.name.endswith(extensions):
+                        continue
+                    if self.match(rel_path):
+                        continue
+                    try:
+                        files[entry.path] = entry.stat()
+                    except OSError as e:
+                        logger.warning(f"stat failed: {entry.path} {e}")
+        return files
@@ -0,0 +1,88 @@
+import os
+import re
+import json
+import yaml
+
+from util.logger import Logger
+from util.build_cache import get_text_hash
+from util.staged_writer import StagedWriter
+
+logger = Logger(__file__)
+
+FLAVOURS = ('markdown', 'json')
+OUTPUT_PREFIX = 'export/'
+# 文章之间的链接 ../文章id 或 ../文章id/#标题
+PATTERN_POST_LINK = re.compile(r'\]\(\.\./([0-9a-f]{40})/?(#[^)]*)?\)')
+PATTERN_ASSET_LINK = re.compile(r'([("])/(images|download)/')
+
+
+def to_relative(content):
+    """ 文章和资源的链接改为相对导出目录的路径, 导出的文件不依赖网站的根目录 """
+    content = PATTERN_POST_LINK.sub(lambda m: f"]({m.group(1)}.md{m.group(2) or ''})", content)
+    return PATTERN_ASSET_LINK.sub(r'\1\2/', content)
+
+
+class Exporter():
+    """
+    把发布的笔记导出为普通 markdown 或 json, 给团队 wiki 或其他工具使用, 不经过 hexo\n
+    markdown: 每篇 {文章id}.md, yaml front-matter 加正文, 文章之间的链接指向相对的 .md 文件;
+    json: 每篇 {文章id}.json; 两种格式都生成列出全部文章的 index.json\n
+    按输出 hash 增量写入, 删除不再发布的文章
+    """
+
+    def __init__(self, folder, flavour, cache, output_prefix='', dry_run=False):
+        self.folder = folder
+        self.flavour = flavour
+        self.cache = cache
+        self.prefix = output_prefix + OUTPUT_PREFIX
+        self.dry_run = dry_run
+
+    def gen_post(self, key, page):
+        """ 返回 (文件名, 内容) """
+        content = to_relative(page['markdown'])
+        if self.flavour == 'json':
+            post = {'id': key, 'title': page['title'], 'date': page['date'], 'categories': page['categories'],
+                    'tags': page['tags'], 'top': page['top'], 'markdown': content}
+            return f"{key}.json", json.dumps(post, ensure_ascii=False)
+        meta = {'title': page['title'], 'date': page['date'], 'categories': page['categories'], 'tags': page['tags']}
+        if page['top']:
+            meta['top'] = True
+        front_matter = yaml.safe_dump(meta, allow_unicode=True, sort_keys=False, default_flow_style=None)
+        return f"{key}.md", f"---\n{front_matter}---\n{content}"
+
+    def export(self, pages):
+        """
+        pages: 可迭代的 [{'url', 'title', 'date', 'categories', 'tags', 'top', 'markdown'}], 逐篇写入不保留正文\n
+        返回 {'added', 'updated', 'removed'}
+        """
+        writer = StagedWriter(self.folder, dry_run=self.dry_run)
+        outputs = {}
+        items = []
+        for page in pages:
+            key = page['url'].strip('/')
+            name, content = self.gen_post(key, page)
+            output_hash = get_text_hash(content)
+            outputs[name] = output_hash
+            if self.cache.is_output_fresh(self.prefix + name, output_hash) \
+                    and os.path.exists(os.path.join(self.folder, name)):
+                writer.keep()
+            else:
+                writer.put(name, content, output_hash)
+            items.append({'id': key, 'file': name, 'title': page['title'], 'date': page['date'],
+                          'categories': page['categories'], 'tags': page['tags'], 'top': page['top']})
+        items.sort(key=lambda item: (item['top'], item['date'], item['id']), reverse=True)
+        index = json.dumps({'posts': items}, ensure_ascii=False, indent=1)
+        outputs['index.json'] = get_text_hash(index)
+        writer.put('index.json', index, outputs['index.json'])
+        logger.info(f"export {self.flavour}: {len(items)} posts to {self.folder}")
+
+        for name in self.cache.get_outputs(self.prefix):
+            if name[len(self.prefix):] not in outputs:
+                writer.remove(name[len(self.prefix):])
+        changes = writer.commit()
+        if not self.dry_run:
+            for name, output_hash in outputs.items():
+                self.cache.put_output(self.prefix + name, output_hash)
+            for name in changes['removed']:
+                self.cache.remove_output(self.prefix + name)
+        return changes
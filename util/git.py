@@ -0,0 +1,249 @@
+import os
+import json
+import subprocess
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+# windows 下不弹出命令行窗口, 其他平台必须为 0
+CREATE_NO_WINDOW = 0x08000000 if os.name == 'nt' else 0
+
+GIT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+COMMIT_MARK = '\x01'
+
+
+def git_output(repo_path, args):
+    """ 在 repo_path 下执行 git 命令并返回 stdout 文本 """
+    order = ['git', '-c', 'core.quotepath=off'] + list(args)
+    output = subprocess.check_output(order, cwd=repo_path, stderr=subprocess.DEVNULL, creationflags=CREATE_NO_WINDOW)
+    return output.decode('utf-8')
+
+
+def is_ignored(repo_path, paths):
+    """ paths 都被 .gitignore 忽略时返回 True, 目录以 / 结尾; 不是 git 仓库或 git 命令失败时返回 False """
+    order = ['git', '-c', 'core.quotepath=off', 'check-ignore', '--'] + list(paths)
+    try:
+        result = subprocess.run(order, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                creationflags=CREATE_NO_WINDOW)
+    except OSError:
+        return False
+    # 没有被忽略的路径时退出码为 1, 其他错误为 128
+    if result.returncode not in (0, 1):
+        return False
+    return set(result.stdout.decode('utf-8').splitlines()) >= set(paths)
+
+
+def git_stream(repo_path, args):
+    """ 逐行读取 git 命令输出, 避免一次性缓存整个输出 """
+    order = ['git', '-c', 'core.quotepath=off'] + list(args)
+    process = subprocess.Popen(order, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               creationflags=CREATE_NO_WINDOW)
+    try:
+        for line in process.stdout:
+            yield line.decode('utf-8').rstrip('\r\n')
+    finally:
+        process.stdout.close()
+        code = process.wait()
+    if code != 0:
+        raise subprocess.CalledProcessError(code, order)
+
+
+def get_head(repo_path):
+    """ 获取 HEAD commit, 不是 git 仓库时返回 None """
+    try:
+        return git_output(repo_path, ['rev-parse', 'HEAD']).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def is_ancestor(repo_path, commit, head):
+    try:
+        subprocess.check_call(['git', 'merge-base', '--is-ancestor', commit, head], cwd=repo_path,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=CREATE_NO_WINDOW)
+        return True
+    except (subprocess.CalledProcessError, OSError):
+        return False
+
+
+def parse_name_status(fields):
+    """ 解析 -z 格式的 --name-status 输出, 重命名和复制返回新旧两个路径 """
+    paths = set()
+    i = 0
+    while i < len(fields):
+        status = fields[i]
+        if not status:
+            i += 1
+            continue
+        count = 2 if status[0] in ('R', 'C') else 1
+        paths.update(fields[i + 1:i + 1 + count])
+        i += 1 + count
+    return paths
+
+
+def parse_porcelain(fields, prefix):
+    """ 解析 -z 格式的 status --porcelain 输出, 路径相对仓库根目录, 只保留 prefix 下的文件并去掉 prefix """
+    paths = set()
+    i = 0
+    while i < len(fields):
+        entry = fields[i]
+        i += 1
+        if len(entry) < 4:
+            continue
+        entry_paths = [entry[3:]]
+        if entry[0] in ('R', 'C'):
+            # 重命名的原路径在下一个字段
+            entry_paths.append(fields[i])
+            i += 1
+        for path in entry_paths:
+            if path.startswith(prefix):
+                paths.add(path[len(prefix):])
+    return paths
+
+
+def get_diff_paths(repo_path, since, head):
+    """
+    返回 since 到 head 之间修改过的文件, 相对 repo_path 用 / 分隔, 包括新增, 删除和重命名前后的路径\n
+    since 不是 head 的祖先 (历史被改写) 或者 git 命令失败时返回 None
+    """
+    if since == head:
+        return set()
+    if not is_ancestor(repo_path, since, head):
+        logger.info(f"published commit is not an ancestor of HEAD: {since}")
+        return None
+    try:
+        output = git_output(repo_path, ['diff', '--name-status', '-M', '--relative', '-z', f"{since}..{head}"])
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"git diff failed: {e}")
+        return None
+    return parse_name_status(output.split('\x00'))
+
+
+def get_dirty_paths(repo_path):
+    """ 返回未提交的修改和未跟踪的文件, 相对 repo_path 用 / 分隔, git 命令失败时返回 None """
+    try:
+        prefix = git_output(repo_path, ['rev-parse', '--show-prefix']).strip()
+        output = git_output(repo_path, ['status', '--porcelain', '-z', '--untracked-files=all', '--', '.'])
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"git status failed: {e}")
+        return None
+    return parse_porcelain(output.split('\x00'), prefix)
+
+
+class GitHistory():
+    """
+    整个仓库的提交历史索引\n
+    只执行一次 git log, 生成 相对路径 -> [创建时间, 最后修改时间], 支持重命名和增量更新; 第一次查询时才执行 git log
+    """
+
+    def __init__(self, repo_path, cache_path=None):
+        self.repo_path = repo_path
+        self.cache_path = cache_path
+        self.head = None
+        self.indexed = None
+        self.files = {}
+        self.loaded = False
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"load git history cache failed: {e}")
+            return
+        if cache.get('repo') != self.repo_path:
+            return
+        self.indexed = cache.get('head')
+        self.files = cache.get('files', {})
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        cache = {'repo': self.repo_path, 'head': self.indexed, 'files': self.files}
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def update(self, commit=None):
+        """ 设置要索引到的 commit (默认 HEAD), 只执行 rev-parse, git log 在 get_dates 中按需执行 """
+        head = commit or get_head(self.repo_path)
+        if head is None:
+            logger.warning(f"not a git repository, skip git history: {self.repo_path}")
+            self.head = None
+            self.indexed = None
+            self.files = {}
+            return self
+        self.head = head
+        return self
+
+    def sync(self):
+        """ 从上次索引的 commit 增量更新到 head, 历史被改写时全量重建 """
+        if self.head is None or self.head == self.indexed:
+            return
+        self.load()
+        head = self.head
+        if head == self.indexed:
+            return
+
+        args = ['log', '--reverse', '--name-status', '-M', '--relative',
+                f'--format={COMMIT_MARK}%H%x00%ad', f'--date=format:{GIT_DATE_FORMAT}']
+        if self.indexed is not None and is_ancestor(self.repo_path, self.indexed, head):
+            args.append(f"{self.indexed}..{head}")
+            logger.info(f"update git history: {self.indexed}..{head}")
+        else:
+            self.files = {}
+            args.append(head)
+            logger.info(f"build git history: {head}")
+
+        try:
+            self.apply_log(git_stream(self.repo_path, args))
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.error(f"git log failed: {e}")
+            self.files = {}
+            self.indexed = None
+            self.head = None
+            return
+        self.indexed = head
+        self.save()
+
+    def apply_log(self, lines):
+        """ 按时间正序应用 git log --name-status 输出 """
+        date = None
+        for line in lines:
+            if not line:
+                continue
+            if line.startswith(COMMIT_MARK):
+                date = line[1:].split('\x00', 1)[1]
+                continue
+            fields = line.split('\t')
+            status = fields[0][:1]
+            if status in ('R', 'C') and len(fields) == 3:
+                old_path, new_path = fields[1], fields[2]
+                entry = self.files.get(old_path)
+                if status == 'R':
+                    self.files.pop(old_path, None)
+                first = entry[0] if entry is not None else date
+                self.files[new_path] = [first, date]
+            elif status == 'D':
+                self.files.pop(fields[1], None)
+            elif len(fields) == 2:
+                entry = self.files.get(fields[1])
+                if entry is None:
+                    self.files[fields[1]] = [date, date]
+                else:
+                    entry[1] = date
+
+    def get_dates(self, relative_path):
+        """ 返回 (创建时间, 最后修改时间), 没有提交记录时返回 None """
+        self.sync()
+        entry = self.files.get(relative_path.replace(os.sep, '/'))
+        if entry is None:
+            return None
+        return entry[0], entry[1]
@@ -0,0 +1,150 @@
+import os
+import subprocess
+
+from util.logger import Logger
+from util.git import git_output, CREATE_NO_WINDOW
+from util.resource_index import ResourceIndex
+
+logger = Logger(__file__)
+
+# 符号链接和子模块不是普通文件, 不发布
+SKIP_MODES = ('120000', '160000')
+
+
+class GitSnapshot():
+    """
+    仓库在某个 commit 的只读快照\n
+    git ls-tree 一次列出全部文件和 blob id, 文件内容通过一个常驻的 git cat-file --batch 进程读取, 不读取工作区,
+    运行过程中笔记被修改也不会发布半截的内容
+    """
+
+    def __init__(self, repo_path, rev='HEAD'):
+        self.repo_path = repo_path
+        self.rev = rev
+        self.commit = None
+        self.files = {}
+        self.process = None
+
+    def open(self):
+        """ 解析 commit 并列出 repo_path 下的文件, 返回 self """
+        try:
+            self.commit = git_output(self.repo_path, ['rev-parse', '--verify', f"{self.rev}^{{commit}}"]).strip()
+            # 在子目录中执行时只列出子目录下的文件, 路径相对子目录
+            output = git_output(self.repo_path, ['ls-tree', '-r', '-l', '-z', self.commit])
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.error(f"open git snapshot failed: {self.repo_path} {self.rev} {e}")
+            raise
+        self.files = {}
+        for entry in output.split('\x00'):
+            if not entry:
+                continue
+            info, path = entry.split('\t', 1)
+            mode, obj_type, blob_id, size = info.split()
+            if obj_type != 'blob' or mode in SKIP_MODES:
+                continue
+            self.files[path] = (blob_id, int(size))
+        logger.info(f"git snapshot: {self.commit} {len(self.files)} files")
+        return self
+
+    def get_rel_path(self, path):
+        return os.path.relpath(path, self.repo_path).replace(os.sep, '/')
+
+    def get_paths(self, excluder, extension):
+        """ 返回快照中没有被排除的指定后缀的文件绝对路径, 按路径排序 """
+        paths = []
+        for rel_path in self.files:
+            if rel_path.endswith(extension) and not excluder.match_path(rel_path):
+                paths.append(os.path.join(self.repo_path, rel_path.replace('/', os.sep)))
+        return sorted(paths)
+
+    def get_entry(self, path):
+        """ 返回 (blob id, 大小), 文件不在快照中时返回 None """
+        return self.files.get(self.get_rel_path(path))
+
+    def read_file(self, path):
+        entry = self.get_entry(path)
+        if entry is None:
+            raise FileNotFoundError(f"not in git snapshot {self.commit}: {path}")
+        return self.read(entry[0])
+
+    def read(self, blob_id):
+        """ 返回 blob 内容 bytes """
+        if self.process is None:
+            self.process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=self.repo_path, stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                            creationflags=CREATE_NO_WINDOW)
+        self.process.stdin.write(f"{blob_id}\n".encode())
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().decode().split()
+        if len(header) != 3:
+            raise OSError(f"git cat-file failed: {blob_id} {' '.join(header)}")
+        data = self.process.stdout.read(int(header[2]))
+        # 内容后面还有一个换行
+        self.process.stdout.read(1)
+        return data
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.stdout.close()
+            self.process.wait()
+            self.process = None
+
+
+class SnapshotResourceIndex(ResourceIndex):
+    """
+    快照中资源文件夹的索引\n
+    资源在第一次用到时从 git 取出, 按 blob id 保存在 blob_dir 中, 之后的运行直接复用
+    """
+
+    def __init__(self, resource, snapshot, blob_dir):
+        super().__init__(resource)
+        self.snapshot = snapshot
+        self.blob_dir = blob_dir
+        self.blobs = {}
+        self.used = set()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['snapshot'] = None
+        state['blobs'] = {}
+        return state
+
+    def update(self):
+        prefix = self.snapshot.get_rel_path(self.resource) + '/'
+        self.paths = {}
+        self.blobs = {}
+        for rel_path, (blob_id, size) in self.snapshot.files.items():
+            if rel_path.startswith(prefix):
+                self.paths[rel_path[len(prefix):]] = [size, 0]
+                self.blobs[rel_path[len(prefix):]] = blob_id
+        self.build_names()
+        logger.info(f"snapshot resource index: {len(self.paths)} files")
+        return self
+
+    def get_full_path(self, link):
+        rel_path = self.get_path(link)
+        if rel_path is None:
+            return None
+        blob_id = self.blobs[rel_path]
+        path = os.path.join(self.blob_dir, blob_id[:2], blob_id)
+        if blob_id not in self.used and not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self.snapshot.read(blob_id))
+            os.replace(tmp_path, path)
+        self.used.add(blob_id)
+        return path
+
+    def prune(self):
+        """ 删除本次没有用到的资源 """
+        if not os.path.exists(self.blob_dir):
+            return
+        removed = 0
+        for folder in os.listdir(self.blob_dir):
+            for name in os.listdir(os.path.join(self.blob_dir, folder)):
+                if name not in self.used:
+                    os.remove(os.path.join(self.blob_dir, folder, name))
+                    removed += 1
+        logger.info(f"snapshot resources: {len(self.used)} used, {removed} removed")
@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import shutil
+import traceback
+from functools import partial
+from html import escape
+from urllib.parse import quote
+
+from util.logger import Logger
+from util.build_cache import get_file_hash, get_text_hash
+
+logger = Logger(__file__)
+
+# 只处理这些位图, gif (可能是动图) 和 svg 等保持原样
+OPTIMIZE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+PATTERN_IMAGE = re.compile(r'!\[\]\(/images/([^)]*)\)')
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+SAVE_OPTIONS = {
+    'webp': {'method': 6},
+    'avif': {'speed': 6},
+    'jpeg': {'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+}
+
+
+def get_fallback_format(name):
+    """ 不支持 webp/avif 的浏览器使用的格式, jpg 仍然输出 jpg, 其余输出 png """
+    return 'jpeg' if name.lower().endswith(('.jpg', '.jpeg')) else 'png'
+
+
+def get_ext(image_format):
+    return 'jpg' if image_format == 'jpeg' else image_format
+
+
+def rewrite_images(content, image_html):
+    """ 把 ![](/images/图片名) 替换为 picture 标签, 没有优化的图片保持原样 """
+    if not image_html:
+        return content
+    return PATTERN_IMAGE.sub(lambda m: image_html.get(m.group(1), m.group()), content)
+
+
+def get_available_formats(formats):
+    """ 过滤掉当前 Pillow 不支持编码的格式, 没有安装 Pillow 时返回 None """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    if 'avif' in formats:
+        try:
+            import pillow_avif  # noqa: F401  老版本 Pillow 通过插件支持 avif
+        except ImportError:
+            pass
+    Image.init()
+    available = []
+    for image_format in formats:
+        if image_format.upper() in Image.SAVE:
+            available.append(image_format)
+        else:
+            logger.warning(f"image format not supported by Pillow, skip: {image_format}")
+    return available
+
+
+def encode_image(source_path, output_dir, formats, widths, quality):
+    """ 生成各个宽度和格式的图片, 返回 ([(格式, 宽度)], 异常信息) """
+    tmp_dir = f"{output_dir}.tmp"
+    try:
+        from PIL import Image, ImageOps
+        variants = []
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+            # 超过原图宽度的尺寸用原图宽度代替
+            for width in sorted(set(min(width, image.width) for width in widths)):
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                for image_format in formats:
+                    frame = resized.convert('RGB') if image_format == 'jpeg' else resized
+                    frame.save(os.path.join(tmp_dir, f"{width}.{get_ext(image_format)}"), image_format.upper(),
+                               quality=quality, **SAVE_OPTIONS.get(image_format, {}))
+                    variants.append((image_format, width))
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(tmp_dir, output_dir)
+        return variants, None
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None, f"{e} trackback:{traceback.format_exc()}"
+
+
+class ImageOptimizer():
+    """
+    生成缩小和重新压缩的图片 (webp/avif 和原格式), 文章中的图片替换为带 srcset 的 picture 标签\n
+    生成结果按 原图内容 hash + 参数 缓存在 cache_dir 下, 同一张图片只在第一次出现或者修改后编码, 编码在进程池中执行\n
+    需要安装 Pillow, 没有安装时保持原图
+    """
+
+    def __init__(self, cache_dir, widths, formats, quality, executor=None, dry_run=False):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.widths = sorted(set(int(width) for width in widths))
+        self.formats = get_available_formats([image_format.lower() for image_format in formats])
+        self.quality = quality
+        self.executor = executor
+        self.dry_run = dry_run
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'sources': {}, 'derivatives': {}}
+        try:
+            with open(self.manifest_path, "r", encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"load image manifest failed: {e}")
+            return {'sources': {}, 'derivatives': {}}
+
+    def save_manifest(self, manifest):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def get_source_hash(self, sources, path):
+        """ stat 签名不变时复用上次的内容 hash """
+        stat = os.stat(path)
+        cached = sources.get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        file_hash = get_file_hash(path)
+        sources[path] = [stat.st_size, stat.st_mtime_ns, file_hash]
+        return file_hash
+
+    def is_cached(self, key, variants):
+        output_dir = os.path.join(self.cache_dir, key)
+        return variants is not None and all(os.path.exists(os.path.join(output_dir, f"{width}.{get_ext(image_format)}"))
+                                            for image_format, width in variants)
+
+    def optimize(self, images):
+        """
+        images: {图片名: 原图路径}\n
+        返回 {图片名: ({输出路径 (相对 images/ 的上级目录): 缓存文件路径}, picture 标签)}, 不处理的图片不在结果中
+        """
+        if self.formats is None:
+            logger.error("image optimize needs Pillow: pip install Pillow")
+            return {}
+        manifest = self.load_manifest()
+        sources = manifest['sources']
+        derivatives = manifest['derivatives']
+        keys = {}
+        todo = []
+        todo_keys = set()
+        for name, path in sorted(images.items()):
+            if path is None or not name.lower().endswith(OPTIMIZE_EXTS):
+                continue
+            try:
+                source_hash = self.get_source_hash(sources, path)
+            except OSError as e:
+                logger.warning(f"read image failed: {path} {e}")
+                continue
+            fallback = get_fallback_format(name)
+            formats = self.formats + [fallback] if fallback not in self.formats else self.formats
+            key = get_text_hash(json.dumps([source_hash, self.widths, formats, self.quality]))
+            keys[name] = (key, fallback)
+            if not self.is_cached(key, derivatives.get(key)) and key not in todo_keys:
+                todo_keys.add(key)
+                todo.append((path, key, formats))
+
+        if self.dry_run:
+            logger.info(f"dry run, images to encode: {len(todo)}/{len(keys)}")
+        else:
+            logger.info(f"encode images: {len(todo)}/{len(keys)}")
+            encoder = partial(encode_image, widths=self.widths, quality=self.quality)
+            args = ([path for path, key, formats in todo], [os.path.join(self.cache_dir, key) for path, key, formats in todo],
+                    [formats for path, key, formats in todo])
+            if self.executor is None:
+                results = map(encoder, *args)
+            else:
+                results = self.executor.map(encoder, *args)
+            for (path, key, formats), (variants, error) in zip(todo, results):
+                if error is not None:
+                    # 记录失败, 原图修改之前不再重试, 使用原图
+                    logger.error(f"encode image failed: {path} Exception:{error}")
+                    variants = []
+                derivatives[key] = variants
+
+        result = {}
+        for name, (key, fallback) in keys.items():
+            variants = derivatives.get(key)
+            if not variants or not self.is_cached(key, variants):
+                continue
+            result[name] = self.get_outputs(name, key, variants, fallback)
+        if not self.dry_run:
+            # 只保留本次用到的图片, 参数修改后旧的结果会被清理
+            used = set(key for key, fallback in keys.values())
+            for key in list(derivatives):
+                if key not in used:
+                    del derivatives[key]
+                    shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            manifest['sources'] = {path: sources[path] for path in images.values() if path in sources}
+            self.save_manifest(manifest)
+        return result
+
+    def get_outputs(self, name, key, variants, fallback):
+        outputs = {}
+        srcsets = {}
+        for image_format, width in variants:
+            output_name = f"images/{name}.{width}.{get_ext(image_format)}"
+            outputs[output_name] = os.path.join(self.cache_dir, key, f"{width}.{get_ext(image_format)}")
+            srcsets.setdefault(image_format, []).append(f"/{quote(output_name)} {width}w")
+        largest = max(width for image_format, width in variants)
+        html = "<picture>"
+        for image_format in self.formats:
+            if image_format in srcsets:
+                html += f'<source type="{MIME_TYPES.get(image_format, "image/" + image_format)}" srcset="{escape(", ".join(srcsets[image_format]))}">'
+        html += (f'<img src="/{escape(quote(f"images/{name}.{largest}.{get_ext(fallback)}"))}" '
+                 f'srcset="{escape(", ".join(srcsets[fallback]))}" alt="" loading="lazy"></picture>')
+        return outputs, html
@@ -0,0 +1,128 @@
+import os
+import json
+from array import array
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+
+class LinkGraph():
+    """
+    笔记双链图\n
+    笔记用整数 id 表示, 出边和入边保存在 array 中; 修改一篇笔记的出链时只更新相关的边, 并返回反向链接或脑图变化的笔记
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self.ids = {}
+        self.paths = []
+        self.targets = []
+        self.headings = []
+        self.sources = []
+
+    def get_id(self, path):
+        node_id = self.ids.get(path)
+        if node_id is None:
+            node_id = len(self.paths)
+            self.ids[path] = node_id
+            self.paths.append(path)
+            self.targets.append(array('i'))
+            self.headings.append(())
+            self.sources.append(array('i'))
+        return node_id
+
+    def load(self):
+        """ 读取上次运行的图, 用于比较本次运行哪些笔记的链接发生了变化 """
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return self
+        try:
+            with open(self.cache_path, "r", encoding='utf-8') as f:
+                edges = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"load link graph failed: {e}")
+            return self
+        for path, links in edges.items():
+            self.set_links(path, [tuple(link) for link in links])
+        return self
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        edges = {}
+        for node_id, path in enumerate(self.paths):
+            if len(self.targets[node_id]) > 0:
+                edges[path] = self.get_links(path)
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(edges, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def get_links(self, path):
+        """ 返回 [(目标路径, 标题)], 标题为 None 表示链接到整篇笔记 """
+        node_id = self.ids.get(path)
+        if node_id is None:
+            return []
+        return [(self.paths[target], heading) for target, heading in zip(self.targets[node_id], self.headings[node_id])]
+
+    def get_backlinks(self, path):
+        """ 链接到这篇笔记的笔记路径 """
+        node_id = self.ids.get(path)
+        if node_id is None:
+            return []
+        return [self.paths[source] for source in self.sources[node_id]]
+
+    def get_sources(self):
+        """ 有出链的笔记 """
+        return [path for node_id, path in enumerate(self.paths) if len(self.targets[node_id]) > 0]
+
+    def set_links(self, path, links):
+        """
+        设置笔记的出链 [(目标路径, 标题)], 重复的链接只保留一条\n
+        返回脑图或反向链接发生变化的笔记路径
+        """
+        node_id = self.get_id(path)
+        edges = sorted(set((self.get_id(target), heading or '') for target, heading in links))
+        old_edges = list(zip(self.targets[node_id], self.headings[node_id]))
+        if edges == old_edges:
+            return set()
+
+        old_targets = set(self.targets[node_id])
+        new_targets = set(target for target, heading in edges)
+        self.targets[node_id] = array('i', [target for target, heading in edges])
+        self.headings[node_id] = tuple(heading for target, heading in edges)
+        for target in old_targets - new_targets:
+            sources = self.sources[target]
+            sources.remove(node_id)
+        for target in new_targets - old_targets:
+            self.sources[target].append(node_id)
+
+        changed = {path}
+        for target in old_targets ^ new_targets:
+            changed.add(self.paths[target])
+        return changed
+
+    def remove(self, path):
+        """ 删除笔记的出链, 返回受影响的笔记 """
+        if path not in self.ids:
+            return set()
+        return self.set_links(path, [])
+
+    def count_edges(self):
+        return sum(len(targets) for targets in self.targets)
+
+    def export(self, notes):
+        """ 导出给网站关系图使用的 json, 只包含 notes 中的笔记 (发布的笔记) """
+        nodes = []
+        index = {}
+        for note in notes:
+            index[note.file_path] = len(nodes)
+            nodes.append({'id': note.create_hash, 'name': note.file_name, 'url': f"/{note.create_hash}/"})
+        links = []
+        for note in notes:
+            # 按导出顺序排列, 结果和笔记 id 的分配顺序无关
+            targets = set(index[target] for target, heading in self.get_links(note.file_path) if target in index)
+            for target in sorted(targets):
+                links.append({'source': index[note.file_path], 'target': target})
+        return {'nodes': nodes, 'links': links}
@@ -0,0 +1,128 @@
+import os
+import re
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+PATTERN_HEADING = re.compile(r'^#{1,6}\s+(.+?)\s*#*\s*$', re.M)
+
+
+def split_link(link):
+    """ 拆分 [[note#heading|alias]] 为 (note, heading) """
+    if '|' in link:
+        link = link.split('|', 1)[0]
+    heading = None
+    if '#' in link:
+        link, heading = link.split('#', 1)
+        heading = heading.strip()
+    return link.strip(), heading
+
+
+def normalize_path(path):
+    """ 统一为不带后缀的 / 分隔相对路径 """
+    path = path.replace(os.sep, '/').replace('\\', '/').strip('/')
+    if path.endswith('.md'):
+        path = path[:-3]
+    return path
+
+
+def normalize_heading(heading):
+    return ' '.join(heading.split()).casefold()
+
+
+class LinkResolver():
+    """
+    每次运行构建一次的双链索引\n
+    按文件名, 相对路径(含后缀路径), 忽略大小写以及别名查找笔记, 重名时按固定规则选择并记录
+    """
+
+    def __init__(self, notes):
+        self.names = {}
+        self.paths = {}
+        self.folded = {}
+        self.aliases = {}
+        self.headings = {}
+        self.ambiguous = {}
+        for note in notes:
+            self.add(note)
+        for index in (self.names, self.paths, self.folded, self.aliases):
+            for candidates in index.values():
+                candidates.sort(key=self.sort_key)
+        self.report_ambiguous()
+
+    @staticmethod
+    def sort_key(note):
+        return note.depth, note.real_path
+
+    def add(self, note):
+        rel_path = normalize_path(note.real_path)
+        self.names.setdefault(note.file_name, []).append(note)
+        self.folded.setdefault(note.file_name.casefold(), []).append(note)
+        parts = rel_path.split('/')
+        for i in range(len(parts) - 1):
+            suffix = '/'.join(parts[i:])
+            self.paths.setdefault(suffix, []).append(note)
+            self.folded.setdefault(suffix.casefold(), []).append(note)
+        for alias in note.aliases:
+            self.aliases.setdefault(alias.casefold(), []).append(note)
+
+    def report_ambiguous(self):
+        for name in sorted(self.names):
+            candidates = self.names[name]
+            if len(candidates) > 1:
+                self.ambiguous[name] = candidates
+                paths = [note.real_path for note in candidates]
+                logger.warning(f"ambiguous note name: {name} -> {paths}, use {paths[0]}")
+
+    def pick(self, candidates, source):
+        """ 重名时优先同目录的笔记, 其次路径最短, 最后按路径排序 """
+        if len(candidates) == 1 or source is None:
+            return candidates[0]
+        source_dir = os.path.dirname(source.real_path)
+        for note in candidates:
+            if os.path.dirname(note.real_path) == source_dir:
+                return note
+        return candidates[0]
+
+    def resolve(self, link, source=None):
+        """ 返回链接指向的笔记, 找不到返回 None """
+        name = normalize_path(split_link(link)[0])
+        if name == '':
+            return None
+        if '/' in name:
+            candidates = self.paths.get(name)
+        else:
+            candidates = self.names.get(name)
+        if candidates is None:
+            candidates = self.folded.get(name.casefold())
+        if candidates is None:
+            candidates = self.aliases.get(name.casefold())
+        if candidates is None:
+            return None
+        return self.pick(candidates, source)
+
+    def get_headings(self, note):
+        """ 笔记中的标题, 用于校验 [[note#heading]], 跳过标签行和 front-matter """
+        headings = self.headings.get(note.file_path)
+        if headings is None:
+            if note.is_loaded:
+                released = note.content is None
+                if released:
+                    note.restore()
+                content = note.content
+                if released:
+                    note.release()
+            else:
+                # 快照模式下读取快照中的内容, 工作区中已经删除的笔记当作没有标题
+                try:
+                    content = note.get_content()[1]
+                except OSError as e:
+                    logger.warning(f"read headings failed: {note.file_path} {e}")
+                    content = ''
+            headings = set(normalize_heading(h) for h in PATTERN_HEADING.findall(content))
+            self.headings[note.file_path] = headings
+        return headings
+
+    def has_heading(self, note, heading):
+        return normalize_heading(heading) in self.get_headings(note)
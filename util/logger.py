@@ -3,9 +3,11 @@ import os
 import sys
 import gzip
 import time
+import atexit
 import socket
-from inspect import getframeinfo, stack
-from logging.handlers import TimedRotatingFileHandler, RotatingFileHandler
+import multiprocessing
+from queue import SimpleQueue
+from logging.handlers import TimedRotatingFileHandler, RotatingFileHandler, QueueHandler, QueueListener
 
 sys.path.append("..")
 from util.singleton import Singleton
@@ -23,7 +25,11 @@ class Logger(Singleton):
         self.hostname = socket.gethostname()
         self.logger = logging.getLogger(self.log_name)
         self.logger.setLevel(logging.DEBUG)
-        self.formatter = logging.Formatter("[%(asctime)s]-[%(levelname)s]-[thread:%(thread)s]-[process:%(process)s]%(message)s")
+        self.formatter = logging.Formatter("[%(asctime)s]-[%(levelname)s]-[thread:%(thread)s]-[process:%(process)s]"
+                                           "-[%(filename)s:%(lineno)d] > %(message)s")
+        self.listener = None
+        self.process_queue = None
+        self.process_listener = None
 
         # logger 开关
         if not debug:
@@ -62,83 +68,105 @@ class Logger(Singleton):
                 self.logger.addHandler(th)
                 print(f"logger:>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> add time rotation handler path:{logname}")
 
-    def set_handler(self, handler):
-        caller = getframeinfo(stack()[1][0])
-        if '/' in caller.filename:
-            log_name = caller.filename.split('/')[-1]
-        else:
-            log_name = caller.filename.split('\\')[-1]
+    def set_handler(self, handler, background=True):
         """
         实例化后也可以设置handler
         handler: 'file', 'time'
         这两个 handler 只能设置一个, 否则会有冲突
+        background: 文件写入和日志压缩放到后台线程
         """
+        log_name = os.path.basename(sys._getframe(1).f_code.co_filename)
         filename = os.path.realpath(__file__)
         cur_file_path = os.path.dirname(filename)
         log_path = f"{cur_file_path}/../log"
         logname = f"{log_path}/{log_name}.log"  # 指定输出的日志文件名
         os.makedirs(log_path, exist_ok=True)
         print(f"log file path:{logname}")
+        file_handler = None
         if handler == "file":
             # 写入文件，如果文件超过100M大小时，切割日志文件，仅保留3个文件
-            fh = GzRotatingFileHandler(filename=logname, maxBytes=100 * 1024 * 1024, backupCount=3, encoding='utf-8')
-            fh.setLevel(logging.DEBUG)
-            fh.setFormatter(self.formatter)
-            self.logger.addHandler(fh)
+            file_handler = GzRotatingFileHandler(filename=logname, maxBytes=100 * 1024 * 1024, backupCount=3, encoding='utf-8')
             print(f"logger:>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> add file rotation handler path:{logname}")
 
         if handler == "time":
             # 创建一个handler，每天生成一个文件 time
-            th = GzTimedRotatingFileHandler(filename=logname, when="MIDNIGHT", backupCount=3, encoding="utf-8")
-            th.suffix = "%Y-%m-%d_%H-%M-%S.log"
-            th.setLevel(logging.DEBUG)
-            th.setFormatter(self.formatter)
-            self.logger.addHandler(th)
+            file_handler = GzTimedRotatingFileHandler(filename=logname, when="MIDNIGHT", backupCount=3, encoding="utf-8")
+            file_handler.suffix = "%Y-%m-%d_%H-%M-%S.log"
             print(f"logger:>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> add time rotation handler path:{logname}")
 
-    def debug(self, msg):
-        caller = getframeinfo(stack()[1][0])
-        if '/' in caller.filename:
-            filename = caller.filename.split('/')[-1]
-        else:
-            filename = caller.filename.split('\\')[-1]
-        line_num = caller.lineno
-        log_prefix = f"-[{filename}:{line_num}] > "
-
-        self.logger.debug(log_prefix + str(msg))
-
-    def info(self, msg):
-        caller = getframeinfo(stack()[1][0])
-        if '/' in caller.filename:
-            filename = caller.filename.split('/')[-1]
-        else:
-            filename = caller.filename.split('\\')[-1]
-        line_num = caller.lineno
-        log_prefix = f"-[{filename}:{line_num}] > "
-
-        self.logger.info(log_prefix + str(msg))
-
-    def warning(self, msg):
-        caller = getframeinfo(stack()[1][0])
-        if '/' in caller.filename:
-            filename = caller.filename.split('/')[-1]
-        else:
-            filename = caller.filename.split('\\')[-1]
-        line_num = caller.lineno
-        log_prefix = f"-[{filename}:{line_num}] > "
-
-        self.logger.warning(log_prefix + str(msg))
-
-    def error(self, msg):
-        caller = getframeinfo(stack()[1][0])
-        if '/' in caller.filename:
-            filename = caller.filename.split('/')[-1]
+        if file_handler is None:
+            return
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(self.formatter)
+        if not background:
+            self.logger.addHandler(file_handler)
+            return
+        if self.listener is None:
+            queue = SimpleQueue()
+            self.logger.addHandler(QueueHandler(queue))
+            self.listener = QueueListener(queue, file_handler, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.stop)
         else:
-            filename = caller.filename.split('\\')[-1]
-        line_num = caller.lineno
-        log_prefix = f"-[{filename}:{line_num}] > "
+            self.listener.handlers += (file_handler,)
+            if self.process_listener is not None:
+                self.process_listener.handlers += (file_handler,)
 
-        self.logger.error(log_prefix + str(msg))
+    def get_process_queue(self):
+        """
+        子进程的日志队列, 在主进程中调用, 没有后台写文件时返回 None\n
+        子进程调用 forward(queue) 后, 日志由主进程的后台线程写入同一个文件, 不会各自打开文件和切割
+        """
+        if self.listener is None:
+            return None
+        if self.process_listener is None:
+            self.process_queue = multiprocessing.Queue()
+            self.process_listener = QueueListener(self.process_queue, *self.listener.handlers, respect_handler_level=True)
+            self.process_listener.start()
+        return self.process_queue
+
+    def forward(self, queue):
+        """
+        在子进程中调用, 去掉继承的文件 handler, 写文件的日志通过 queue 交给主进程\n
+        queue 为 None 时只输出到控制台
+        """
+        for handler in list(self.logger.handlers):
+            if isinstance(handler, (QueueHandler, logging.FileHandler)):
+                self.logger.removeHandler(handler)
+        # fork 时复制过来的后台线程并没有运行
+        self.listener = None
+        self.process_listener = None
+        if queue is not None:
+            self.logger.addHandler(QueueHandler(queue))
+
+    def stop(self):
+        """ 停止后台线程, 写完队列中剩余的日志 """
+        if self.process_listener is not None:
+            self.process_listener.stop()
+            self.process_listener = None
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def set_level(self, level):
+        self.logger.setLevel(level)
+
+    # 参数在级别开启时才格式化, 循环中的日志用 logger.info("...: %s", value) 而不是 f-string
+    def debug(self, msg, *args):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, *args, stacklevel=2)
+
+    def info(self, msg, *args):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, *args, stacklevel=2)
+
+    def warning(self, msg, *args):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger.warning(msg, *args, stacklevel=2)
+
+    def error(self, msg, *args):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger.error(msg, *args, stacklevel=2)
 
 
 class GzRotatingFileHandler(RotatingFileHandler):
@@ -0,0 +1,198 @@
+import os
+import re
+
+PATTERN_FENCE = re.compile(r'^\s*(`{3,}|~{3,})')
+PATTERN_FENCE_INFO = re.compile(r'((```\w*)(?=\s))(.*)')
+PATTERN_CODE_SPAN = re.compile(r'(`+)(.+?)(?<!`)\1(?!`)')
+# 附件链接的文字中可以有一层方括号, 如 [说明 [1]](附件)
+PATTERN_TOKEN = re.compile(r'!\[\[(?P<embed>[^\]]*?)\]\]'
+                           r'|!\[(?P<alt>[^\]]*)\]\((?P<image>[^)]*)\)'
+                           r'|\[\[(?P<link>[^\]]*?)\]\]'
+                           r'|(?<!\S)\[(?P<text>(?:[^\[\]]|\[[^\[\]]*\])*)\]\((?P<file>[^)]*)\)')
+
+
+def split_code_spans(line):
+    """ 拆分行内代码, 返回 [(是否代码, 文本)] """
+    parts = []
+    pos = 0
+    for m in PATTERN_CODE_SPAN.finditer(line):
+        if m.start() > pos:
+            parts.append((False, line[pos:m.start()]))
+        parts.append((True, m.group()))
+        pos = m.end()
+    if pos < len(line):
+        parts.append((False, line[pos:]))
+    return parts
+
+
+class MarkdownTokenizer():
+    """
+    单遍扫描笔记正文\n
+    识别代码块, front-matter 和行内代码, 收集图片, 附件, 双链和嵌入的笔记, 同时完成 hexo 需要的格式转换
+    """
+
+    def __init__(self, is_res_available):
+        self.is_res_available = is_res_available
+
+    def emit(self, line, is_last=False, spans=()):
+        """ 输出一行, 上一行含有 ## 时在非空行前补空行 """
+        self.blank_candidate = None
+        if self.need_blank:
+            if line != '' or is_last:
+                self.lines.append('')
+            else:
+                # 空行之后如果是标题会被补上空格, 那时再补空行
+                self.blank_candidate = len(self.lines)
+        self.need_blank = False
+        for target, start, end in spans:
+            target.append((len(self.lines), start, end))
+        self.lines.append(line)
+
+    def transform(self, content, front_matter=False):
+        """ 返回 (正文, 图片, 附件, 双链, 双链位置), 嵌入的笔记和位置保存在 embeds 和 embed_spans 中 """
+        self.lines = []
+        self.images = []
+        self.files = []
+        self.links = []
+        self.link_spans = []
+        self.embeds = []
+        self.embed_spans = []
+        self.missing = []
+        self.need_blank = False
+        self.blank_candidate = None
+        lines = content.split('\n')
+        fence = None
+        last_index = len(lines) - 1
+        for index, line in enumerate(lines):
+            is_last = index == last_index
+            if front_matter:
+                if line.strip() == '---':
+                    front_matter = False
+                continue
+
+            m = PATTERN_FENCE.match(line)
+            if fence is not None:
+                if m is not None and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) \
+                        and line.strip() == m.group(1):
+                    fence = None
+                self.emit(line, is_last)
+                continue
+            if m is not None:
+                fence = m.group(1)
+                line = PATTERN_FENCE_INFO.sub(r'\1', line).replace('```run-', '```')
+                self.emit(line, is_last)
+                continue
+
+            line, spans, has_heading = self.transform_line(line)
+            if line.startswith('##') and index > 0 and self.lines:
+                if self.blank_candidate == len(self.lines) - 1:
+                    self.lines.insert(self.blank_candidate, '')
+                self.lines[-1] += '  '
+                self.emit('  ')
+            self.emit(line, is_last, spans)
+            if has_heading and not is_last:
+                self.need_blank = True
+
+        content = '\n'.join(self.lines)
+        offsets = []
+        offset = 0
+        for line in self.lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+        link_spans = [[offsets[i] + start, offsets[i] + end] for i, start, end in self.link_spans]
+        self.embed_spans = [[offsets[i] + start, offsets[i] + end] for i, start, end in self.embed_spans]
+        return content, self.images, self.files, self.links, link_spans
+
+    def transform_line(self, line):
+        """ 转换一行正文, 行内代码保持不变, ?? 之后的内容替换为换行 """
+        parts = []
+        spans = []
+        has_heading = False
+        length = 0
+        for is_code, text in split_code_spans(line):
+            if is_code:
+                parts.append(text)
+                length += len(text)
+                continue
+            hide = text.find('??')
+            if hide >= 0:
+                text = text[:hide]
+            pos = 0
+            for m in PATTERN_TOKEN.finditer(text):
+                parts.append(text[pos:m.start()])
+                length += m.start() - pos
+                embeds = len(self.embeds)
+                token = self.transform_token(m)
+                if m.group('link') is not None:
+                    spans.append((self.link_spans, length, length + len(token)))
+                elif len(self.embeds) > embeds:
+                    spans.append((self.embed_spans, length, length + len(token)))
+                parts.append(token)
+                length += len(token)
+                pos = m.end()
+            rest = text[pos:]
+            parts.append(rest)
+            length += len(rest)
+            if '##' in text:
+                has_heading = True
+            if hide >= 0:
+                parts.append('  ')
+                break
+        return ''.join(parts), spans, has_heading
+
+    def check_res(self, name):
+        """ 检查资源是否存在, 记录缺失的资源, 资源新增后需要重新解析 """
+        if self.is_res_available(name):
+            return True
+        self.missing.append(name)
+        return False
+
+    def transform_token(self, m):
+        link = m.group()
+        if m.group('embed') is not None:
+            image = m.group('embed')
+            if '|' in image:
+                image = image.split('|')[0].strip()
+            if self.check_res(image):
+                self.images.append(image)
+                return f"![](/images/{image})"
+            # 不是资源时按嵌入笔记处理, 生成文章时展开
+            self.embeds.append(m.group('embed'))
+            return link
+        if m.group('image') is not None:
+            if 'http' in link:
+                return link
+            image = m.group('image')
+            if '/' in image:
+                image = image.split('/')[-1].strip()
+            if self.check_res(image):
+                self.images.append(image)
+                return f"![](/images/{image})"
+            return link
+        if m.group('link') is not None:
+            link_file = m.group('link').replace("/", os.sep)
+            self.links.append(link_file)
+            return f"[[{link_file}]]"
+        if 'http' in link:
+            return link
+        file = m.group('file')
+        if self.check_res(file):
+            self.files.append(file)
+            return f"[{file}](/download/{file})"
+        return link
+
+
+def render_spans(content, replacements, start=0, end=None):
+    """ 按位置替换 content[start:end] 中的片段, replacements: [(开始, 结束, 文本)], 只替换完全在范围内的片段 """
+    if end is None:
+        end = len(content)
+    parts = []
+    pos = start
+    for span_start, span_end, text in sorted(replacements):
+        if span_start < pos or span_end > end:
+            continue
+        parts.append(content[pos:span_start])
+        parts.append(text)
+        pos = span_end
+    parts.append(content[pos:end])
+    return ''.join(parts)
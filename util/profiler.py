@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import platform
+import threading
+from contextlib import contextmanager
+
+from util.logger import Logger
+from util.singleton import Singleton
+
+logger = Logger(__file__)
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def get_peak_rss():
+    """ 返回 (本进程峰值内存, 子进程峰值内存), 单位字节, 不支持的平台返回 None """
+    if resource is None:
+        try:
+            import psutil
+        except ImportError:
+            return None, None
+        return psutil.Process().memory_info().peak_wset, None
+    # linux 单位是 KB, macos 是字节
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+
+class Profiler(Singleton):
+    """
+    统计每次运行各阶段的耗时和处理量, 写入 json 报告\n
+    阶段可以嵌套, 名字用 / 连接; 同名阶段多次进入时累加
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.profile = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.start_time = time.time()
+        self.start_counter = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.path = []
+
+    @contextmanager
+    def stage(self, name):
+        self.path.append(name)
+        key = '/'.join(self.path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.path.pop()
+            self.record(key, time.perf_counter() - start)
+
+    def record(self, key, seconds):
+        """ 直接记录一次耗时, 其他线程中使用, 不参与阶段嵌套 """
+        with self.lock:
+            stage = self.stages.setdefault(key, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def start(self, mode=None):
+        """ mode: None, 'cprofile', 'tracemalloc' """
+        self.mode = mode
+        if mode == 'cprofile':
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif mode == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.start(10)
+
+    def stop(self, report_path, limit=30):
+        """ 结束 profile, 返回附加到报告中的结果 """
+        if self.mode == 'cprofile' and self.profile is not None:
+            import pstats
+            self.profile.disable()
+            prof_path = os.path.splitext(report_path)[0] + '.prof'
+            self.profile.dump_stats(prof_path)
+            stats = pstats.Stats(self.profile)
+            top = []
+            for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+                top.append({
+                    'function': f"{os.path.basename(func[0])}:{func[1]}({func[2]})",
+                    'calls': nc,
+                    'tottime': round(tt, 6),
+                    'cumtime': round(ct, 6),
+                })
+            top.sort(key=lambda item: item['cumtime'], reverse=True)
+            self.profile = None
+            return {'cprofile': {'stats_file': prof_path, 'top': top[:limit]}}
+        if self.mode == 'tracemalloc':
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                return {}
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            top = [{'line': str(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+                   for stat in snapshot.statistics('lineno')[:limit]]
+            return {'tracemalloc': {'current': current, 'peak': peak, 'top': top}}
+        return {}
+
+    def get_report(self, **extra):
+        peak_rss, peak_rss_children = get_peak_rss()
+        report = {
+            'start': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start_time)),
+            'seconds': round(time.perf_counter() - self.start_counter, 6),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'peak_rss': peak_rss,
+            'peak_rss_children': peak_rss_children,
+            'stages': {key: {'seconds': round(stage['seconds'], 6), 'calls': stage['calls']}
+                       for key, stage in self.stages.items()},
+            'counters': self.counters,
+        }
+        report.update(extra)
+        return report
+
+    def save(self, report_dir, keep_profile=False, **extra):
+        """ 写入 report_dir/run-时间.json, 返回报告路径; keep_profile 为 True 时 profile 继续运行 (watch 模式) """
+        os.makedirs(report_dir, exist_ok=True)
+        name = time.strftime('run-%Y%m%d-%H%M%S', time.localtime(self.start_time))
+        report_path = os.path.join(report_dir, f"{name}.json")
+        report = self.get_report(**extra)
+        if not keep_profile:
+            report.update(self.stop(report_path))
+        with open(report_path, "w", encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        for key, stage in report['stages'].items():
+            logger.info(f"stage {key}: {stage['seconds']:.3f}s x{stage['calls']}")
+        logger.info(f"run report: {report_path} {report['seconds']:.3f}s counters:{self.counters}")
+        return report_path
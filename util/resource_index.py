@@ -0,0 +1,141 @@
+import os
+import json
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+
+class ResourceIndex():
+    """
+    资源文件夹索引\n
+    每次运行扫描一次, 目录修改时间未变化时不重新列出目录, 只 stat 其中的文件 (原地修改文件不会改变目录的修改时间)
+    """
+
+    def __init__(self, resource, cache_path=None):
+        self.resource = resource
+        self.cache_path = cache_path
+        self.dirs = {}
+        self.paths = {}
+        self.names = {}
+
+    def __getstate__(self):
+        """ 传给子进程时只需要查找表 """
+        state = self.__dict__.copy()
+        state['dirs'] = {}
+        return state
+
+    def load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"load resource index failed: {e}")
+            return
+        if cache.get('resource') == self.resource:
+            self.dirs = cache.get('dirs', {})
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump({'resource': self.resource, 'dirs': self.dirs}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def scan_dir(self, rel_dir, mtime_ns):
+        subdirs = []
+        files = {}
+        with os.scandir(os.path.join(self.resource, rel_dir)) as it:
+            for entry in it:
+                name = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir():
+                    subdirs.append(name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+        return [mtime_ns, subdirs, files]
+
+    def restat_dir(self, rel_dir, cached):
+        """ 目录没有变化时刷新其中文件的大小和修改时间, 文件不存在时返回 None 重新列出目录 """
+        files = {}
+        for name in cached[2]:
+            try:
+                stat = os.stat(os.path.join(self.resource, rel_dir, name))
+            except OSError:
+                return None
+            files[name] = [stat.st_size, stat.st_mtime_ns]
+        return [cached[0], cached[1], files]
+
+    def update(self):
+        """ 增量刷新, 只重新列出修改时间变化的目录, 其余目录只 stat 文件 """
+        self.load()
+        dirs = {}
+        scanned = 0
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                mtime_ns = os.stat(os.path.join(self.resource, rel_dir)).st_mtime_ns
+            except OSError:
+                continue
+            cached = self.dirs.get(rel_dir)
+            if cached is not None and cached[0] == mtime_ns:
+                cached = self.restat_dir(rel_dir, cached)
+            if cached is None or cached[0] != mtime_ns:
+                cached = self.scan_dir(rel_dir, mtime_ns)
+                scanned += 1
+            dirs[rel_dir] = cached
+            stack.extend(cached[1])
+        self.dirs = dirs
+        self.build()
+        self.save()
+        logger.info(f"resource index: {len(self.paths)} files, {len(dirs)} dirs, rescanned {scanned}")
+        return self
+
+    def build(self):
+        self.paths = {}
+        for rel_dir, (mtime_ns, subdirs, files) in self.dirs.items():
+            for name, info in files.items():
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                self.paths[rel_path] = info
+        self.build_names()
+
+    def build_names(self):
+        """ 根据 paths 生成 文件名 -> 相对路径列表 """
+        self.names = {}
+        for rel_path in self.paths:
+            self.names.setdefault(rel_path.split('/')[-1], []).append(rel_path)
+        for candidates in self.names.values():
+            # obsidian 最短路径规则: 层级最浅的优先
+            candidates.sort(key=lambda p: (p.count('/'), p))
+
+    def get_path(self, link):
+        """ 返回资源相对路径, 找不到返回 None; 只写文件名时按最短路径匹配子目录中的文件, 带目录的路径必须完全一致 """
+        link = link.replace('\\', '/').strip('/')
+        if link in self.paths:
+            return link
+        if '/' in link:
+            return None
+        candidates = self.names.get(link)
+        if candidates is None:
+            return None
+        return candidates[0]
+
+    def get_size(self, link):
+        rel_path = self.get_path(link)
+        if rel_path is None:
+            return 0
+        return self.paths[rel_path][0]
+
+    def exists(self, link):
+        return self.get_path(link) is not None
+
+    def get_full_path(self, link):
+        rel_path = self.get_path(link)
+        if rel_path is None:
+            return None
+        return os.path.join(self.resource, rel_path)
@@ -0,0 +1,138 @@
+import os
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from util.logger import Logger
+from util.build_cache import get_file_hash
+
+logger = Logger(__file__)
+
+# linux FICLONE ioctl, btrfs/xfs 等文件系统支持写时复制
+FICLONE = 0x40049409
+
+
+def reflink(from_path, to_path):
+    import fcntl
+    with open(from_path, 'rb') as src, open(to_path, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(from_path, to_path)
+
+
+def is_same_file(from_path, to_path):
+    """ 目标文件大小和修改时间一致, 或者内容 hash 一致; 源文件不存在时返回 False """
+    if from_path is None:
+        return False
+    try:
+        to_stat = os.stat(to_path)
+        from_stat = os.stat(from_path)
+    except FileNotFoundError:
+        return False
+    if from_stat.st_size != to_stat.st_size:
+        return False
+    if from_stat.st_mtime_ns == to_stat.st_mtime_ns or os.path.samefile(from_path, to_path):
+        return True
+    return get_file_hash(from_path) == get_file_hash(to_path)
+
+
+class ResourceSync():
+    """
+    增量同步笔记引用的图片和附件\n
+    去重后跳过内容一致的文件, 支持 reflink/硬链接, 其余文件用线程池并发复制, 清理不再引用的文件
+    """
+
+    def __init__(self, path_to, manifest_path, link_mode='auto', max_workers=None, dry_run=False):
+        """
+        path_to: 资源输出根目录 (hexo 的 source 目录)\n
+        link_mode: 'auto', 'reflink', 'hardlink', 'copy'\n
+        dry_run: 只统计需要同步的文件, 不修改输出目录
+        """
+        self.path_to = path_to
+        self.manifest_path = manifest_path
+        self.link_mode = link_mode
+        self.max_workers = max_workers
+        self.dry_run = dry_run
+        self.can_reflink = link_mode in ('auto', 'reflink') and os.name != 'nt'
+        self.can_hardlink = link_mode in ('auto', 'hardlink')
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return set()
+        try:
+            with open(self.manifest_path, "r", encoding='utf-8') as f:
+                return set(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"load resource manifest failed: {e}")
+            return set()
+
+    def save_manifest(self, assets):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(sorted(assets), f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def place(self, from_path, to_path):
+        """ 先写临时文件再替换, 按 reflink -> 硬链接 -> 复制 的顺序尝试, 返回使用的方式 """
+        os.makedirs(os.path.dirname(to_path), exist_ok=True)
+        tmp_path = f"{to_path}.sync"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        method = 'copy'
+        if self.can_reflink:
+            try:
+                reflink(from_path, tmp_path)
+                method = 'reflink'
+            except (OSError, ImportError):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        if method == 'copy' and self.can_hardlink:
+            try:
+                os.link(from_path, tmp_path)
+                method = 'hardlink'
+            except OSError:
+                pass
+        if method == 'copy':
+            shutil.copy2(from_path, tmp_path)
+        os.replace(tmp_path, to_path)
+        return method
+
+    def sync_one(self, name, from_path):
+        """ 返回同步方式, 源文件已经不存在时返回 'missing' 并保留原来的输出 """
+        to_path = os.path.join(self.path_to, name)
+        if from_path is None or not os.path.exists(from_path):
+            logger.warning(f"resource not found, skip: {name} {from_path}")
+            return 'missing'
+        try:
+            if is_same_file(from_path, to_path):
+                return 'skip'
+            if self.dry_run:
+                return 'update' if os.path.exists(to_path) else 'add'
+            return self.place(from_path, to_path)
+        except OSError as e:
+            logger.error(f"sync resource failed: {from_path} -> {to_path} Exception:{e}")
+            return 'error'
+
+    def sync(self, assets):
+        """ assets: {相对 path_to 的目标路径: 源文件路径}, 返回 {同步方式: 文件数}, 删除的文件记为 removed """
+        counts = {}
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            for method in executor.map(self.sync_one, assets.keys(), assets.values()):
+                counts[method] = counts.get(method, 0) + 1
+
+        pruned = 0
+        for name in self.load_manifest() - set(assets):
+            to_path = os.path.join(self.path_to, name)
+            if os.path.exists(to_path):
+                if not self.dry_run:
+                    os.remove(to_path)
+                pruned += 1
+                logger.info("remove resource: %s", name)
+        if pruned:
+            counts['removed'] = pruned
+        if self.dry_run:
+            logger.info(f"dry run, sync resources: {len(assets)} {counts}")
+            return counts
+        self.save_manifest(assets)
+        logger.info(f"sync resources: {len(assets)} {counts} pruned {pruned}")
+        return counts
@@ -0,0 +1,158 @@
+import os
+import re
+import json
+
+from util.logger import Logger
+from util.build_cache import get_text_hash
+from util.staged_writer import StagedWriter
+
+logger = Logger(__file__)
+
+# 中日韩文字没有空格分词, 按相邻两个字切分 (单独一个字时保留单字), 其余按字母数字连续的词切分
+PATTERN_WORD = re.compile(r'[0-9a-z]+|[぀-ヿ㐀-鿿豈-﫿가-힯]+')
+PATTERN_URL = re.compile(r'\]\([^)]*\)|https?://\S+')
+MAX_WORD = 32
+# 非 ascii 开头的词按首字编码分到 CJK_SHARDS 个分片中, 和 search.js 保持一致
+CJK_SHARDS = 64
+TITLE_WEIGHT = 10
+TAG_WEIGHT = 5
+KEY_LENGTH = 10
+VERSION = 1
+
+
+def tokenize(text):
+    """ 返回词列表, 可能重复 """
+    terms = []
+    for word in PATTERN_WORD.findall(text.lower()):
+        if word[0] < '\u0080':
+            if 1 < len(word) <= MAX_WORD:
+                terms.append(word)
+        elif len(word) == 1:
+            terms.append(word)
+        else:
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+def get_terms(title, tags, content):
+    """ 统计一篇笔记的 {词: 权重}, 标题和标签中的词权重更高, 链接地址不参与索引 """
+    terms = {}
+    for term in tokenize(PATTERN_URL.sub(']', content)):
+        terms[term] = terms.get(term, 0) + 1
+    for term in tokenize(title):
+        terms[term] = terms.get(term, 0) + TITLE_WEIGHT
+    for tag in tags:
+        for term in tokenize(tag):
+            terms[term] = terms.get(term, 0) + TAG_WEIGHT
+    return terms
+
+
+def get_shard(term):
+    c = term[0]
+    if c < '\u0080':
+        return c
+    return f"u{ord(c) % CJK_SHARDS:02x}"
+
+
+class SearchIndex():
+    """
+    给网站前端用的倒排索引\n
+    每篇笔记的词表在解析时统计并保存在构建缓存中, 生成时只合并; 按词的首字分片, 前端只下载查询词所在的分片\n
+    watch 模式下常驻内存, 只重新生成词表变化的笔记涉及的分片; keep_terms 为 False 时不保留每篇文章的词表, 只能生成一次\n
+    docs.json: {'version', 'shards', 'docs': {文章键: [标题, 地址, 日期]}}, 分片 {首字}.json: {词: [[文章键, 权重]]}\n
+    分片逐个序列化后直接写入暂存目录, 内存中只保留已写入文件的 hash (files)
+    """
+
+    def __init__(self, folder='search', keep_terms=True):
+        self.folder = folder
+        self.keep_terms = keep_terms
+        self.docs = {}
+        self.terms = {}
+        self.postings = {}
+        self.shards = {}
+        self.files = {}
+
+    def remove_doc(self, key, dirty):
+        for term in self.terms.pop(key, {}):
+            postings = self.postings[term]
+            del postings[key]
+            shard = get_shard(term)
+            dirty.add(shard)
+            if not postings:
+                del self.postings[term]
+                self.shards[shard].discard(term)
+
+    def add_doc(self, key, terms, dirty):
+        if self.keep_terms:
+            self.terms[key] = terms
+        for term, score in terms.items():
+            self.postings.setdefault(term, {})[key] = score
+            shard = get_shard(term)
+            dirty.add(shard)
+            self.shards.setdefault(shard, set()).add(term)
+
+    def update(self, docs):
+        """ docs: [(文章键, 标题, 地址, 日期, {词: 权重})], 返回需要重新生成的文件名, 由 write 写入 """
+        dirty = set()
+        doc_map = {}
+        for key, title, url, date, terms in docs:
+            doc_map[key] = [title, url, date]
+            old_terms = self.terms.get(key)
+            if old_terms is terms or old_terms == terms:
+                continue
+            self.remove_doc(key, dirty)
+            self.add_doc(key, terms, dirty)
+        for key in set(self.terms) - set(doc_map):
+            self.remove_doc(key, dirty)
+
+        names = []
+        if doc_map != self.docs or 'docs.json' not in self.files:
+            self.docs = doc_map
+            names.append('docs.json')
+        names.extend(f"{shard}.json" for shard in sorted(dirty))
+        return names
+
+    def get_content(self, name):
+        """ 序列化一个文件, 分片中已经没有词时返回 None """
+        if name == 'docs.json':
+            return json.dumps({'version': VERSION, 'shards': CJK_SHARDS, 'docs': self.docs},
+                              ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        shard = name[:-len('.json')]
+        terms = self.shards.get(shard)
+        if not terms:
+            self.shards.pop(shard, None)
+            return None
+        content = {}
+        for term in terms:
+            content[term] = sorted(([key, score] for key, score in self.postings[term].items()),
+                                   key=lambda posting: (-posting[1], posting[0]))
+        return json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+    def write(self, names, folders, dry_run=False):
+        """
+        按 update 返回的文件名逐个序列化并写入每个目录的暂存区, 同一时间只有一个分片的内容在内存中;
+        第一次写入时删除目录中多余的分片, 返回是否有变化
+        """
+        full = len(self.files) == 0
+        writers = [StagedWriter(os.path.join(folder, self.folder), dry_run=dry_run) for folder in folders]
+        for name in names:
+            content = self.get_content(name)
+            if content is None:
+                self.files.pop(name, None)
+                for writer in writers:
+                    if os.path.exists(os.path.join(writer.folder, name)):
+                        writer.remove(name)
+                continue
+            content_hash = get_text_hash(content)
+            self.files[name] = content_hash
+            for writer in writers:
+                writer.put(name, content, content_hash)
+        changed = False
+        for writer in writers:
+            if full and os.path.exists(writer.folder):
+                for name in os.listdir(writer.folder):
+                    if name.endswith('.json') and name not in self.files:
+                        writer.remove(name)
+            if any(writer.commit().values()):
+                changed = True
+        return changed
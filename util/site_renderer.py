@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import traceback
+from string import Template
+from functools import partial
+from email.utils import formatdate
+from urllib.parse import quote, urlparse
+from xml.sax.saxutils import escape
+
+from util.logger import Logger
+from util.build_cache import get_text_hash
+from util.staged_writer import StagedWriter
+
+logger = Logger(__file__)
+
+PATTERN_PULLQUOTE = re.compile(r'\{% pullquote ([^%]*?)\s*%\}(.*?)\{% endpullquote %\}', re.S)
+TEMPLATES = ('post.html', 'list.html')
+OUTPUT_PREFIX = 'site/'
+FEED_SIZE = 20
+SUMMARY_SIZE = 200
+# 每批转换的文章数, 只有这一批的 markdown 和 html 同时在内存中
+RENDER_BATCH = 128
+
+markdown_parser = None
+
+
+def slugify(value, separator):
+    """ 和 hexo 一样直接用标题文字作为锚点 """
+    return value.strip()
+
+
+def get_markdown():
+    """ 每个进程只创建一次 Markdown 对象, 初始化扩展的开销比转换一篇文章还大 """
+    global markdown_parser
+    if markdown_parser is None:
+        import markdown
+        markdown_parser = markdown.Markdown(extensions=['fenced_code', 'tables', 'toc', 'sane_lists'],
+                                            extension_configs={'toc': {'slugify': slugify}})
+    markdown_parser.reset()
+    return markdown_parser
+
+
+def markdown_to_html(content):
+    """ markdown 转 html, hexo 的 pullquote 标签转成 blockquote """
+    md = get_markdown()
+    quotes = []
+
+    def hold(m):
+        quotes.append((m.group(1), m.group(2)))
+        return f"\n\nPULLQUOTE{len(quotes) - 1}\n\n"
+
+    html = md.convert(PATTERN_PULLQUOTE.sub(hold, content))
+    for index, (css, body) in enumerate(quotes):
+        md.reset()
+        html = html.replace(f"<p>PULLQUOTE{index}</p>", f'<blockquote class="{escape(css)}">{md.convert(body)}</blockquote>')
+    return html
+
+
+def render_post(template, site, page):
+    """ 生成文章页面, 返回 (html, 异常信息) """
+    try:
+        content = markdown_to_html(page['markdown'])
+        root = site['root']
+        categories = ' '.join(f'<a href="{root}/categories/{quote("/".join(page["categories"][:i + 1]))}/">{escape(c)}</a>'
+                              for i, c in enumerate(page['categories']))
+        tags = ' '.join(f'<a href="{root}/tags/{quote(tag)}/">#{escape(tag)}</a>' for tag in page['tags'])
+        return Template(template).safe_substitute(site_title=escape(site['title']), root=root, title=escape(page['title']),
+                                                  date=page['date'], categories=categories, tags=tags,
+                                                  content=content), None
+    except Exception as e:
+        return None, f"{e} trackback:{traceback.format_exc()}"
+
+
+def to_rfc822(date):
+    try:
+        return formatdate(time.mktime(time.strptime(date, '%Y-%m-%d %H:%M:%S')), localtime=True)
+    except (ValueError, OverflowError):
+        return formatdate(localtime=True)
+
+
+class SiteRenderer():
+    """
+    不经过 hexo 直接生成静态网站\n
+    文章页面按输入 hash 增量生成并在进程池中并行转换, 另外生成首页, 标签页, 分类页和 rss
+    """
+
+    def __init__(self, site_dir, template_dir, title, url, cache, executor=None, dry_run=False, output_prefix=''):
+        """ output_prefix: 输出 hash 在构建缓存中的前缀, 区分多个发布目标 """
+        self.site_dir = site_dir
+        self.template_dir = template_dir
+        self.cache = cache
+        self.executor = executor
+        self.dry_run = dry_run
+        self.prefix = output_prefix + OUTPUT_PREFIX
+        self.site = {'title': title, 'url': url.rstrip('/'), 'root': urlparse(url).path.rstrip('/')}
+        self.templates = {}
+        self.static = {}
+        for name in sorted(os.listdir(template_dir)):
+            with open(os.path.join(template_dir, name), "r", encoding='utf-8') as f:
+                if name in TEMPLATES:
+                    self.templates[name] = f.read()
+                else:
+                    self.static[name] = f.read()
+
+    def render(self, pages):
+        """
+        pages: 可迭代的 [{'name', 'url', 'title', 'date', 'categories', 'tags', 'top', 'markdown'}], 按 RENDER_BATCH 分批转换,
+        列表页只保留元数据和摘要\n
+        返回 {'added', 'updated', 'removed'}
+        """
+        writer = StagedWriter(self.site_dir, dry_run=self.dry_run)
+        base_hash = get_text_hash(json.dumps([self.templates['post.html'], self.site], ensure_ascii=False))
+        outputs = {}
+        listed = []
+        todo = []
+        rendered = 0
+        for page in pages:
+            input_hash = get_text_hash(base_hash + json.dumps(page, sort_keys=True, ensure_ascii=False))
+            outputs[page['name']] = input_hash
+            if self.cache.is_output_fresh(self.prefix + page['name'], input_hash) \
+                    and os.path.exists(os.path.join(self.site_dir, page['name'])):
+                writer.keep()
+            else:
+                todo.append(page)
+            item = {key: value for key, value in page.items() if key != 'markdown'}
+            item['summary'] = page['markdown'][:SUMMARY_SIZE]
+            listed.append(item)
+            if len(todo) >= RENDER_BATCH:
+                self.render_pages(todo, writer, outputs)
+                rendered += len(todo)
+                todo = []
+        self.render_pages(todo, writer, outputs)
+        rendered += len(todo)
+        logger.info(f"render site pages: {rendered}/{len(listed)}")
+
+        for name, content in self.gen_lists(listed).items():
+            outputs[name] = get_text_hash(content)
+            writer.put(name, content, outputs[name])
+        for name, content in self.static.items():
+            outputs[name] = get_text_hash(content)
+            writer.put(name, content, outputs[name])
+
+        for name in self.cache.get_outputs(self.prefix):
+            if name[len(self.prefix):] not in outputs:
+                writer.remove(name[len(self.prefix):])
+        changes = writer.commit()
+        if not self.dry_run:
+            for name, output_hash in outputs.items():
+                self.cache.put_output(self.prefix + name, output_hash)
+            for name in changes['removed']:
+                self.cache.remove_output(self.prefix + name)
+        return changes
+
+    def render_pages(self, todo, writer, outputs):
+        """ 转换一批文章页面, 失败的页面不记录输出 hash """
+        renderer = partial(render_post, self.templates['post.html'], self.site)
+        if self.executor is None:
+            results = map(renderer, todo)
+        else:
+            results = self.executor.map(renderer, todo, chunksize=max(1, len(todo) // 64))
+        for page, (html, error) in zip(todo, results):
+            if error is not None:
+                logger.error(f"render page failed: {page['name']} Exception:{error}")
+                outputs.pop(page['name'])
+                continue
+            writer.put(page['name'], html)
+
+    def gen_list(self, title, pages):
+        root = self.site['root']
+        items = '\n'.join(f'    <li><time>{page["date"][:10]}</time><a href="{root}{page["url"]}">{escape(page["title"])}</a></li>'
+                          for page in pages)
+        return Template(self.templates['list.html']).safe_substitute(site_title=escape(self.site['title']), root=root,
+                                                                     title=escape(title), items=items)
+
+    def gen_lists(self, pages):
+        """ 首页, 标签页, 分类页和 rss, 文章按置顶和日期排序 """
+        pages = sorted(pages, key=lambda page: (page['top'], page['date'], page['url']), reverse=True)
+        tags = {}
+        categories = {}
+        for page in pages:
+            for tag in page['tags']:
+                tags.setdefault(tag, []).append(page)
+            for i in range(len(page['categories'])):
+                categories.setdefault('/'.join(page['categories'][:i + 1]), []).append(page)
+
+        lists = {'index.html': self.gen_list(self.site['title'], pages)}
+        for tag, tag_pages in tags.items():
+            lists[f"tags/{tag}/index.html"] = self.gen_list(f"#{tag}", tag_pages)
+        for category, category_pages in categories.items():
+            lists[f"categories/{category}/index.html"] = self.gen_list(category, category_pages)
+        lists['rss.xml'] = self.gen_feed(pages)
+        return lists
+
+    def gen_feed(self, pages):
+        url = self.site['url']
+        items = []
+        for page in sorted(pages, key=lambda page: (page['date'], page['url']), reverse=True)[:FEED_SIZE]:
+            items.append(f"<item><title>{escape(page['title'])}</title>"
+                         f"<link>{escape(url + page['url'])}</link>"
+                         f"<guid>{escape(url + page['url'])}</guid>"
+                         f"<pubDate>{to_rfc822(page['date'])}</pubDate>"
+                         f"<description>{escape(page['summary'])}</description></item>")
+        return ('<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel>'
+                f"<title>{escape(self.site['title'])}</title><link>{escape(url)}/</link>"
+                f"<description>{escape(self.site['title'])}</description>"
+                + ''.join(items) + '</channel></rss>\n')
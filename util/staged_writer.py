@@ -0,0 +1,96 @@
+import os
+import shutil
+
+from util.logger import Logger
+from util.build_cache import get_file_hash, get_text_hash
+
+logger = Logger(__file__)
+
+
+class StagedWriter():
+    """
+    差异写入输出目录\n
+    新内容先写到暂存目录, 和现有文件比较 hash, 全部生成完后只对新增和修改的文件做原子替换, 未变化的文件保持修改时间不变\n
+    staging 默认为输出目录下的 .staging, 不在输出目录之外 (如导出目标的上级目录) 写文件, 并且和输出目录在同一个文件系统
+    """
+
+    def __init__(self, folder, staging=None, dry_run=False):
+        if staging is None:
+            staging = os.path.join(folder, '.staging')
+        self.folder = folder
+        self.staging = staging
+        self.dry_run = dry_run
+        self.added = []
+        self.updated = []
+        self.removed = []
+        self.unchanged = 0
+        self.hashes = {}
+        if not dry_run:
+            # 上次中断留下的暂存文件
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+            os.makedirs(folder, exist_ok=True)
+            os.makedirs(staging, exist_ok=True)
+
+    def put(self, name, content, content_hash=None):
+        """ 暂存一个文件, 返回 'add', 'update' 或 None (内容未变化) """
+        if content_hash is None:
+            content_hash = get_text_hash(content)
+        self.hashes[name] = content_hash
+        path = os.path.join(self.folder, name)
+        if not os.path.exists(path):
+            self.added.append(name)
+            change = 'add'
+        elif get_file_hash(path) != content_hash:
+            self.updated.append(name)
+            change = 'update'
+        else:
+            self.unchanged += 1
+            return None
+        if not self.dry_run:
+            staging_path = os.path.join(self.staging, name)
+            os.makedirs(os.path.dirname(staging_path), exist_ok=True)
+            with open(staging_path, "w", encoding="utf-8", newline='') as f:
+                f.write(content)
+        return change
+
+    def keep(self):
+        """ 记录一个已知未变化的文件 """
+        self.unchanged += 1
+
+    def remove(self, name):
+        self.removed.append(name)
+
+    def remove_empty_dirs(self, path):
+        """ 删除文件后向上清理空目录 """
+        folder = os.path.realpath(self.folder)
+        while os.path.realpath(path).startswith(folder + os.sep):
+            try:
+                os.rmdir(path)
+            except OSError:
+                return
+            path = os.path.dirname(path)
+
+    def get_changes(self):
+        return {'added': self.added, 'updated': self.updated, 'removed': self.removed}
+
+    def commit(self):
+        """ 应用暂存的修改, 返回 {'added', 'updated', 'removed'} """
+        if not self.dry_run:
+            for name in self.added + self.updated:
+                path = os.path.join(self.folder, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(os.path.join(self.staging, name), path)
+            for name in self.removed:
+                path = os.path.join(self.folder, name)
+                if os.path.exists(path):
+                    os.remove(path)
+                self.remove_empty_dirs(os.path.dirname(path))
+            shutil.rmtree(self.staging, ignore_errors=True)
+        prefix = "dry run, " if self.dry_run else ""
+        logger.info(f"{prefix}{self.folder}: added {len(self.added)} updated {len(self.updated)} "
+                    f"removed {len(self.removed)} unchanged {self.unchanged}")
+        for change, names in self.get_changes().items():
+            for name in names:
+                logger.info("%s%s: %s", prefix, change, name)
+        return self.get_changes()
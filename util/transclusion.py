@@ -0,0 +1,188 @@
+import re
+
+from util.logger import Logger
+from util.link_resolver import split_link, normalize_heading, PATTERN_HEADING
+from util.markdown import PATTERN_FENCE, render_spans
+
+logger = Logger(__file__)
+
+# 嵌入的最大层数, 超过后改为链接
+MAX_DEPTH = 5
+PATTERN_BLOCK_ID = re.compile(r'[ \t]+\^([\w-]+)[ \t]*$', re.M)
+
+
+def find_heading_section(content, heading):
+    """ 返回标题所在段落的 (开始, 结束) 位置, 包含标题本身, 到同级或更高级的下一个标题为止 """
+    heading = normalize_heading(heading)
+    start = None
+    level = 0
+    fence = None
+    pos = 0
+    for line in content.split('\n'):
+        line_end = pos + len(line) + 1
+        m = PATTERN_FENCE.match(line)
+        if fence is not None:
+            if m is not None and m.group(1)[0] == fence[0]:
+                fence = None
+        elif m is not None:
+            fence = m.group(1)
+        else:
+            h = PATTERN_HEADING.match(line)
+            if h is not None:
+                line_level = len(line) - len(line.lstrip('#'))
+                if start is not None and line_level <= level:
+                    return start, pos
+                if start is None and normalize_heading(h.group(1)) == heading:
+                    start = pos
+                    level = line_level
+        pos = line_end
+    if start is None:
+        return None
+    return start, len(content)
+
+
+def find_block(content, block_id):
+    """ 返回 ^block_id 所在段落的 (开始, 结束, 标记开始, 标记结束) """
+    for m in PATTERN_BLOCK_ID.finditer(content):
+        if m.group(1) != block_id:
+            continue
+        start = content.rfind('\n\n', 0, m.start())
+        start = 0 if start < 0 else start + 2
+        end = content.find('\n\n', m.end())
+        end = len(content) if end < 0 else end
+        return start, end, m.start(), m.end()
+    return None
+
+
+class Transcluder():
+    """
+    生成笔记正文\n
+    双链替换为文章链接, ![[note]] 和 ![[note#标题]] ![[note#^块]] 展开为被嵌入笔记的内容\n
+    展开结果按 (笔记, 段落) 缓存, 同一个片段被多篇文章嵌入时只生成一次; 循环嵌入或超过 MAX_DEPTH 层时改为链接
+    """
+
+    def __init__(self, resolver, get_link_path, max_depth=MAX_DEPTH):
+        self.resolver = resolver
+        self.get_link_path = get_link_path
+        self.max_depth = max_depth
+        self.link_paths = {}
+        self.fragments = {}
+
+    def get_links(self, note):
+        """ 返回 ({双链: 文章链接}, [(目标路径, 标题)]) """
+        result = self.link_paths.get(note.file_path)
+        if result is not None:
+            return result
+        links = []
+        link_paths = {}
+        for link in note.links:
+            link_note = self.resolver.resolve(link, note)
+            if link_note is not None:
+                heading = split_link(link)[1]
+                if heading is not None and not self.resolver.has_heading(link_note, heading):
+                    logger.warning(f"heading not found: [[{link}]] in {note.file_path}")
+                link_paths[link] = self.get_link_path(link_note, heading)
+                links.append((link_note.file_path, heading))
+        result = link_paths, links
+        self.link_paths[note.file_path] = result
+        return result
+
+    def forget(self, path):
+        """ 丢弃笔记的链接缓存, 流式生成时用完即释放 """
+        self.link_paths.pop(path, None)
+
+    def render(self, note):
+        """ 返回 (正文, 依赖的笔记路径, 嵌入片段中的图片和附件) """
+        replacements, complete, depends, assets = self.expand(note, 0, len(note.content), (note.file_path,))
+        return render_spans(note.content, replacements), depends, assets
+
+    def get_fragment(self, note, section, stack):
+        """
+        返回 (片段, 是否完整展开, 依赖的笔记路径, 图片和附件), 找不到段落时返回 None\n
+        因为循环或层数限制没有完整展开的片段和所在的嵌入链有关, 不缓存
+        """
+        key = (note.file_path, section)
+        fragment = self.fragments.get(key)
+        # 缓存的片段包含嵌入链上的笔记时按当前的嵌入链重新展开, 保证结果和展开顺序无关
+        if fragment is not None and fragment[2].isdisjoint(stack):
+            return fragment
+        # 流式生成时已经释放正文的笔记重新读取, 展开后再释放
+        released = note.is_parsed and note.content is None
+        if released:
+            note.restore()
+        elif not note.is_parsed:
+            note.parse()
+        try:
+            fragment = self.build_fragment(note, section, stack)
+        finally:
+            if released:
+                note.release()
+        if fragment is not None and fragment[1]:
+            self.fragments[key] = fragment
+        return fragment
+
+    def build_fragment(self, note, section, stack):
+        """ 展开笔记中的段落, 返回值和 get_fragment 相同 """
+        content = note.content
+        start, end = 0, len(content)
+        mark = []
+        if section and section.startswith('^'):
+            block = find_block(content, section[1:])
+            if block is None:
+                return None
+            start, end, mark_start, mark_end = block
+            mark.append((mark_start, mark_end, ''))
+        elif section:
+            heading = find_heading_section(content, section)
+            if heading is None:
+                return None
+            start, end = heading
+
+        replacements, complete, depends, assets = self.expand(note, start, end, stack)
+        text = render_spans(content, replacements + mark, start, end).strip('\n')
+        for img in note.images:
+            if f"(/images/{img})" in text:
+                assets.add(('images', img))
+        for file in note.files:
+            if f"(/download/{file})" in text:
+                assets.add(('download', file))
+        return text, complete, frozenset(depends), frozenset(assets)
+
+    def expand(self, note, start, end, stack):
+        """ 返回 content[start:end] 的 (替换列表, 是否完整展开, 依赖的笔记路径, 图片和附件) """
+        link_paths, links = self.get_links(note)
+        replacements = []
+        for link, (link_start, link_end) in zip(note.links, note.link_spans):
+            if link in link_paths:
+                replacements.append((link_start, link_end, link_paths[link]))
+
+        complete = True
+        depends = set()
+        assets = set()
+        for embed, (embed_start, embed_end) in zip(note.embeds, note.embed_spans):
+            if embed_start < start or embed_end > end:
+                continue
+            target = self.resolver.resolve(embed, note)
+            if target is None:
+                continue
+            target_section = split_link(embed)[1]
+            if target.file_path in stack or len(stack) > self.max_depth:
+                logger.warning(f"embed cycle or too deep: ![[{embed}]] in {note.file_path}, use link instead")
+                replacements.append((embed_start, embed_end, self.get_link_path(target, target_section)))
+                complete = False
+                continue
+            depends.add(target.file_path)
+            fragment = self.get_fragment(target, target_section, stack + (target.file_path,))
+            if fragment is None:
+                logger.warning(f"embed section not found: ![[{embed}]] in {note.file_path}")
+                replacements.append((embed_start, embed_end, self.get_link_path(target, target_section)))
+                continue
+            text, target_complete, target_depends, target_assets = fragment
+            complete = complete and target_complete
+            depends |= target_depends
+            assets |= target_assets
+            if '\n' in text and embed_start > 0 and note.content[embed_start - 1] != '\n':
+                # 多行片段从新的一行开始, 避免标题和列表接在正文后面
+                text = '\n' + text
+            replacements.append((embed_start, embed_end, text))
+        return replacements, complete, depends, assets
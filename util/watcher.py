@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+
+from util.logger import Logger
+
+logger = Logger(__file__)
+
+IGNORE_DIRS = {'.git', '.trash'}
+
+
+class Watcher():
+    """
+    监听目录变化并合并短时间内的连续修改\n
+    安装了 watchdog 时使用系统通知 (linux inotify, windows ReadDirectoryChangesW), 否则轮询目录
+    """
+
+    def __init__(self, paths, debounce=2.0, poll_interval=2.0):
+        self.paths = paths
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.changes = set()
+        self.last_event = 0
+        self.condition = threading.Condition()
+        self.observer = None
+        self.poll_thread = None
+        self.running = False
+
+    def is_ignored(self, path):
+        parts = path.replace('\\', '/').split('/')
+        return any(part in IGNORE_DIRS for part in parts)
+
+    def notify(self, path):
+        if self.is_ignored(path):
+            return
+        with self.condition:
+            self.changes.add(path)
+            self.last_event = time.time()
+            self.condition.notify_all()
+
+    def start(self):
+        self.running = True
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            logger.info("watchdog not installed, watch by polling")
+            self.poll_thread = threading.Thread(target=self.poll, daemon=True)
+            self.poll_thread.start()
+            return self
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                watcher.notify(event.src_path)
+                dest_path = getattr(event, 'dest_path', None)
+                if dest_path:
+                    watcher.notify(dest_path)
+
+        self.observer = Observer()
+        for path in self.paths:
+            self.observer.schedule(Handler(), path, recursive=True)
+        self.observer.start()
+        logger.info(f"watch by {type(self.observer).__name__}: {self.paths}")
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+    def snapshot(self):
+        """ 遍历目录获取 path -> (mtime, size) """
+        files = {}
+        stack = list(self.paths)
+        while stack:
+            path = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in IGNORE_DIRS:
+                                stack.append(entry.path)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+        return files
+
+    def poll(self):
+        files = self.snapshot()
+        while self.running:
+            time.sleep(self.poll_interval)
+            current = self.snapshot()
+            for path, signature in current.items():
+                if files.get(path) != signature:
+                    self.notify(path)
+            for path in files.keys() - current.keys():
+                self.notify(path)
+            files = current
+
+    def wait(self, timeout=None):
+        """ 等待一批修改, 最后一次修改后 debounce 秒内没有新的修改才返回; 超时返回空集合 """
+        with self.condition:
+            if not self.changes:
+                self.condition.wait(timeout)
+            if not self.changes:
+                return set()
+            while True:
+                remain = self.last_event + self.debounce - time.time()
+                if remain <= 0:
+                    break
+                self.condition.wait(remain)
+            changes = self.changes
+            self.changes = set()
+            return changes